@@ -0,0 +1,127 @@
+"""
+Copyright© 2024 Evert van de Waal
+
+This file is part of dsmgen.
+
+Dsmgen is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+Dsmgen is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Foobar; if not, write to the Free Software
+Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+import math
+from typing import List, Tuple, Optional, Sequence
+from point import Point
+from square_routing import routeSquare
+from orthogonal_routing import ObstacleGraph
+
+# NumPy is used when it is available, e.g. on the server. In the browser, the plain Python version is used.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+Polyline = List[Tuple[float, float]]
+
+
+def getIntersection(pos: Point, size: Point, b: Point) -> Point:
+    """ Return the point where a line from the center of a rectangle towards `b` crosses its outline. """
+    halfsize = size/2
+    a = pos + halfsize
+    delta = b - a
+    if abs(delta.x) > 1:
+        rc = delta.y / delta.x
+        i_left = Point(math.copysign(halfsize.x, delta.x), math.copysign(rc*halfsize.x, delta.y))
+        if abs(i_left.y) < halfsize.y:
+            return i_left + a
+    rc = delta.x / delta.y
+    i_top = Point(math.copysign(rc*halfsize.y, delta.x), math.copysign(halfsize.y, delta.y))
+    return i_top + a
+
+
+def routeCenterToCenter(start_block, finish_block, waypoints) -> List[Point]:
+    """ A straight line between the centers of two blocks, through the waypoints.
+        The blocks are given as (pos, size) like for `routeSquare`.
+        The line starts and ends at the outlines of the blocks.
+    """
+    c_a = start_block[0] + start_block[1]/2
+    c_b = finish_block[0] + finish_block[1]/2
+    i_a = getIntersection(start_block[0], start_block[1], c_b if not waypoints else waypoints[0])
+    i_b = getIntersection(finish_block[0], finish_block[1], c_a if not waypoints else waypoints[-1])
+    return [i_a] + list(waypoints) + [i_b]
+
+
+def routeCenterToCenterArrays(starts, finishes) -> Tuple:
+    """ Vectorised version of `routeCenterToCenter` for connections without waypoints.
+        `starts` and `finishes` are NumPy arrays with a row (x, y, width, height) for each connection.
+        Returns two arrays with the (x, y) of the start and end points.
+    """
+    def intersections(rects, targets):
+        half = rects[:, 2:4] / 2
+        a = rects[:, 0:2] + half
+        delta = targets - a
+        dx, dy = delta[:, 0], delta[:, 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rc_x = dy / dx
+            rc_y = dx / dy
+        left = np.stack([np.copysign(half[:, 0], dx), np.copysign(rc_x*half[:, 0], dy)], axis=1)
+        top = np.stack([np.copysign(rc_y*half[:, 1], dx), np.copysign(half[:, 1], dy)], axis=1)
+        use_left = (np.abs(dx) > 1) & (np.abs(left[:, 1]) < half[:, 1])
+        return np.where(use_left[:, None], left, top) + a
+
+    c_a = starts[:, 0:2] + starts[:, 2:4] / 2
+    c_b = finishes[:, 0:2] + finishes[:, 2:4] / 2
+    return intersections(starts, c_b), intersections(finishes, c_a)
+
+
+def routeAll(blocks, connections, method: str = 'square',
+             waypoints: Optional[Sequence[List[Point]]] = None) -> List[Polyline]:
+    """ Route a number of connections in one call.
+
+        `blocks` holds a row (x, y, width, height) for each block, `connections` holds a row
+        (start index, finish index) for each connection. Both can be NumPy arrays or lists.
+        `waypoints` optionally holds a list of waypoints for each connection, as used in the client.
+        `method` is the name of the routing method, as in the `routing_method` style of a connection.
+
+        Returns a list of points (x, y) for each connection.
+    """
+    if hasattr(blocks, 'tolist'):
+        blocks = blocks.tolist()
+    if hasattr(connections, 'tolist'):
+        connections = connections.tolist()
+    waypoints = waypoints or [[] for _ in connections]
+
+    if method == 'center2center' and np is not None and connections and not any(waypoints):
+        rects = np.asarray(blocks, dtype=float)
+        indices = np.asarray(connections, dtype=int)
+        starts, ends = routeCenterToCenterArrays(rects[indices[:, 0]], rects[indices[:, 1]])
+        return [[tuple(s), tuple(e)] for s, e in zip(starts.tolist(), ends.tolist())]
+
+    def asBlock(i):
+        x, y, w, h = blocks[i]
+        return Point(x, y), Point(w, h)
+
+    if method == 'orthogonal':
+        graph = ObstacleGraph()
+        graph.update((i, tuple(b)) for i, b in enumerate(blocks))
+        results = []
+        for key, ((a, b), wps) in enumerate(zip(connections, waypoints)):
+            if wps:
+                points = routeSquare(asBlock(a), asBlock(b), wps)
+            else:
+                points = graph.route(key, tuple(blocks[a]), tuple(blocks[b]))
+            results.append([p.astuple() for p in points])
+        return results
+
+    router = routeCenterToCenter if method == 'center2center' else routeSquare
+    return [[p.astuple() for p in router(asBlock(a), asBlock(b), wps)]
+            for (a, b), wps in zip(connections, waypoints)]
@@ -28,12 +28,13 @@ from browser import console
 import logging
 from enum import Enum, IntEnum, auto
 import json
-from dataclasses import dataclass, is_dataclass, fields, field
+from dataclasses import dataclass, is_dataclass, field
 from typing import Dict, Callable, List, Any, Iterable, Tuple, Optional, Type, Protocol
 from dispatcher import EventDispatcher
+from instrumentation import profiler
 from math import inf         # Do not delete: used when evaluating waypoint strings
 from contextlib import contextmanager
-from storable_element import StorableElement, Collection, ReprCategory
+from storable_element import StorableElement, Collection, ReprCategory, field_names
 from browser import ajax, alert
 
 class parameter_spec(dict):
@@ -91,7 +92,7 @@ class ExtendibleJsonEncoder(json.JSONEncoder):
         elif hasattr(o, '__json__'):
             return o.__json__()
         elif is_dataclass(o):
-            result = {k.name: o.__dict__[k.name] for k in fields(o)}
+            result = {k: o.__dict__[k] for k in field_names(o)}
             result['__classname__'] = type(o).__name__
             return result
         elif isinstance(o, Enum):
@@ -111,7 +112,7 @@ class JsonResponse:
 
 
 def dc_from_dict(cls, ddict):
-    keys = [f.name for f in fields(cls)]
+    keys = field_names(cls)
     arguments = {k: v for k, v in ddict.items() if k in keys}
     return cls(**arguments)
 
@@ -144,6 +145,7 @@ class DataStore(EventDispatcher):
             if o.repr_category() == ReprCategory.block:
                 return getattr(o, 'ports', [])
 
+    @profiler.timed('add', 'datastore')
     def add(self, record: StorableElement, redo=False) -> StorableElement:
         """ Persist a simple element, without any considerations for dependencies. """
         params = {}
@@ -207,13 +209,11 @@ class DataStore(EventDispatcher):
                     self.update_data(parent_block)
         return record
 
-    def update(self, record: StorableElement):
+    def changed_values(self, record: StorableElement) -> Optional[Any]:
+        """ Return what needs to be sent to the server to store a record, or None if it was not changed.
+            For a representation, changes to its model item are stored first.
+        """
         collection = record.get_collection()
-
-        def on_complete(update):
-            if update.status < 300:
-                assert self.update_cache(record) is record
-
         if model := record.get_model_details():
             # A representation is a merging of two separate entities. Treat them separately.
             org_repr = self.shadow_copy[collection][record.Id]
@@ -224,21 +224,52 @@ class DataStore(EventDispatcher):
             changed = any(getattr(org_repr, k) != v for k, v in repr.items() if hasattr(org_repr, k) and k not in ['ports', 'model_entity', '__classname__'])
             if collection == Collection.relation_repr:
                 changed = changed or org_repr.waypoints != record.get_waypoints()
-            if changed:
-                data = json.dumps(repr, cls=ExtendibleJsonEncoder)
-                ajax.post(f'{self.configuration.base_url}/{record.get_db_table()}/{record.Id}', blocking=True, data=data,
-                          oncomplete=on_complete, mode='json', headers={"Content-Type": "application/json"})
-                self.update_data(record)
+            return repr if changed else None
 
-        else:
-            # Handle non-representations
-            original = self.shadow_copy[collection][record.Id]
-            if record != original:
-                data = json.dumps(record, cls=ExtendibleJsonEncoder)
-                ajax.post(f'{self.configuration.base_url}/{record.get_db_table()}/{record.Id}', blocking=True,
-                          data=data, oncomplete=on_complete, mode='json', headers={"Content-Type": "application/json"})
+        # Handle non-representations
+        original = self.shadow_copy[collection][record.Id]
+        return record if record != original else None
+
+    @profiler.timed('update', 'datastore')
+    def update(self, record: StorableElement):
+        def on_complete(update):
+            if update.status < 300:
+                assert self.update_cache(record) is record
+
+        if (values := self.changed_values(record)) is not None:
+            data = json.dumps(values, cls=ExtendibleJsonEncoder)
+            ajax.post(f'{self.configuration.base_url}/{record.get_db_table()}/{record.Id}', blocking=True, data=data,
+                      oncomplete=on_complete, mode='json', headers={"Content-Type": "application/json"})
+            self.update_data(record)
+
+    @profiler.timed('update_all', 'datastore')
+    def update_all(self, records: List[StorableElement]):
+        """ Store the changes to several records, with a single request for all changed records in a table. """
+        by_table: Dict[str, List[Tuple[StorableElement, Any]]] = {}
+        for record in records:
+            if (values := self.changed_values(record)) is not None:
+                by_table.setdefault(record.get_db_table(), []).append((record, values))
+
+        for table, changes in by_table.items():
+            if len(changes) == 1:
+                record, values = changes[0]
+                url = f'{self.configuration.base_url}/{table}/{record.Id}'
+                data = json.dumps(values, cls=ExtendibleJsonEncoder)
+            else:
+                url = f'{self.configuration.base_url}/{table}/bulk'
+                data = json.dumps([values for _, values in changes], cls=ExtendibleJsonEncoder)
+
+            def on_complete(update, changes=changes):
+                if update.status < 300:
+                    for record, _ in changes:
+                        assert self.update_cache(record) is record
+
+            ajax.post(url, blocking=True, data=data, oncomplete=on_complete, mode='json',
+                      headers={"Content-Type": "application/json"})
+            for record, _ in changes:
                 self.update_data(record)
 
+    @profiler.timed('delete', 'datastore')
     def delete(self, record: StorableElement) -> bool:
         """ Returns true if the deletion is successful. """
         collection = record.get_collection()
@@ -284,7 +315,10 @@ class DataStore(EventDispatcher):
         raise NotImplementedError()
 
     def get_hierarchy(self, cb: Callable):
+        requested = profiler.now()
+        @profiler.timed('load hierarchy', 'datastore')
         def on_data(data: JsonResponse):
+            profiler.enabled and profiler.record('ajax hierarchy', 'ajax', requested, profiler.now() - requested)
             if data.status >= 400:
                 # A problem occurred loading the data
                 alert("Could not load data")
@@ -311,7 +345,10 @@ class DataStore(EventDispatcher):
             For the diagram, these are combined in one.
         """
 
+        requested = profiler.now()
+        @profiler.timed('load diagram', 'datastore')
         def on_data(response: JsonResponse):
+            profiler.enabled and profiler.record('ajax diagram_contents', 'ajax', requested, profiler.now() - requested)
             if response.status >= 200 and response.status < 300:
                 records = []
                 # Reconstruct the entities the diagram refers to and cache them
@@ -370,6 +407,7 @@ class DataStore(EventDispatcher):
 
         ajax.get(f'/data/diagram_contents/{diagram_id}', mode='json', oncomplete=on_data)
 
+    @profiler.timed('create_representation', 'datastore')
     def create_representation(self, block_cls, block_id, drop_details) -> StorableElement:
         result = None
         def on_complete(update: JsonResponse):
@@ -389,6 +427,7 @@ class DataStore(EventDispatcher):
                         data=data, oncomplete=on_complete, mode='json', headers={"Content-Type": "application/json"})
         return result
 
+    @profiler.timed('decode_representation', 'datastore')
     def decode_representation(self, data: dict) -> StorableElement:
         """ Create a representation object out of a data dictionary """
         model_cls = self.all_classes[data['_entity']['__classname__']]
@@ -435,6 +474,7 @@ class DataStore(EventDispatcher):
         collection = record.get_collection()
         return record.Id in self.live_instances[collection]
 
+    @profiler.timed('update_cache', 'datastore')
     def update_cache(self, records: List[StorableElement] | StorableElement):
         if isinstance(records, Iterable):
             return [self.update_cache(record) for record in records]
@@ -451,8 +491,8 @@ class DataStore(EventDispatcher):
                     return record
                 # Update the existing record
                 live_instance = collection_records[record.Id]
-                for f in record.fields():
-                    setattr(live_instance, f.name, getattr(record, f.name))
+                for name in field_names(record):
+                    setattr(live_instance, name, getattr(record, name))
                 return live_instance
 
             self.live_instances[collection][record.Id] = record
@@ -478,19 +518,11 @@ class DataStore(EventDispatcher):
         if instance_representation is None or not instance_representation.is_instance_of():
             return None
         definition = self.get(Collection.block, instance_representation.get_definition())
-        param_fields = [f for f in fields(definition) if f.type == parameter_spec]
-        names = []
-        types = []
-        values = []
-        for p in param_fields:
-            spec = getattr(definition, p.name)
-            if isinstance(spec, str):
-                type_lu = {'int': int, 'str': str, 'float': float}
-                spec = {k.strip():type_lu[v.strip()] for k,v in [part.split(':') for part in spec.split(',')]}
-            for k, t in spec.items():
-                names.append(k)
-                types.append(t)
-                values.append(getattr(instance_representation, k, ''))
+        # The generated model classes parse their parameter specification, see `get_parameter_specs`.
+        spec = definition.get_parameter_specs() if definition.get_parameter_spec_fields() else {}
+        names = list(spec.keys())
+        types = list(spec.values())
+        values = [getattr(instance_representation, k, '') for k in names]
         return names, types, values
 
 
@@ -607,6 +639,11 @@ class UndoableDataStore(DataStore):
             result = super().update(record)
         return result
 
+    def update_all(self, records: List[StorableElement]):
+        with self.action_recorder() as actions:
+            actions.extend(UpdateAction(r, self.get_shadow_copy(r)) for r in records)
+            super().update_all(records)
+
     def delete(self, record: StorableElement):
         with self.action_recorder() as actions:
             result = super().delete(record)
@@ -24,15 +24,19 @@ from browser import document, svg, console, window, bind, html, DOMNode
 from browser.widgets.dialog import Dialog, InfoDialog
 
 
-from typing import Any, Self, List, Dict, Type, Optional
+from typing import Any, Self, List, Dict, Type, Optional, Callable
 from dataclasses import dataclass, field, asdict, is_dataclass, fields
 from weakref import ref
 import enum
 from math import inf
 import json
 from point import Point
-from shapes import (Shape, CP, Relationship, getMousePos, Orientations, OwnerInterface, handle_class)
+from shapes import (Shape, CP, Relationship, getMousePos, Orientations, OwnerInterface, handle_class, obstacleRect)
 from data_store import DataStore, ExtendibleJsonEncoder, ReprCategory
+from spatial_index import SpatialIndex
+from frame_scheduler import FrameScheduler
+from viewport import Viewport
+from instrumentation import profiler
 import svg_shapes
 
 
@@ -85,8 +89,8 @@ def moveAll(widget, decorators) -> None:
     for o in Orientations:
         moveSingleHandle(decorators, widget, o)
 
-def mk_scrollable(canvas: DOMNode):
-    """ Make an SVG widget scrollable. """
+def mk_scrollable(canvas: DOMNode, on_change: Optional[Callable[[], None]] = None):
+    """ Make an SVG widget scrollable. `on_change` is called after the visible area has changed. """
     @bind(canvas, 'wheel')
     def scroll_wheel(ev):
         ev.preventDefault()
@@ -106,6 +110,8 @@ def mk_scrollable(canvas: DOMNode):
             factor = values[3] * ev.deltaY / 132 / 20
             values[1] += factor
         canvas.attrs['viewBox'] = ' '.join(str(v) for v in values)
+        if on_change:
+            on_change()
 
 
 class BehaviourFSM:
@@ -188,6 +194,8 @@ class ResizeFSM(BehaviourFSM):
             _ = self.diagram.canvas <= self.selection_area
 
     def onMouseUp(self, diagram, ev) -> None:
+        # Ensure the last mouse movements are applied before the result is stored.
+        self.diagram.frame_scheduler.flush()
         if self.state == ResizeStates.AREA_SELECT:
             if not (ev.ctrlKey or ev.shiftKey):
                 self.unselect()
@@ -198,7 +206,10 @@ class ResizeFSM(BehaviourFSM):
             minx, maxx = min(xs), max(xs)
             miny, maxy = min(ys), max(ys)
 
-            for w in self.diagram.children:
+            for w in self.diagram.getChildrenIn(minx, miny, maxx, maxy):
+                if w.shape is None:
+                    # Not drawn, e.g. shown as placeholder when zoomed out.
+                    continue
                 if w.x < minx or w.y < miny or w.x+w.width > maxx or w.y+w.height >  maxy:
                     continue
                 if w in self.selection:
@@ -240,8 +251,7 @@ class ResizeFSM(BehaviourFSM):
             self.onDrag(self.initial_pos[0], self.initial_size, delta)
         if self.state == ResizeStates.MOVING:
             for widget, initial_pos in zip(self.selection, self.initial_pos):
-                widget.setPos(initial_pos + delta)
-                diagram.rerouteConnections(widget)
+                diagram.frame_scheduler.moveBlock(widget, initial_pos + delta)
 
     def delete(self, diagram) -> None:
         """ Called when the FSM is about to be deleted"""
@@ -318,7 +328,7 @@ class ResizeFSM(BehaviourFSM):
         shape.setSize(resizement)
 
         moveHandles(self.decorators, shape, self.dragged_handle)
-        self.diagram.rerouteConnections(shape)
+        self.diagram.frame_scheduler.rerouteShape(shape)
 
     def onKeyDown(self, diagram, ev) -> None:
         if ev.key == 'Delete':
@@ -412,6 +422,7 @@ class RerouteStates(BehaviourFSM):
             self.widget.waypoints[self.dragged_index] = Point(x=inf, y=new_pos.y)
 
     def onMouseUp(self, diagram, ev) -> None:
+        self.diagram.frame_scheduler.flush()
         if self.state in [self.States.POTENTIAL_DRAG, self.States.DRAGGING]:
             self.widget.router.dragEnd(self.diagram.canvas)
             if self.state == self.States.DRAGGING:
@@ -431,7 +442,7 @@ class RerouteStates(BehaviourFSM):
                 self.state = self.States.DRAGGING
         if self.state == self.States.DRAGGING:
             self.widget.router.dragHandle(pos)
-            diagram.rerouteConnections(self.widget)
+            diagram.frame_scheduler.rerouteConnection(self.widget)
 
     def onKeyDown(self, diagram, ev) -> None:
         if ev.key == 'Delete':
@@ -486,6 +497,7 @@ class ConnectionEditor(BehaviourFSM):
                             self.connection.start = party
                         case ConnectionRoles.FINISH:
                             self.connection.finish = party
+                    diagram.updateConnectionIndex(self.connection)
                     diagram.reroute(self.connection)
 
                 self.path.remove()
@@ -554,6 +566,16 @@ class Diagram(OwnerInterface):
         self.config: DiagramConfiguration = config
         self.diagram_id: int = 0
         self.canvas: Optional[DOMNode] = None  # The SVG element in which the diagram is drawn.
+        # Lookup structures to quickly find blocks by location, and the connections to a block.
+        self.block_index = SpatialIndex()
+        self.connections_by_shape: Dict[int, List[Relationship]] = {}
+        self.connection_ends: Dict[int, List[Any]] = {}
+        # Created when the first connection is routed around the blocks in this diagram.
+        self.obstacle_graph = None
+        # Changes made while dragging are applied once per animation frame.
+        self.frame_scheduler = FrameScheduler(self)
+        # In large diagrams, only the elements in view are drawn.
+        self.viewport = Viewport(self)
 
     def get_representation_category(self, block_cls) -> ReprCategory:
         return ReprCategory.block
@@ -563,6 +585,11 @@ class Diagram(OwnerInterface):
         # Release the resources of this diagram and delete references to it.
         self.children = []
         self.connections = []
+        self.block_index.clear()
+        self.connections_by_shape = {}
+        self.connection_ends = {}
+        self.obstacle_graph = None
+        self.viewport.clear()
         if self in diagrams:
             diagrams.remove(self)
 
@@ -601,30 +628,84 @@ class Diagram(OwnerInterface):
         """ Called to allow a new block to be located by the diagram. For example snapping. """
         pass
 
+    @profiler.timed('addBlock', 'diagram')
     def addBlock(self, block: Shape) -> None:
         if self.mouse_events_fsm is not None:
             self.mouse_events_fsm.delete(self)
 
         block.create(self)
-        self.children.append(block)
-
+        self.attachChild(block)
+
+    def attachChild(self, widget) -> None:
+        super().attachChild(widget)
+        self.block_index.add(widget)
+        if self.obstacle_graph:
+            self.obstacle_graph.place(id(widget), obstacleRect(widget))
+
+    def detachChild(self, widget) -> None:
+        super().detachChild(widget)
+        self.block_index.remove(widget)
+        self.viewport.forget(widget)
+        if self.obstacle_graph:
+            self.obstacle_graph.discard(id(widget))
+
+    def childGeometryChanged(self, widget) -> None:
+        self.block_index.update(widget)
+        self.viewport.geometryChanged(widget)
+        if self.obstacle_graph:
+            self.obstacle_graph.place(id(widget), obstacleRect(widget))
+
+    def getChildrenAt(self, pos: Point) -> List[Shape]:
+        return self.block_index.queryPoint(pos)
+
+    def getChildrenIn(self, minx, miny, maxx, maxy) -> List[Shape]:
+        """ Return the blocks that overlap an area. """
+        return self.block_index.query(minx, miny, maxx, maxy)
+
+    @profiler.timed('addConnection', 'diagram')
     def addConnection(self, connection: Relationship) -> None:
         """ Handle a completed connection and add it to the diagram. """
         self.connections.append(connection)
+        self.indexConnection(connection)
         connection.create(self, self.children)
 
     def deleteConnection(self, connection: Relationship) -> None:
         if connection in self.connections:
             connection.delete()
             self.connections.remove(connection)
-
+            self.unindexConnection(connection)
+            self.viewport.forget(connection)
+            if self.obstacle_graph:
+                self.obstacle_graph.forget(id(connection))
+
+    def indexConnection(self, connection: Relationship) -> None:
+        """ Register a connection with the shapes (or ports) at its ends. """
+        ends = [e for e in [connection.start, connection.finish] if e is not None]
+        if len(ends) == 2 and ends[0] is ends[1]:
+            ends = ends[:1]
+        for end in ends:
+            self.connections_by_shape.setdefault(id(end), []).append(connection)
+        self.connection_ends[id(connection)] = ends
+
+    def unindexConnection(self, connection: Relationship) -> None:
+        for end in self.connection_ends.pop(id(connection), []):
+            connections = [c for c in self.connections_by_shape.get(id(end), []) if c is not connection]
+            self.connections_by_shape[id(end)] = connections
+            if not connections:
+                self.connections_by_shape.pop(id(end), None)
+
+    def updateConnectionIndex(self, connection: Relationship) -> None:
+        """ Call this when the start or finish of a connection was changed. """
+        self.unindexConnection(connection)
+        self.indexConnection(connection)
+
+    @profiler.timed('deleteBlock', 'diagram')
     def deleteBlock(self, block: Shape) -> None:
         block.delete()
-        if block.repr_category() == ReprCategory.block:
+        if block.repr_category() in [ReprCategory.block, ReprCategory.laned_block, ReprCategory.laned_instance]:
             # Remove the block from the diagram's list of children
             if owner := block.owner():
-                if block in owner.children:
-                    owner.children.remove(block)
+                owner.detachChild(block)
         elif block.repr_category() == ReprCategory.message:
             # Remove the message from the relationship's list of messages
             for c in self.connections:
@@ -654,18 +735,26 @@ class Diagram(OwnerInterface):
         self.mouse_events_fsm = fsm
 
     def getConnectionsToShape(self, widget) -> List[Relationship]:
-        result = [c for c in self.connections if widget.isConnected(c.start) or widget.isConnected(c.finish)]
-        return result
-
+        # A connection can be made to the shape itself or to one of its ports.
+        result = {}
+        for end in [widget] + list(getattr(widget, 'ports', [])):
+            for c in self.connections_by_shape.get(id(end), []):
+                result[id(c)] = c
+        return list(result.values())
+
+    @profiler.timed('rerouteConnections', 'diagram')
     def rerouteConnections(self, widget) -> None:
         if isinstance(widget, Relationship):
-            widget.reroute(self.children)
+            connections = [widget]
         else:
-            for c in self.getConnectionsToShape(widget):
+            connections = self.getConnectionsToShape(widget)
+        for c in connections:
+            # Connections that are not drawn yet are routed when they are scrolled into view.
+            if not self.viewport.isDeferred(c):
                 c.reroute(self.children)
 
     def bind(self, canvas) -> None:
-        mk_scrollable(canvas)
+        mk_scrollable(canvas, self.viewport.update)
         self.canvas = canvas
         canvas.bind('click', self.onClick)
         canvas.bind('mouseup', self.onMouseUp)
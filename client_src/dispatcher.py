@@ -21,6 +21,7 @@ from dataclasses import dataclass
 from typing import Callable, Any, Dict, Optional, List
 from fnmatch import fnmatch
 from browser import console
+from instrumentation import profiler
 
 @dataclass
 class EventSubscription:
@@ -37,6 +38,13 @@ class EventDispatcher:
     def __init__(self):
         self.subscriptions: List[EventSubscription] = []
     def trigger_event(self, event_name, source, **details):
+        if not profiler.enabled:
+            self.dispatch(event_name, source, details)
+            return
+        with profiler.measure(f"event {event_name.split('/')[0]}", 'events'):
+            self.dispatch(event_name, source, details)
+
+    def dispatch(self, event_name, source, details):
         for sub in self.subscriptions:
             if fnmatch(event_name, sub.path):
                 details['target'] = sub.target
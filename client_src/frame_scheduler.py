@@ -0,0 +1,80 @@
+"""
+Copyright© 2024 Evert van de Waal
+
+This file is part of dsmgen.
+
+Dsmgen is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+Dsmgen is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Foobar; if not, write to the Free Software
+Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+from browser import window
+from typing import Any, Dict, Tuple
+from point import Point
+
+
+class FrameScheduler:
+    """ Collect the changes made while dragging and apply them once per animation frame.
+
+        Mouse-move events arrive much faster than the browser redraws. Moving the blocks and re-routing
+        their connections for each event wastes time on states that are never shown. Instead, the
+        latest position of each block is remembered and applied when the next frame is drawn. Connections
+        shared by several moved blocks are re-routed only once.
+
+        When the browser does not offer animation frames (e.g. when running headless), the changes are
+        applied immediately.
+    """
+    def __init__(self, diagram):
+        self.diagram = diagram
+        self.pending_moves: Dict[int, Tuple[Any, Point]] = {}
+        self.pending_shapes: Dict[int, Any] = {}
+        self.pending_connections: Dict[int, Any] = {}
+        self.frame_requested = False
+
+    def moveBlock(self, widget, pos: Point) -> None:
+        """ Move a block to a new position, and re-route the connections to it. """
+        self.pending_moves[id(widget)] = (widget, pos)
+        self.requestFrame()
+
+    def rerouteShape(self, widget) -> None:
+        """ Re-route all connections to a block. """
+        self.pending_shapes[id(widget)] = widget
+        self.requestFrame()
+
+    def rerouteConnection(self, connection) -> None:
+        self.pending_connections[id(connection)] = connection
+        self.requestFrame()
+
+    def requestFrame(self) -> None:
+        if self.frame_requested:
+            return
+        request = getattr(window, 'requestAnimationFrame', None)
+        if request is None:
+            self.flush()
+            return
+        self.frame_requested = True
+        request(self.flush)
+
+    def flush(self, timestamp=None) -> None:
+        """ Apply all pending changes. Also called directly when the final state is needed, e.g. on mouse-up. """
+        self.frame_requested = False
+        moves, shapes, connections = self.pending_moves, self.pending_shapes, self.pending_connections
+        self.pending_moves, self.pending_shapes, self.pending_connections = {}, {}, {}
+
+        for widget, pos in moves.values():
+            widget.setPos(pos)
+            shapes[id(widget)] = widget
+        for widget in shapes.values():
+            for c in self.diagram.getConnectionsToShape(widget):
+                connections[id(c)] = c
+        for c in connections.values():
+            self.diagram.rerouteConnections(c)
@@ -0,0 +1,191 @@
+"""
+Copyright© 2024 Evert van de Waal
+
+This file is part of dsmgen.
+
+Dsmgen is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+Dsmgen is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Foobar; if not, write to the Free Software
+Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+"""
+Draw diagrams without a browser, e.g. on the server to produce images for documentation.
+
+The diagram is drawn from the records returned by `/data/diagram_contents/<id>`, using the same shape
+definitions, text layout and routing as the client. Outside the browser, the elements are created with
+the lightweight builder in `svg_builder`.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import svg_builder
+svg_builder.installAsBrowser()
+
+from browser import svg
+from point import Point, load_waypoints, path_string
+from storable_element import ReprCategory
+from svg_shapes import (BasicShape, renderText, getMarkerDefinitions, line_patterns, text_style_items,
+                        connection_style_items)
+from batch_routing import routeAll
+
+
+block_categories = [ReprCategory.block, ReprCategory.block_instance, ReprCategory.laned_block,
+                    ReprCategory.laned_instance]
+connection_categories = [ReprCategory.relationship, ReprCategory.laned_connection]
+routing_methods = ['square', 'center2center', 'orthogonal']
+
+# The orientations of ports, as in `shapes.Orientations`.
+TOP, RIGHT, BOTTOM, LEFT = 2, 4, 6, 8
+
+
+class RenderDetails:
+    """ The position, size, text and style of a block, as needed by the shape types in `svg_shapes`. """
+    def __init__(self, x, y, width, height, text: str, style: Dict[str, Any]):
+        self.x, self.y, self.width, self.height = x, y, width, height
+        self.text = text
+        self.style = style
+
+    def getStyle(self, key, default=None):
+        return self.style.get(key, default)
+
+
+def loadStyling(styling) -> Dict[str, Any]:
+    """ The styling of a representation is stored as a JSON string, but can also be a dictionary. """
+    if isinstance(styling, dict):
+        return styling
+    if not styling:
+        return {}
+    try:
+        return json.loads(styling)
+    except json.JSONDecodeError:
+        return {}
+
+
+def getPortPositions(block: RenderDetails, ports: List[Dict[str, Any]]) -> Dict[int, Point]:
+    """ Spread the ports evenly along the sides of their block, like `ModeledShapeAndPorts`. """
+    positions = {}
+    for orientation in [LEFT, RIGHT, BOTTOM, TOP]:
+        side = sorted([p for p in ports if getOrientation(p) == orientation], key=lambda p: p.get('order') or 0)
+        length = block.height if orientation in [LEFT, RIGHT] else block.width
+        step = length / (len(side) or 1)
+        for i, p in enumerate(side):
+            offset = step * (i + 0.5)
+            positions[p['Id']] = {
+                LEFT: Point(block.x, block.y + offset),
+                RIGHT: Point(block.x + block.width, block.y + offset),
+                TOP: Point(block.x + offset, block.y),
+                BOTTOM: Point(block.x + offset, block.y + block.height)
+            }[orientation]
+    return positions
+
+
+def getOrientation(port: Dict[str, Any]) -> int:
+    orientation = port.get('orientation') or port.get('_entity', {}).get('orientation') or RIGHT
+    return orientation if orientation in [TOP, RIGHT, BOTTOM, LEFT] else RIGHT
+
+
+def renderDiagram(records: List[Dict[str, Any]], styling: Optional[Dict[str, Dict[str, Any]]] = None,
+                  text_fields: Optional[Dict[str, str]] = None, margin: float = 20):
+    """ Draw a diagram, and return the `svg` element.
+
+        `records` are the representations in the diagram, with their `_entity`.
+        `styling` holds the default style for each entity class, as defined in the model specification.
+        `text_fields` holds the name of the field shown as text for each entity class, by default `name`.
+        Messages are not drawn.
+    """
+    styling = styling or {}
+    text_fields = text_fields or {}
+    blocks, ports, connections = [], {}, []
+    for r in records:
+        category = r.get('category')
+        if category in block_categories:
+            blocks.append(r)
+        elif category == ReprCategory.port:
+            ports.setdefault(r.get('parent'), []).append(r)
+        elif category in connection_categories:
+            connections.append(r)
+
+    canvas = svg.svg(xmlns='http://www.w3.org/2000/svg')
+    _ = canvas <= getMarkerDefinitions()
+
+    # The outlines of the blocks and ports, as used for routing.
+    rects: List[Tuple[float, float, float, float]] = []
+    rect_index: Dict[int, int] = {}
+
+    for r in blocks:
+        entity = r.get('_entity', {})
+        cls_name = entity.get('__classname__', '')
+        entity_style = styling.get(cls_name, {})
+        block_ports = ports.get(r['Id'], [])
+        # Blocks with ports are drawn as rectangles, as in the client.
+        shape_type = BasicShape.getDescriptor('rect' if block_ports else entity_style.get('shape', 'rect'))
+        style = dict(text_style_items)
+        style.update(shape_type.getDefaultStyle())
+        style.update(entity_style)
+        style.update(loadStyling(r.get('styling')))
+        details = RenderDetails(r.get('x') or 0, r.get('y') or 0, r.get('width') or 0, r.get('height') or 0,
+                                entity.get(text_fields.get(cls_name, 'name')) or '', style)
+
+        g = svg.g()
+        _ = g <= shape_type.getShape(details)
+        _ = g <= renderText(details.text, details)
+        rect_index[r['Id']] = len(rects)
+        rects.append((details.x, details.y, details.width, details.height))
+
+        for port_id, pos in getPortPositions(details, block_ports).items():
+            _ = g <= svg.rect(x=int(pos.x-5), y=int(pos.y-5), width=10, height=10, stroke_width=1, stroke='black',
+                              fill='lightgreen')
+            rect_index[port_id] = len(rects)
+            rects.append((pos.x, pos.y, 1, 1))
+        _ = canvas <= g
+
+    # Route the connections per routing method, then draw them.
+    by_method: Dict[str, List[Tuple[Dict[str, Any], Dict[str, Any]]]] = {}
+    for r in connections:
+        if r.get('source_repr_id') not in rect_index or r.get('target_repr_id') not in rect_index:
+            continue
+        style = dict(connection_style_items)
+        style.update(styling.get(r.get('_entity', {}).get('__classname__', ''), {}))
+        style.update(loadStyling(r.get('styling')))
+        method = style['routing_method'] if style['routing_method'] in routing_methods else 'square'
+        by_method.setdefault(method, []).append((r, style))
+
+    for method, items in by_method.items():
+        pairs = [(rect_index[r['source_repr_id']], rect_index[r['target_repr_id']]) for r, _ in items]
+        waypoints = [load_waypoints(r.get('routing') or '') for r, _ in items]
+        for (r, style), points in zip(items, routeAll(rects, pairs, method, waypoints)):
+            details = dict(d=path_string([c for p in points for c in p]), stroke=style['linecolor'],
+                           stroke_width=style['linewidth'], fill='none',
+                           marker_end=f"url('#{style['endmarker']}')", marker_start=f"url('#{style['startmarker']}')")
+            if pattern := line_patterns.get(style.get('pattern', 'solid'), ''):
+                details['stroke_dasharray'] = pattern
+            _ = canvas <= svg.path(**details)
+
+    # Size the image to its contents.
+    if rects:
+        xmin = min(r[0] for r in rects) - margin
+        ymin = min(r[1] for r in rects) - margin
+        xmax = max(r[0] + r[2] for r in rects) + margin
+        ymax = max(r[1] + r[3] for r in rects) + margin
+    else:
+        xmin, ymin, xmax, ymax = 0, 0, 2*margin, 2*margin
+    canvas['viewBox'] = f'{xmin} {ymin} {xmax-xmin} {ymax-ymin}'
+    canvas['width'], canvas['height'] = str(int(xmax-xmin)), str(int(ymax-ymin))
+    return canvas
+
+
+def renderDiagramSvg(records: List[Dict[str, Any]], styling: Optional[Dict[str, Dict[str, Any]]] = None,
+                     text_fields: Optional[Dict[str, str]] = None) -> str:
+    """ Draw a diagram, and return it as the text of an SVG file. """
+    canvas = renderDiagram(records, styling, text_fields)
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' + svg_builder.serialize(canvas)
@@ -0,0 +1,190 @@
+"""
+Copyright© 2024 Evert van de Waal
+
+This file is part of dsmgen.
+
+Dsmgen is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+Dsmgen is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Foobar; if not, write to the Free Software
+Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+"""
+Opt-in timing of the client, to find where the time goes in production use.
+
+The data store, the event dispatcher, the diagrams and the routers report their work to the `profiler`.
+When profiling is enabled (add `?profile` to the URL of the client), the time and count of each kind of work
+is recorded. The results are shown in an overlay (Ctrl+Shift+P), and can be saved as a Chrome trace file,
+which can be opened in the performance tab of the browser's developer tools or in https://ui.perfetto.dev.
+"""
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+try:
+    from browser import window
+except ImportError:
+    # Outside the browser, e.g. when rendering diagrams on the server.
+    window = None
+
+
+# Used for all measurements while profiling is disabled.
+no_measurement = nullcontext()
+
+
+class Profiler:
+    """ Records the start and duration of the work done by the client, in milliseconds. """
+    max_events = 100000
+
+    def __init__(self):
+        self.enabled = False
+        self.events: List[Tuple[str, str, float, float]] = []     # (name, category, start, duration)
+        self.totals: Dict[Tuple[str, str], List[float]] = {}      # (name, category): [count, total, maximum]
+        self.dropped = 0
+        self.overlay = None
+
+    @staticmethod
+    def now() -> float:
+        performance = getattr(window, 'performance', None)
+        if performance is not None:
+            return performance.now()
+        return time.perf_counter() * 1000.0
+
+    def enable(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+
+    def reset(self) -> None:
+        self.events = []
+        self.totals = {}
+        self.dropped = 0
+
+    def record(self, name: str, category: str, start: float, duration: float) -> None:
+        totals = self.totals.setdefault((name, category), [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += duration
+        totals[2] = max(totals[2], duration)
+        if len(self.events) < self.max_events:
+            self.events.append((name, category, start, duration))
+        else:
+            # The totals remain correct, only the trace is incomplete.
+            self.dropped += 1
+
+    def measure(self, name: str, category: str = 'client'):
+        """ Record the time taken by the statements in a `with` block.
+            When profiling is disabled, a shared context that does nothing is returned.
+        """
+        if not self.enabled:
+            return no_measurement
+        return self.measuring(name, category)
+
+    @contextmanager
+    def measuring(self, name: str, category: str):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, self.now() - start)
+
+    def timed(self, name: Optional[str] = None, category: str = 'client') -> Callable:
+        """ Decorator that records the time taken by each call of a function. """
+        def decorate(func):
+            label = name or func.__qualname__
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = self.now()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(label, category, start, self.now() - start)
+            return wrapper
+        return decorate
+
+    def summary(self) -> List[Tuple[str, str, int, float, float]]:
+        """ Return (name, category, count, total, maximum) for all kinds of work, most expensive first. """
+        rows = [(name, category, int(count), total, maximum)
+                for (name, category), (count, total, maximum) in self.totals.items()]
+        return sorted(rows, key=lambda r: r[3], reverse=True)
+
+    def chromeTrace(self) -> str:
+        """ Return the recorded events in the Chrome trace event format. Times are in microseconds. """
+        events = [dict(name=name, cat=category, ph='X', ts=round(start * 1000), dur=round(duration * 1000),
+                       pid=1, tid=1)
+                  for name, category, start, duration in self.events]
+        return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms',
+                           'otherData': {'dropped_events': self.dropped}})
+
+    def exportTrace(self, filename: str = 'dsmgen_trace.json') -> None:
+        """ Let the browser download the trace file. """
+        from browser import html
+        blob = window.Blob.new([self.chromeTrace()], {'type': 'application/json'})
+        url = window.URL.createObjectURL(blob)
+        link = html.A(href=url, download=filename)
+        link.click()
+        window.URL.revokeObjectURL(url)
+
+    def showOverlay(self, parent) -> None:
+        """ Show or refresh a panel with the summary, on top of the `parent` element. """
+        from browser import html
+        self.hideOverlay()
+        self.overlay = html.DIV(Class='profiler-overlay', style={
+            'position': 'fixed', 'right': '10px', 'bottom': '10px', 'z-index': '1000', 'max-height': '50%',
+            'overflow': 'auto', 'background': 'white', 'border': '1px solid gray', 'padding': '5px',
+            'font-size': 'small'})
+        _ = parent <= self.overlay
+
+        def on_export(_ev):
+            self.exportTrace()
+        def on_reset(_ev):
+            self.reset()
+            self.showOverlay(parent)
+        def on_close(_ev):
+            self.hideOverlay()
+        for text, handler in [('Export trace', on_export), ('Reset', on_reset), ('Close', on_close)]:
+            button = html.BUTTON(text)
+            button.bind('click', handler)
+            _ = self.overlay <= button
+
+        table = html.TABLE()
+        _ = table <= html.TR([html.TH(h) for h in ['Name', 'Category', 'Count', 'Total (ms)', 'Max (ms)']])
+        for name, category, count, total, maximum in self.summary():
+            _ = table <= html.TR([html.TD(name), html.TD(category), html.TD(str(count)), html.TD(f'{total:.1f}'),
+                                  html.TD(f'{maximum:.1f}')])
+        _ = self.overlay <= table
+
+    def hideOverlay(self) -> None:
+        if self.overlay is not None:
+            self.overlay.remove()
+            self.overlay = None
+
+
+profiler = Profiler()
+
+
+def urlFlag(name: str, search: Optional[str] = None) -> bool:
+    """ Check if an option of the client is switched on in its URL, e.g. `?profile` or `?symbols=1`.
+        `search` is the query string of the URL, by default that of the current page.
+    """
+    if search is None:
+        location = getattr(window, 'location', None)
+        search = str(getattr(location, 'search', '')) if location is not None else ''
+    values = parse_qs(search.lstrip('?'), keep_blank_values=True).get(name)
+    return bool(values) and values[-1].lower() not in ['0', 'false', 'no']
+
+
+def profilingRequested(search: Optional[str] = None) -> bool:
+    """ Profiling is enabled by adding the `profile` parameter to the URL of the client, e.g. `?profile`. """
+    return urlFlag('profile', search)
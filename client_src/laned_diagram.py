@@ -11,7 +11,7 @@ These differences are handled by giving the LanedDiagram different event handler
 """
 from dataclasses import dataclass, field
 from enum import StrEnum
-from typing import override, List, Dict, Type, Any
+from typing import override, List, Dict, Type, Any, Optional
 
 from browser import svg, window, bind
 from data_store import UndoableDataStore
@@ -21,6 +21,7 @@ from modeled_diagram import ModeledDiagram
 from point import Point
 from shapes import Relationship, RoutingStrategy, Orientations, handle_class, getMousePos
 from storable_element import ReprCategory
+from render_state import dom_mutations
 
 """
 Development strategy:
@@ -65,8 +66,16 @@ class LanedShape(ModeledShape):
         _ = [shape <= l for l in self.lines]
         return shape
 
+    def getRenderValues(self) -> Dict[str, Any]:
+        values = super().getRenderValues()
+        values['lane_length'] = self.lane_length
+        return values
+
     def updateShape(self, shape=None):
         super().updateShape(shape)
+        if not self.render_state.last_changes & {'pos', 'size', 'lane_length'}:
+            return
+        dom_mutations.add(4 * len(self.lines))
         x = self.x + self.width//2
         y = self.y+self.height
         for l in self.lines:
@@ -106,17 +115,33 @@ class LanedDiagram(ModeledDiagram):
     lane_margin = 20
     lane_offset = 90
     cross_offset = 60
+    # The lanes are laid out using all blocks, so these are always drawn.
+    cull_threshold = None
+
     def __init__(self, config: DiagramConfiguration, widgets, datastore: UndoableDataStore, diagram_id: int):
         super().__init__(config, widgets, datastore, diagram_id)
-        self.lanes = []
+        # The lanes, ordered by their position in the diagram.
+        self.lanes: List[LanedShape] = []
+        # While the lanes are being laid out, the connections to re-route are collected here.
+        self.pending_reroutes: Optional[Dict[int, Relationship]] = None
+
+    def laneKey(self, block) -> float:
+        return block.x if self.vertical_lane else block.y
 
     def addBlock(self, block):
         # Create the block as usual
         result = super().addBlock(block)
         if block.is_laned():
-            self.lanes.append(block)
+            key = self.laneKey(block)
+            index = next((i for i, b in enumerate(self.lanes) if self.laneKey(b) > key), len(self.lanes))
+            self.lanes.insert(index, block)
         return result
 
+    def detachChild(self, widget) -> None:
+        super().detachChild(widget)
+        if widget in self.lanes:
+            self.lanes.remove(widget)
+
     def place_block(self, block_cls, details):
         """ In diagrams that have clipping, this function updates the location of a newly created block to comply with
             the diagram's rules.
@@ -153,28 +178,64 @@ class LanedDiagram(ModeledDiagram):
         result = super().addConnection(connection)
         return result
 
-    def updateLanedBlock(self, _element):
-        # Just re-order all blocks and locate them in their proper positions.
-        # When in doubt, use brute force.
-        keyfunc = (lambda b: b.x) if self.vertical_lane else (lambda b: b.y)
-        order: List[LanedShape] = sorted((b for b in self.children if b.is_laned()), key=keyfunc)
-        position = self.lane_offset
-        for i, b in enumerate(order):
-            b.order = i+1
-            if self.vertical_lane:
-                b.x = position
-                position += b.width
-            else:
-                b.y = position
-                position += b.height
-            position += self.lane_margin
-            # Update them all, the data_store will detect any real changes.
-            self.datastore.update(b)
+    def layoutLanes(self, element) -> List[LanedShape]:
+        """ Move `element` to its place in the ordered lanes, and position the lanes after it.
+            Only the lanes from the old or new index of `element` onwards can be displaced. The lanes that actually
+            moved or changed order are returned.
+        """
+        others = [b for b in self.lanes if b is not element]
+        first = self.lanes.index(element) if element in self.lanes else len(others)
+        if any(self.laneKey(a) > self.laneKey(b) for a, b in zip(others, others[1:])):
+            # The lanes were moved outside the layout, e.g. by an undo. Restore the order.
+            others.sort(key=self.laneKey)
+            first = 0
+        key = self.laneKey(element)
+        index = next((i for i, b in enumerate(others) if self.laneKey(b) > key), len(others))
+        self.lanes = others[:index] + [element] + others[index:]
+        first = min(first, index)
+
+        if first > 0:
+            previous = self.lanes[first-1]
+            position = self.laneKey(previous) + (previous.width if self.vertical_lane else previous.height) + self.lane_margin
+        else:
+            position = self.lane_offset
+        displaced = []
+        for i, b in enumerate(self.lanes[first:], start=first+1):
+            if self.laneKey(b) != position or b.order != i:
+                b.order = i
+                if self.vertical_lane:
+                    b.x = position
+                else:
+                    b.y = position
+                displaced.append(b)
+            position += (b.width if self.vertical_lane else b.height) + self.lane_margin
+        return displaced
+
+    def updateLanedBlock(self, element):
+        """ Store a change to `element` and the lanes it displaced, with a single request. """
+        displaced = [b for b in self.layoutLanes(element) if b is not element]
+        self.datastore.update_all([element] + displaced)
+
+    def rerouteConnections(self, widget) -> None:
+        if self.pending_reroutes is not None and not isinstance(widget, Relationship):
+            # Re-route the connections once, after all lanes are in their place.
+            for c in self.getConnectionsToShape(widget):
+                self.pending_reroutes[id(c)] = c
+            return
+        super().rerouteConnections(widget)
 
     def updateElement(self, element) -> None:
-        if isinstance(element, LanedShape):
+        if not isinstance(element, LanedShape):
+            super().updateElement(element)
+            return
+        # The element and the lanes it displaced are stored with one request, as a single undo action.
+        self.pending_reroutes = {}
+        try:
             self.updateLanedBlock(element)
-        super().updateElement(element)
+        finally:
+            connections, self.pending_reroutes = self.pending_reroutes, None
+        for c in connections.values():
+            self.rerouteConnections(c)
 
 
 class SequenceMessageRouter(RoutingStrategy):
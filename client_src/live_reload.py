@@ -0,0 +1,65 @@
+"""
+Copyright© 2024 Evert van de Waal
+
+This file is part of dsmgen.
+
+Dsmgen is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+Dsmgen is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Foobar; if not, write to the Free Software
+Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+"""
+Reload the page when the tool is updated while it is running in watch mode (`run.py --watch`).
+
+The client polls the server for the version of the tool. When the version changes, the page is reloaded.
+The browser keeps the imported modules in its cache and checks them with conditional requests, so only
+the modules that actually changed are downloaded again. When the server is not in watch mode, polling stops
+after the first request.
+"""
+from browser import ajax, console, window
+
+
+class LiveReload:
+    def __init__(self, url: str = '/dev/reload', interval: int = 500):
+        self.url = url
+        self.interval = interval
+        self.version = None
+
+    def start(self) -> None:
+        self.poll()
+
+    def poll(self) -> None:
+        ajax.get(self.url, mode='json', oncomplete=self.onResponse)
+
+    def onResponse(self, response) -> None:
+        if response.status == 404:
+            # The server is not in watch mode.
+            return
+        if response.status == 200:
+            state = response.json
+            if self.version is None:
+                self.version = state['version']
+            elif state['version'] != self.version:
+                console.log(f"Reloading for changes in {', '.join(state['modules'])}")
+                self.reload()
+                return
+        # Otherwise the server is restarting: keep trying.
+        self.schedule()
+
+    def schedule(self) -> None:
+        set_timeout = getattr(window, 'setTimeout', None)
+        if set_timeout is not None:
+            set_timeout(self.poll, self.interval)
+
+    def reload(self) -> None:
+        window.location.reload()
@@ -19,7 +19,7 @@ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 """
 import json
 from dataclasses import fields
-from typing import Dict, Type, Any, override
+from typing import Dict, Type, Any, Optional, override
 from weakref import ref
 
 import data_store
@@ -30,9 +30,13 @@ import shapes
 from data_store import UndoableDataStore, ReprCategory, StorableElement, Collection, ReprCategory
 from modeled_shape import ModeledRelationship, ModelEntity, ModeledShape, Port, ModelRepresentation
 from property_editor import OptionalRef
+from instrumentation import profiler
 
 
 class ModeledDiagram(Diagram):
+    # Diagrams with more elements than this only draw the elements that are in view.
+    cull_threshold: Optional[int] = 500
+
     def __init__(self, config: DiagramConfiguration, widgets, datastore: UndoableDataStore, diagram_id: int):
         super().__init__(config, widgets)
         self.datastore = datastore               # Interface for getting and storing diagram state
@@ -54,8 +58,9 @@ class ModeledDiagram(Diagram):
                     if not any(source.Id == p.model_entity.Id for p in r.ports):
                         p = repr_cls(parent=r.Id, model_entity=source, diagram=self.diagram_id)
                         self.datastore.add_complex(p)
-                        # Redraw the shape
-                        r.updateShape(r.shape)
+                        # Redraw the shape, unless it is not drawn because it is out of view.
+                        if r.shape is not None:
+                            r.updateShape(r.shape)
 
                 # Check if we need to create a PortLabel -- i.e. for a port owned by the diagram, not a block.
                 if source.parent == self.diagram_id:
@@ -88,7 +93,8 @@ class ModeledDiagram(Diagram):
                 # Find any representations of this port
                 reprs = [p for c in self.children for p in getattr(c, 'ports', []) if p.model_entity.Id == source.Id]
                 for r in reprs:
-                    r.shape.remove()
+                    if r.shape is not None:
+                        r.shape.remove()
                     parent = self.datastore.get(Collection.block_repr, r.parent)
                     # The representation doesn't need deleting: that is done by the data_store.
                     # Only remove them from the ports collection maintained by this class
@@ -107,7 +113,8 @@ class ModeledDiagram(Diagram):
                     block = self.datastore.live_instances[Collection.block_repr][source.parent]
                     if source in block.ports:
                         block.ports.remove(source)
-                        block.updateShape(block.shape)
+                        if block.shape is not None:
+                            block.updateShape(block.shape)
                 else:
                     Diagram.deleteBlock(self, source)
 
@@ -117,11 +124,15 @@ class ModeledDiagram(Diagram):
                 reprs = [c for c in self.children if c.model_entity.Id == source.Id]
                 # Update the shapes
                 for r in reprs:
-                    r.updateShape(r.shape)
+                    if r.shape is not None:
+                        r.updateShape(r.shape)
             elif source.get_collection() in Collection.representations():
                 # Support for the undo & redo actions.
                 if source in self.children:
-                    source.updateShape(source.shape)
+                    if source.shape is not None:
+                        source.updateShape(source.shape)
+                    # The position may have been changed directly, bypassing `setPos`.
+                    self.childGeometryChanged(source)
                     self.rerouteConnections(source)
                 else:
                     console.log("SOURCE not in children")
@@ -149,8 +160,22 @@ class ModeledDiagram(Diagram):
     def load_diagram(self):
         self.datastore.get_diagram_data(self.diagram_id, self.mass_update)
 
+    @profiler.timed('draw diagram', 'diagram')
     def mass_update(self, data):
         """ Callback for loading an existing diagram """
+        if self.cull_threshold is not None and len(data) > self.cull_threshold:
+            # Only draw the elements in view. Elements with their own way of loading are drawn as usual.
+            blocks = [d for d in data if isinstance(d, shapes.Shape) and type(d).load is shapes.Shape.load]
+            connections = [d for d in data if isinstance(d, shapes.Relationship)
+                           and type(d).load is shapes.Relationship.load]
+            deferred = set(id(d) for d in blocks + connections)
+            data = [d for d in data if id(d) not in deferred]
+            self.viewport.load(blocks, connections)
+            # The other connections are always drawn, so the blocks they connect must be drawn as well.
+            for d in data:
+                if isinstance(d, shapes.Relationship):
+                    self.viewport.show(d.start)
+                    self.viewport.show(d.finish)
         # Ensure blocks are drawn before the connections.
         for d in data:
             if isinstance(d, shapes.Shape):
@@ -159,6 +184,7 @@ class ModeledDiagram(Diagram):
         for d in data:
             if isinstance(d, shapes.Relationship):
                 d.load(self)
+        self.viewport.update()
 
     def get_connection_repr(self, a, b):
         return ReprCategory.relationship
@@ -24,11 +24,12 @@ import json
 from browser import svg, document, console, bind
 from diagrams import Shape, Relationship, CP, Point, Orientations
 import shapes
-from svg_shapes import MsgShape, HAlign, VAlign
+from svg_shapes import MsgShape, HAlign, VAlign, shape_registry, symbol_cache, symbol_colours, SymbolDetails
 from context_menu import mk_context_menu
 from storable_element import StorableElement, Collection, ReprCategory, from_dict
 from data_store import ExtendibleJsonEncoder, DataStore
 from point import load_waypoints
+from render_state import RenderState, dom_mutations
 from copy import deepcopy, copy
 from property_editor import getDetailsPopup, Color
 from model_interface import ModelEntity, PropertyEditable, EditableParameterDetails
@@ -122,6 +123,7 @@ class ModeledShape(Shape, ModelRepresentation):
     default_style = dict(blockcolor='#ffffff')
     TextWidget = shapes.Text('text')
     category: ReprCategory = ReprCategory.block
+    symbol_key = None           # The key of the symbol the outline is drawn from, see `svg_shapes.SymbolCache`.
 
     @property
     def text(self):
@@ -148,19 +150,95 @@ class ModeledShape(Shape, ModelRepresentation):
         # This shape consists of two parts: the text and the outline.
         shape_type = self.getShapeDescriptor()
         g = svg.g()
-        _ = g <= shape_type.getShape(self)
+        _ = g <= (self.getSymbolUse() if self.drawsFromSymbol() else shape_type.getShape(self))
         _ = g <= self.TextWidget.getShape(self)
         g.attrs['data-category'] = self.repr_category().value
         g.attrs['data-rid'] = self.Id
         storable_entity = cast(StorableElement, self.model_entity)
         g.attrs['data-mid'] = storable_entity.Id
+        self.render_state = RenderState(**self.getRenderValues())
+        self.updateOutline(self.render_state.prime('outline', g.children[0]))
         return g
 
+    def drawsFromSymbol(self) -> bool:
+        """ With `?symbols`, the outline is a `<use>` of a symbol shared with the blocks that look the same.
+            Scalable shapes are drawn from a symbol of their shape type instead, see `ShapeRegistry.get`.
+        """
+        return shape_registry.use_symbols and not self.getShapeDescriptor().scalable
+
+    def getSymbolKey(self) -> Tuple:
+        """ The details that determine what the symbol looks like. The colours are set on the `<use>`. """
+        shape_type = self.getShapeDescriptor()
+        geometry = tuple((k, self.getStyle(k, '')) for k in sorted(shape_registry.getDefaults(shape_type))
+                         if k not in symbol_colours)
+        return shape_type.getType(), self.width, self.height, geometry
+
+    def drawSymbol(self) -> List[Any]:
+        """ The elements of the symbol for this shape, drawn at the origin. """
+        return [self.getShapeDescriptor().getShape(SymbolDetails(self))]
+
+    def getSymbolUse(self):
+        use = svg.use()
+        self.updateSymbolUse(use)
+        return use
+
+    def updateSymbolUse(self, use) -> None:
+        """ Place the `<use>` of the symbol. A shape that looks different is switched to another symbol. """
+        key = self.getSymbolKey()
+        if key != self.symbol_key:
+            use['href'] = '#' + symbol_cache.acquire(key, self.drawSymbol)
+            self.releaseSymbol()
+            self.symbol_key = key
+        shape_type = self.getShapeDescriptor()
+        use['x'], use['y'] = str(self.x), str(self.y)
+        use['width'], use['height'] = str(self.width), str(self.height)
+        use['fill'] = shape_type.getStyle('blockcolor', self)
+        use['stroke'] = shape_type.getStyle('bordercolor', self)
+        use['stroke-width'] = shape_type.getStyle('bordersize', self)
+
+    def releaseSymbol(self) -> None:
+        if self.symbol_key is not None:
+            symbol_cache.release(self.symbol_key)
+            self.symbol_key = None
+
+    def updateOutline(self, outline) -> None:
+        if self.symbol_key is None:
+            self.getShapeDescriptor().updateShape(outline, self)
+        else:
+            self.updateSymbolUse(outline)
+
+    def delete(self):
+        super().delete()
+        self.releaseSymbol()
+
+    def getRenderValues(self) -> Dict[str, Any]:
+        """ The values that determine how the shape is drawn. Only the parts that depend on changed values
+            are updated in `updateShape`.
+        """
+        keys = sorted(set(self.getDefaultStyle()) | set(shape_registry.getDefaults(self.getShapeDescriptor())))
+        return dict(pos=(self.x, self.y), size=(self.width, self.height), text=self.text,
+                    style=tuple((k, self.getStyle(k, '')) for k in keys))
+
+    def getRenderChanges(self) -> set:
+        if self.render_state is None:
+            self.render_state = RenderState()
+        return self.render_state.changes(**self.getRenderValues())
+
     def updateShape(self, shape=None):
         shape = shape or self.shape
-        shape_type = self.getShapeDescriptor()
-        shape_type.updateShape(shape.children[0], self)
-        self.TextWidget.updateShape(shape.children[1], self)
+        changed = self.getRenderChanges()
+        if changed & {'pos', 'size', 'style'}:
+            self.updateOutline(self.render_state.element('outline', shape.children[0]))
+        self.updateText(shape.children[1], changed)
+
+    def updateText(self, text, changed):
+        if changed & {'text', 'size', 'style'}:
+            self.TextWidget.updateShape(text, self)
+            self.render_state.forget('text')
+            dom_mutations.add(1 + len(text.children))
+        elif 'pos' in changed:
+            # The lines stay the same, only their position changes.
+            self.TextWidget.moveShape(self.render_state.element('text', text), self)
 
     def getDefaultStyle(self):
         style = {}
@@ -224,9 +302,16 @@ class Port(CP, ModelRepresentation):
         storable_entity = cast(StorableElement, self.model_entity)
         return storable_entity.Id
 
-    def getShape(self):
+    @staticmethod
+    def getOutline(pos: Point):
+        return svg.rect(x=pos.x-5, y=pos.y-5, width=10, height=10, stroke_width=1, stroke='black', fill='lightgreen')
+
+    def getNameWidget(self):
         p = self.pos
-        shape = svg.rect(x=p.x-5, y=p.y-5, width=10, height=10, stroke_width=1, stroke='black', fill='lightgreen')
+        return svg.text(self.model_entity.get_text(0), x=p.x, y=p.y-20, font_size=14, font_family='arial')
+
+    def getShape(self):
+        shape = self.getOutline(self.pos)
         shape.attrs['data-class'] = type(self).__name__
         shape.attrs['data-category'] = int(ReprCategory.port)
         shape.attrs['data-rid'] = self.Id
@@ -239,9 +324,7 @@ class Port(CP, ModelRepresentation):
             print('over port')
             if not shape.parent:
                 return
-            p = self.pos
-            self.name_widget = svg.text(self.model_entity.get_text(0), x=p.x, y=p.y-20,
-                font_size=14, font_family='arial')
+            self.name_widget = self.getNameWidget()
             shape.parent <= self.name_widget
 
         @bind(shape, 'mouseleave')
@@ -302,84 +385,170 @@ class ModeledShapeAndPorts(ModeledShape):
         return shapes.BasicShape.getDescriptor("rect")
 
     def getPointPosFunc(self, orientation, ports):
+        # The ports are spread evenly along the side, so only the step between them depends on the index.
+        nr_ports = len(ports) or 1
         match orientation:
             case Orientations.LEFT:
-                return lambda i: Point(x=self.x, y=self.y + self.height / len(ports) / 2 * (2 * i + 1))
+                x, y, step = self.x, self.y, self.height / nr_ports
+                return lambda i: Point(x, y + step * (i + 0.5))
             case Orientations.RIGHT:
-                return lambda i: Point(x=self.x + self.width,
-                                                y=self.y + self.height / len(ports) / 2 * (2 * i + 1))
+                x, y, step = self.x + self.width, self.y, self.height / nr_ports
+                return lambda i: Point(x, y + step * (i + 0.5))
             case Orientations.TOP:
-                return lambda i: Point(x=self.x + self.width / len(ports) / 2 * (2 * i + 1), y=self.y)
+                x, y, step = self.x, self.y, self.width / nr_ports
+                return lambda i: Point(x + step * (i + 0.5), y)
             case Orientations.BOTTOM:
-                return lambda i: Point(x=self.x + self.width / len(ports) / 2 * (2 * i + 1), y=self.y + self.height)
+                x, y, step = self.x, self.y + self.height, self.width / nr_ports
+                return lambda i: Point(x + step * (i + 0.5), y)
 
     def getShape(self):
         g = svg.g()
-        # Add the core rectangle
-        shape_type = self.getShapeDescriptor()
-        _ = g <= shape_type.getShape(self)
-        # Add the text
-        _ = g <= self.TextWidget.getShape(self)
-        # Add the ports
+        self.sorted_ports = self.sortPorts()
+        self.placePorts()
         port_shape_lookup = {}      # A lookup for when the port is clicked.
-        sorted_ports = {orientation: sorted([p for p in self.ports if p.orientation == orientation], key=lambda x: x.order) \
-                       for orientation in Orientations}
-        for orientation in [Orientations.LEFT, Orientations.RIGHT, Orientations.BOTTOM, Orientations.TOP]:
-            ports = sorted_ports[orientation]
-            pos_func = self.getPointPosFunc(orientation, ports)
-
-            for i, p in enumerate(ports):
-                p.pos = pos_func(i)
-                s = p.getShape()
-                _ = g <= s
-                p.shape = s
-                port_shape_lookup[s] = p
+        if self.drawsFromSymbol():
+            # The core rectangle and the ports are drawn by a single `<use>`.
+            _ = g <= self.getSymbolUse()
+            _ = g <= self.TextWidget.getShape(self)
+            self.bindPortNames(g.children[0])
+            for p in self.ports:
+                p.shape = None
+        else:
+            # Add the core rectangle
+            shape_type = self.getShapeDescriptor()
+            _ = g <= shape_type.getShape(self)
+            # Add the text
+            _ = g <= self.TextWidget.getShape(self)
+            # Add the ports
+            for orientation in [Orientations.LEFT, Orientations.RIGHT, Orientations.BOTTOM, Orientations.TOP]:
+                for p in self.sorted_ports[orientation]:
+                    s = p.getShape()
+                    _ = g <= s
+                    p.shape = s
+                    port_shape_lookup[s] = p
         self.port_shape_lookup = port_shape_lookup
 
         g.attrs['data-category'] = int(ReprCategory.block)
         g.attrs['data-rid'] = self.Id
         storable_entity = cast(StorableElement, self.model_entity)
         g.attrs['data-mid'] = storable_entity.Id
+        state = self.render_state = RenderState(**self.getRenderValues())
+        self.updateOutline(state.prime('outline', g.children[0]))
+        for s, p in port_shape_lookup.items():
+            p.updateShape(state.prime(('port', p.Id), s))
 
         # Return the group of objects
         return g
 
+    def placePorts(self) -> None:
+        """ Spread the ports evenly along the sides of the block. """
+        for orientation in [Orientations.LEFT, Orientations.RIGHT, Orientations.BOTTOM, Orientations.TOP]:
+            ports = self.sorted_ports[orientation]
+            pos_func = self.getPointPosFunc(orientation, ports)
+            for i, p in enumerate(ports):
+                p.pos = pos_func(i)
+
+    def getSymbolKey(self) -> Tuple:
+        # Where the ports are drawn only depends on the number of ports on each side.
+        layout = tuple(len(self.sorted_ports[o]) for o in Orientations)
+        return super().getSymbolKey() + (layout,)
+
+    def drawSymbol(self) -> List[Any]:
+        origin = Point(self.x, self.y)
+        return super().drawSymbol() + [Port.getOutline(p.pos - origin) for p in self.ports]
+
+    def getPortAt(self, pos: Point) -> Optional[Port]:
+        """ The port drawn at a position. Used when the ports are part of a symbol, and have no shape of their own. """
+        for p in self.ports:
+            if abs(p.pos.x - pos.x) <= 5 and abs(p.pos.y - pos.y) <= 5:
+                return p
+        return None
+
+    def bindPortNames(self, use) -> None:
+        """ Show the name of the port under the mouse, as `Port.getShape` does for the shape of a port. """
+        shown = {}
+
+        def hide_name():
+            if widget := shown.pop('widget', None):
+                widget.remove()
+
+        @bind(use, 'mousemove')
+        def show_name(ev):
+            port = self.getPortAt(shapes.getMousePos(ev))
+            if port is shown.get('port'):
+                return
+            hide_name()
+            shown['port'] = port
+            if port and use.parent:
+                shown['widget'] = port.getNameWidget()
+                use.parent <= shown['widget']
+
+        @bind(use, 'mouseleave')
+        def leave(ev):
+            hide_name()
+            shown.pop('port', None)
+
+    def sortPorts(self) -> Dict[Orientations, List[Port]]:
+        return {orientation: sorted([p for p in self.ports if p.orientation == orientation], key=lambda x: x.order) \
+                for orientation in Orientations}
+
+    def getRenderValues(self) -> Dict[str, Any]:
+        values = super().getRenderValues()
+        values['ports'] = tuple((p.Id, p.orientation, p.order) for p in self.ports)
+        return values
+
     def updateShape(self, shape=None):
         shape = shape or self.shape
+        changed = self.getRenderChanges()
+        state = self.render_state
+        if self.symbol_key is not None:
+            # The rect and the ports are part of the symbol.
+            if changed & {'pos', 'size', 'style', 'ports'}:
+                self.sorted_ports = self.sortPorts()
+                self.placePorts()
+                self.updateOutline(state.element('outline', shape.children[0]))
+            self.updateText(shape.children[1], changed)
+            return
         # Update the rect
-        rect = shape.children[0]
-        shape_type = self.getShapeDescriptor()
-        shape_type.updateShape(rect, self)
-        text = shape.children[1]
-        self.TextWidget.updateShape(text, self)
+        if changed & {'pos', 'size', 'style'}:
+            shape_type = self.getShapeDescriptor()
+            shape_type.updateShape(state.element('outline', shape.children[0]), self)
+        self.updateText(shape.children[1], changed)
 
         # Update the ports
-        sorted_ports = {orientation: sorted([p for p in self.ports if p.orientation == orientation], key=lambda x: x.order) \
-                       for orientation in Orientations}
+        if 'ports' in changed:
+            # Delete any ports no longer used
+            deleted = [s for s, p in self.port_shape_lookup.items() if p not in self.ports]
+            for s in deleted:
+                s.remove()
+                state.forget(('port', self.port_shape_lookup.pop(s).Id))
+            dom_mutations.add(len(deleted))
+            self.sorted_ports = self.sortPorts()
+        elif not changed & {'pos', 'size'}:
+            return
 
-        # Delete any ports no longer used
-        deleted = [s for s, p in self.port_shape_lookup.items() if p not in self.ports]
-        for s in deleted:
-            s.remove()
         shape_lookup = {p.Id: s for s, p in self.port_shape_lookup.items()}
-
         for orientation in [Orientations.LEFT, Orientations.RIGHT, Orientations.BOTTOM, Orientations.TOP]:
-            ports = sorted_ports[orientation]
+            ports = self.sorted_ports[orientation]
             pos_func = self.getPointPosFunc(orientation, ports)
             for i, p in enumerate(ports):
                 p.pos = pos_func(i)
                 if p.Id in shape_lookup:
-                    p.updateShape(shape_lookup[p.Id])
+                    p.updateShape(state.element(('port', p.Id), shape_lookup[p.Id]))
                 else:
                     # Get the shape for the port
                     s = p.getShape()
                     p.shape = s
                     _ = shape <= s
                     self.port_shape_lookup[s] = p
+                    dom_mutations.add()
 
     def getConnectionTarget(self, ev):
         # Determine if one of the ports was clicked on.
-        port = self.port_shape_lookup.get(ev.target, None)
+        if self.symbol_key is not None:
+            port = self.getPortAt(shapes.getMousePos(ev))
+        else:
+            port = self.port_shape_lookup.get(ev.target, None)
         if port is None:
             return self
         return port
@@ -576,8 +745,9 @@ class ModeledRelationship(Relationship, ModelRepresentation):
         storable_entity = cast(StorableElement, self.model_entity)
         self.path.attrs['data-mid'] = storable_entity.Id
 
-    def reroute(self, all_blocks):
-        super().reroute(all_blocks)
+    def reroute(self, all_blocks) -> bool:
+        if not super().reroute(all_blocks):
+            return False
         # Update the positions of the various texts according to their anchors.
         anchor_positions = {
             RelationAnchor.Start: self.terminations[0],
@@ -588,6 +758,7 @@ class ModeledRelationship(Relationship, ModelRepresentation):
             widget.setPos(widget.getPos() - self.previous_anchor_positions.get(anchor, Point(0,0)) + anchor_positions[anchor])
             widget.updateShape()
         self.previous_anchor_positions = anchor_positions
+        return True
 
     def get_db_table(cls):
         return '_RelationshipRepresentation'
@@ -633,6 +804,9 @@ class Message(ModeledShape):
     def getShapeDescriptor(self):
         return MsgShape
 
+    def drawsFromSymbol(self) -> bool:
+        return False
+
     def updateShape(self, shape=None):
         shape = shape or self.shape
         shape_type = self.getShapeDescriptor()
@@ -0,0 +1,366 @@
+"""
+Copyright© 2024 Evert van de Waal
+
+This file is part of dsmgen.
+
+Dsmgen is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+Dsmgen is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Foobar; if not, write to the Free Software
+Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+import heapq
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Optional, Any, Iterable
+from point import Point
+from spatial_index import SpatialIndex
+from square_routing import routeSquare
+
+
+Rect = Tuple[float, float, float, float]    # x, y, width, height
+
+
+@dataclass
+class Obstacle:
+    """ The area around a block that a connection is not allowed to pass through. """
+    key: Any
+    x: float
+    y: float
+    width: float
+    height: float
+    rect: Rect
+
+
+@dataclass
+class CachedRoute:
+    start: Rect
+    finish: Rect
+    corridor: Tuple[float, float, float, float]     # minx, miny, maxx, maxy
+    points: List[Point]
+
+
+def overlaps(a, b) -> bool:
+    """ Check if two boxes (minx, miny, maxx, maxy) share some area. """
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def contains(a, b) -> bool:
+    """ Check if box a completely contains box b. """
+    return a[0] <= b[0] and a[1] <= b[1] and b[2] <= a[2] and b[3] <= a[3]
+
+
+def rectBox(r: Rect, margin: float = 0) -> Tuple[float, float, float, float]:
+    return r[0]-margin, r[1]-margin, r[0]+r[2]+margin, r[1]+r[3]+margin
+
+
+class ObstacleGraph:
+    """ Route connections orthogonally around the blocks in a diagram.
+
+        Routes are found with A* over an orthogonal visibility graph: its nodes lie on the crossings of
+        the horizontal and vertical lines along the (slightly enlarged) outlines of the blocks. Only the
+        blocks in a window around the two end points contribute lines, which keeps the graph small in
+        large diagrams. When no route is found, the window is enlarged a few times before giving up.
+
+        The obstacles and the routes are kept between calls. When blocks move, only the routes whose
+        corridor (the area spanned by the connection) is touched by the old or new location of a
+        block are recalculated.
+    """
+    def __init__(self, margin: float = 10, bend_penalty: float = 20, cell_size: int = 128,
+                 window: float = 100, max_expansions: int = 5000):
+        self.margin = margin
+        self.bend_penalty = bend_penalty
+        self.window = window
+        self.max_expansions = max_expansions
+        self.index = SpatialIndex(cell_size)
+        self.obstacles: Dict[Any, Obstacle] = {}
+        self.routes: Dict[Any, CachedRoute] = {}
+        self.stats = dict(hits=0, misses=0, expanded=0)
+
+    ###########################################################################
+    ## Maintenance of the obstacles
+    def update(self, blocks: Iterable[Tuple[Any, Rect]]) -> List[Tuple[float, float, float, float]]:
+        """ Synchronise the obstacles with the blocks in a diagram.
+            `blocks` is a sequence of (key, (x, y, width, height)).
+            Returns the areas that have changed, after invalidating the routes passing through them.
+        """
+        changed = []
+        seen = set()
+        for key, rect in blocks:
+            seen.add(key)
+            current = self.obstacles.get(key)
+            if current is not None:
+                if current.rect == rect:
+                    continue
+                changed.append(self.removeObstacle(key))
+            changed.append(self.addObstacle(key, rect))
+        for key in [k for k in self.obstacles if k not in seen]:
+            changed.append(self.removeObstacle(key))
+        self.invalidate(changed)
+        return changed
+
+    def place(self, key, rect: Rect) -> None:
+        """ Add a single block, or move it when it is already known. """
+        current = self.obstacles.get(key)
+        if current is not None and current.rect == rect:
+            return
+        changed = [self.removeObstacle(key)] if current is not None else []
+        changed.append(self.addObstacle(key, rect))
+        self.invalidate(changed)
+
+    def discard(self, key) -> None:
+        """ Remove a single block, if it is known. """
+        if key in self.obstacles:
+            self.invalidate([self.removeObstacle(key)])
+
+    def invalidate(self, changed: List[Tuple[float, float, float, float]]) -> None:
+        """ Forget the routes passing through areas where the blocks changed. """
+        if changed:
+            for key in [k for k, r in self.routes.items() if any(overlaps(r.corridor, c) for c in changed)]:
+                del self.routes[key]
+
+    def addObstacle(self, key, rect: Rect):
+        box = rectBox(rect, self.margin)
+        obstacle = Obstacle(key, box[0], box[1], box[2]-box[0], box[3]-box[1], rect)
+        self.obstacles[key] = obstacle
+        self.index.add(obstacle)
+        return box
+
+    def removeObstacle(self, key):
+        obstacle = self.obstacles.pop(key)
+        self.index.remove(obstacle)
+        return rectBox(obstacle.rect, self.margin)
+
+    ###########################################################################
+    ## Routing
+    def route(self, key, start: Rect, finish: Rect) -> List[Point]:
+        """ Return the points of an orthogonal line from the start block to the finish block.
+            The result is cached under `key` until the end points or the blocks in its corridor change.
+        """
+        cached = self.routes.get(key)
+        if cached and cached.start == start and cached.finish == finish:
+            self.stats['hits'] += 1
+            return list(cached.points)
+        self.stats['misses'] += 1
+
+        points = None
+        window = self.window
+        for _ in range(3):
+            points = self.findPath(start, finish, window)
+            if points is not None:
+                break
+            window *= 4
+        if points is None:
+            # No route around the blocks could be found: fall back to a simple route.
+            points = routeSquare((Point(start[0], start[1]), Point(start[2], start[3])),
+                                 (Point(finish[0], finish[1]), Point(finish[2], finish[3])), [])
+        xs = [p.x for p in points] + [start[0], start[0]+start[2], finish[0], finish[0]+finish[2]]
+        ys = [p.y for p in points] + [start[1], start[1]+start[3], finish[1], finish[1]+finish[3]]
+        corridor = (min(xs), min(ys), max(xs), max(ys))
+        self.routes[key] = CachedRoute(start, finish, corridor, points)
+        return list(points)
+
+    def forget(self, key) -> None:
+        self.routes.pop(key, None)
+
+    def getPorts(self, rect: Rect) -> List[Tuple[Point, Point, int]]:
+        """ Return the points where a connection can leave a block: (point on the outline, exit point, direction).
+            Directions are 0 for horizontal and 1 for vertical movement.
+        """
+        x, y, w, h = rect
+        cx, cy = x + w/2, y + h/2
+        m = self.margin
+        return [(Point(x+w, cy), Point(x+w+m, cy), 0),
+                (Point(x, cy), Point(x-m, cy), 0),
+                (Point(cx, y+h), Point(cx, y+h+m), 1),
+                (Point(cx, y), Point(cx, y-m), 1)]
+
+    def isBlocked(self, x1, y1, x2, y2, ignore, tight) -> bool:
+        """ Check if a horizontal or vertical line piece passes through an obstacle.
+            Obstacles in `ignore` are skipped, for those in `tight` the margin around the block is not used.
+        """
+        minx, maxx = min(x1, x2), max(x1, x2)
+        miny, maxy = min(y1, y2), max(y1, y2)
+        for o in self.index.query(minx, miny, maxx, maxy, ordered=False):
+            if o.key in ignore:
+                continue
+            if o.key in tight:
+                ox0, oy0, ox1, oy1 = rectBox(o.rect)
+            else:
+                ox0, oy0, ox1, oy1 = o.x, o.y, o.x + o.width, o.y + o.height
+            if minx == maxx:
+                if ox0 < minx < ox1 and oy0 < maxy and miny < oy1:
+                    return True
+            elif oy0 < miny < oy1 and ox0 < maxx and minx < ox1:
+                return True
+        return False
+
+    def findPath(self, start: Rect, finish: Rect, window: float) -> Optional[List[Point]]:
+        sources = self.getPorts(start)
+        targets = self.getPorts(finish)
+
+        # Determine the area to search in, and the lines of the graph within it.
+        s_box, f_box = rectBox(start, window), rectBox(finish, window)
+        area = (min(s_box[0], f_box[0]), min(s_box[1], f_box[1]), max(s_box[2], f_box[2]), max(s_box[3], f_box[3]))
+        obstacles = self.index.query(*area, ordered=False)
+        xs = {area[0], area[2]}
+        ys = {area[1], area[3]}
+        for o in obstacles:
+            for x in [o.x, o.x+o.width]:
+                if area[0] < x < area[2]:
+                    xs.add(x)
+            for y in [o.y, o.y+o.height]:
+                if area[1] < y < area[3]:
+                    ys.add(y)
+        for _, e, _ in sources + targets:
+            xs.add(e.x)
+            ys.add(e.y)
+
+        # The margins around the blocks near the end points would close off their ports, so for these blocks
+        # only the outline itself is an obstacle. Blocks containing an end point (i.e. containers) are ignored.
+        ignore, tight = set(), set()
+        for rect in [start, finish]:
+            box = rectBox(rect)
+            for o in self.index.query(*box, ordered=False):
+                if o.rect != rect and contains(rectBox(o.rect), box):
+                    ignore.add(o.key)
+                else:
+                    tight.add(o.key)
+        boxes = []
+        for o in obstacles:
+            if o.key in ignore:
+                continue
+            if o.key in tight:
+                box = rectBox(o.rect)
+                xs.update(v for v in [box[0], box[2]] if area[0] < v < area[2])
+                ys.update(v for v in [box[1], box[3]] if area[1] < v < area[3])
+            else:
+                box = (o.x, o.y, o.x + o.width, o.y + o.height)
+            boxes.append(box)
+
+        xs, ys = sorted(xs), sorted(ys)
+        x_index = {x: i for i, x in enumerate(xs)}
+        y_index = {y: i for i, y in enumerate(ys)}
+
+        # All obstacle edges are lines in the graph, so a line piece between neighbouring nodes is either
+        # completely inside an obstacle or not at all. The parts of each line that are blocked are determined
+        # when the line is first needed.
+        blocked_parts = [{}, {}]
+        def isFree(d, line, a, b):
+            parts = blocked_parts[d].get(line)
+            if parts is None:
+                if d == 0:
+                    intervals = sorted((b[0], b[2]) for b in boxes if b[1] < line < b[3])
+                else:
+                    intervals = sorted((b[1], b[3]) for b in boxes if b[0] < line < b[2])
+                merged = []
+                for lo, hi in intervals:
+                    if merged and lo <= merged[-1][1]:
+                        merged[-1][1] = max(merged[-1][1], hi)
+                    else:
+                        merged.append([lo, hi])
+                parts = ([lo for lo, _ in merged], [hi for _, hi in merged])
+                blocked_parts[d][line] = parts
+            middle = (a + b) / 2
+            k = bisect_right(parts[0], middle) - 1
+            return k < 0 or parts[1][k] <= middle
+
+        # Ports that lie inside another obstacle can not be used.
+        def isOpen(p):
+            return not any(b[0] < p.x < b[2] and b[1] < p.y < b[3] for b in boxes)
+        sources = [(p, e, d) for p, e, d in sources if isOpen(e) and not self.isBlocked(p.x, p.y, e.x, e.y, ignore, tight)]
+        targets = [(p, e, d) for p, e, d in targets if isOpen(e) and not self.isBlocked(p.x, p.y, e.x, e.y, ignore, tight)]
+        if not (sources and targets):
+            return None
+
+        target_lookup = {(x_index[e.x], y_index[e.y]): p for p, e, _ in targets}
+        target_coords = [(e.x, e.y) for _, e, _ in targets]
+        bend_penalty = self.bend_penalty
+
+        def heuristic(x, y, d):
+            # The distance to the nearest target, plus the bend that is needed when not in line with it.
+            best = None
+            for tx, ty in target_coords:
+                estimate = abs(x-tx) + abs(y-ty)
+                if (x != tx and y != ty) or (x == tx and d == 0) or (y == ty and d == 1):
+                    estimate += bend_penalty
+                if best is None or estimate < best:
+                    best = estimate
+            return best
+
+        # A* over the states (x index, y index, direction), so that bends can be penalised.
+        queue = []
+        came_from = {}
+        best = {}
+        for p, e, d in sources:
+            state = (x_index[e.x], y_index[e.y], d)
+            best[state] = self.margin
+            came_from[state] = None
+            heapq.heappush(queue, (self.margin + heuristic(e.x, e.y, d), -self.margin, state))
+
+        end_state = None
+        expansions = 0
+        while queue:
+            # Of the states that look equally promising, the one furthest along is tried first.
+            _, cost, state = heapq.heappop(queue)
+            cost = -cost
+            if cost > best.get(state, cost):
+                continue
+            i, j, d = state
+            if (i, j) in target_lookup:
+                end_state = state
+                break
+            expansions += 1
+            if expansions > self.max_expansions:
+                break
+            x, y = xs[i], ys[j]
+            for ni, nj, nd in [(i+1, j, 0), (i-1, j, 0), (i, j+1, 1), (i, j-1, 1)]:
+                if ni < 0 or nj < 0 or ni >= len(xs) or nj >= len(ys):
+                    continue
+                nx, ny = xs[ni], ys[nj]
+                if not (isFree(0, y, x, nx) if nd == 0 else isFree(1, x, y, ny)):
+                    continue
+                new_cost = cost + abs(nx-x) + abs(ny-y) + (bend_penalty if nd != d else 0)
+                new_state = (ni, nj, nd)
+                if new_cost < best.get(new_state, new_cost + 1):
+                    best[new_state] = new_cost
+                    came_from[new_state] = state
+                    heapq.heappush(queue, (new_cost + heuristic(nx, ny, nd), -new_cost, new_state))
+        self.stats['expanded'] += expansions
+
+        if end_state is None:
+            return None
+
+        # Reconstruct the path, from the finish back to the start.
+        path = [target_lookup[end_state[:2]]]
+        state = end_state
+        while state is not None:
+            path.append(Point(xs[state[0]], ys[state[1]]))
+            state = came_from[state]
+        start_exit = path[-1]
+        port = [p for p, e, _ in sources if (e.x, e.y) == (start_exit.x, start_exit.y)][0]
+        path.append(port)
+        path.reverse()
+        return simplify(path)
+
+
+def simplify(points: List[Point]) -> List[Point]:
+    """ Remove the points that lie in the middle of a straight line piece. """
+    result = [points[0]]
+    for p, n in zip(points[1:-1], points[2:]):
+        prev = result[-1]
+        if (prev.x == p.x == n.x) or (prev.y == p.y == n.y):
+            continue
+        if p.x == prev.x and p.y == prev.y:
+            continue
+        result.append(p)
+    result.append(points[-1])
+    return result
@@ -0,0 +1,168 @@
+"""
+Copyright© 2024 Evert van de Waal
+
+This file is part of dsmgen.
+
+Dsmgen is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+Dsmgen is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Foobar; if not, write to the Free Software
+Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+"""
+Parsing SVG paths once, so they can be drawn at different positions and sizes without parsing them again.
+
+A path is compiled into a string of command letters and a flat list of absolute co-ordinates.
+All commands are reduced to M, L, C, Q and Z, so the co-ordinates always come in (x, y) pairs.
+"""
+import math
+import re
+from typing import Generator, List, Optional, Tuple
+from point import Point
+
+# The number of arguments of each command.
+argument_counts = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'Z': 0}
+
+token_re = re.compile(r'[A-Za-z]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+def tokenize(d: str) -> Generator[Tuple[str, List[float]], None, None]:
+    """ Split a path into its commands and their arguments.
+        Repeated arguments are returned as separate commands. After a move, these are lines.
+    """
+    command = None
+    arguments = []
+    for token in token_re.findall(d):
+        if token.isalpha():
+            if token.upper() not in argument_counts:
+                raise ValueError(f"Unsupported path command '{token}'")
+            command = token
+            arguments = []
+            if command in 'Zz':
+                yield command, []
+            continue
+        if command is None:
+            raise ValueError("A path must start with a command")
+        arguments.append(float(token))
+        if len(arguments) == argument_counts[command.upper()]:
+            yield command, arguments
+            arguments = []
+            command = {'M': 'L', 'm': 'l'}.get(command, command)
+
+
+class CompiledPath:
+    """ A path parsed into absolute co-ordinates.
+
+        `commands` holds one letter for each segment, `values` holds the co-ordinates of all segments as
+        x, y, x, y, ...  The number of values of a segment follows from its command, see `value_counts`.
+    """
+    value_counts = {'M': 2, 'L': 2, 'C': 6, 'Q': 4, 'Z': 0}
+
+    def __init__(self, d: str):
+        commands = []
+        values: List[float] = []
+        # The points the pen passes, including the point a Z closes the path to.
+        trace: List[float] = []
+        x = y = 0.0
+        start = (0.0, 0.0)
+        control = None          # The last control point, for the smooth curves S and T.
+        for command, args in tokenize(d):
+            absolute = command.upper()
+            if command.islower():
+                # Make the co-ordinates absolute.
+                if absolute == 'H':
+                    args = [args[0] + x]
+                elif absolute == 'V':
+                    args = [args[0] + y]
+                else:
+                    args = [a + (y if i % 2 else x) for i, a in enumerate(args)]
+            if absolute == 'H':
+                absolute, args = 'L', [args[0], y]
+            elif absolute == 'V':
+                absolute, args = 'L', [x, args[0]]
+            elif absolute in 'ST':
+                # A smooth curve starts with the reflection of the previous control point.
+                reflected = [2*x - control[0], 2*y - control[1]] if control else [x, y]
+                absolute, args = {'S': 'C', 'T': 'Q'}[absolute], reflected + args
+
+            if absolute == 'Z':
+                x, y = start
+                trace.extend(start)
+            else:
+                x, y = args[-2], args[-1]
+                if absolute == 'M':
+                    start = (x, y)
+            control = args[-4:-2] if absolute in 'CQ' else None
+            commands.append(absolute)
+            values.extend(args)
+            trace.extend(args)
+
+        self.commands = ''.join(commands)
+        self.values = values
+        self.trace = trace
+        # Drawing a path writes the transformed co-ordinates into this buffer, so no new lists are made.
+        self.buffer = [0.0] * len(values)
+        fields = []
+        for c in self.commands:
+            fields.append(c)
+            fields.extend(['{},{}'] * (self.value_counts[c] // 2))
+        self.template = ' '.join(fields)
+
+    def points(self) -> List[Point]:
+        """ All points in the path, including the control points of curves. """
+        return [Point(self.values[i], self.values[i+1]) for i in range(0, len(self.values), 2)]
+
+    def nodes(self) -> Generator[Tuple[float, float], None, None]:
+        """ The end points of the segments, i.e. the points the path actually passes through. """
+        i = 0
+        for c in self.commands:
+            i += self.value_counts[c]
+            if i:
+                yield self.values[i-2], self.values[i-1]
+
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """ Return the box (xmin, ymin, xmax, ymax) around the end points of all segments.
+            Curves can bulge slightly outside this box: their control points are not included.
+        """
+        xs, ys = zip(*self.nodes())
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def origin(self) -> Tuple[Point, float]:
+        """ The first point of a path and the direction it takes from there, in radians.
+            A path with a single point has direction 0.
+        """
+        v = self.trace or [0.0, 0.0]
+        if len(v) < 4:
+            return Point(v[0], v[1]), 0.0
+        return Point(v[0], v[1]), math.atan2(v[3] - v[1], v[2] - v[0])
+
+    def ending(self) -> Tuple[Point, float]:
+        """ The last point of a path and the direction back into the path, in radians.
+            For a closed path, this is the point it closes to. A path with a single point has direction 0.
+        """
+        v = self.trace or [0.0, 0.0]
+        if len(v) < 4:
+            return Point(v[-2], v[-1]), 0.0
+        return Point(v[-2], v[-1]), math.atan2(v[-3] - v[-1], v[-4] - v[-2])
+
+    def transform(self, sx: float, sy: float, tx: float, ty: float, buffer: Optional[List[float]] = None) -> List[float]:
+        """ Scale and translate all co-ordinates, into `buffer` or the buffer of the path. """
+        buffer = self.buffer if buffer is None else buffer
+        values = self.values
+        for i in range(0, len(values), 2):
+            buffer[i] = values[i] * sx + tx
+            buffer[i+1] = values[i+1] * sy + ty
+        return buffer
+
+    def render(self, sx: float = 1.0, sy: float = 1.0, tx: float = 0.0, ty: float = 0.0) -> str:
+        """ Return the `d` attribute for the scaled and translated path. """
+        return self.template.format(*self.transform(sx, sy, tx, ty))
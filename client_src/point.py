@@ -24,6 +24,14 @@ from typing import List, Tuple, Self
 
 @dataclass
 class Point:
+    """ A 2D point or vector.
+
+        Points are created in large numbers while routing and dragging, so they have no `__dict__`.
+        The operators return new points. In hot loops, the `iadd`, `isub` and `iscale` methods
+        can be used to update a point in place. Note that `+=` still creates a new point, as points
+        are often shared (e.g. the waypoints of a connection).
+    """
+    __slots__ = ('x', 'y')
     x: float
     y: float
     def __str__(self) -> str:
@@ -58,6 +66,69 @@ class Point:
         return Point(x=c*self.x-s*self.y, y=s*self.x+c*self.y)
     def __json__(self) -> Tuple[float, float]:
         return self.astuple()
+    def set(self, x: float, y: float) -> Self:
+        self.x = x
+        self.y = y
+        return self
+    def iadd(self, other) -> Self:
+        self.x += other.x
+        self.y += other.y
+        return self
+    def isub(self, other) -> Self:
+        self.x -= other.x
+        self.y -= other.y
+        return self
+    def iscale(self, scalar) -> Self:
+        self.x *= scalar
+        self.y *= scalar
+        return self
+
+
+# Routines that work on a flat list of co-ordinates [x0, y0, x1, y1, ...] instead of a list of Points.
+# They are used where many points are handled at once, e.g. for the points of a path.
+
+def flatten(points: List[Point]) -> List[float]:
+    coords = []
+    for p in points:
+        coords.append(p.x)
+        coords.append(p.y)
+    return coords
+
+def unflatten(coords: List[float]) -> List[Point]:
+    return [Point(coords[i], coords[i+1]) for i in range(0, len(coords), 2)]
+
+def translate(coords: List[float], dx: float, dy: float) -> List[float]:
+    """ Move all co-ordinates, in place. """
+    for i in range(0, len(coords), 2):
+        coords[i] += dx
+        coords[i+1] += dy
+    return coords
+
+def bounding_box(coords: List[float]) -> Tuple[float, float, float, float]:
+    """ Return (xmin, ymin, xmax, ymax) for the co-ordinates. """
+    xs, ys = coords[0::2], coords[1::2]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def path_string(coords: List[float]) -> str:
+    """ Return the SVG path description for a line through the co-ordinates. """
+    parts = [f"L {coords[i]} {coords[i+1]}" for i in range(2, len(coords), 2)]
+    return f"M {coords[0]} {coords[1]} " + ' '.join(parts)
+
+def nearest_segment(coords: List[float], x: float, y: float) -> int:
+    """ Return the index of the line segment closest to (x, y).
+        Points that are not alongside a segment are not considered to be near it.
+        Returns -1 if there is no such segment.
+    """
+    best, index = inf, -1
+    for i in range(0, len(coords)-2, 2):
+        ax, ay, bx, by = coords[i], coords[i+1], coords[i+2], coords[i+3]
+        vx, vy = bx - ax, by - ay
+        if vx*(x-ax) + vy*(y-ay) < 0 or vx*(bx-x) + vy*(by-y) < 0:
+            continue
+        d = abs(vy*(x-ax) - vx*(y-ay))
+        if d < best:
+            best, index = d, i // 2
+    return index
 
 def load_waypoints(s: str) -> List[Point]:
     """ The Brython JSON decoder doesn't handle infinity, so we need a workaround. """
@@ -252,11 +252,11 @@ def createDefault(dcls):
     return dcls(**default)
 
 
-def createPortEditor(o: ModelEntity, field, port_types, data_store: DataStore):
+def createPortEditor(o: ModelEntity, name: str, port_types, data_store: DataStore):
     div = html.DIV()
     table = html.TABLE()
     table.className = 'porttable'
-    _ = div <= mk_collapsable(field.name, table)
+    _ = div <= mk_collapsable(name, table)
 
     def bindRowToEditor(row: DOMNode, item: ModelEntity, delete: DOMNode):
         row.bind('click', lambda ev: editDialog(item))
@@ -380,8 +380,7 @@ def dataClassEditorForm(o: PropertyEditable, editable_fields: List[EditableParam
 
     port_types = o.getModelEntity().get_allowed_ports() if o else []
     if port_types and data_store and ((not o.isStylable()) or o.category != ReprCategory.block_instance):
-        f = [f for f in fields(o) if f.name == 'ports'][0]
-        _ = form <= createPortEditor(o.getModelEntity(), f, port_types, data_store)
+        _ = form <= createPortEditor(o.getModelEntity(), 'ports', port_types, data_store)
     return form
 
 def stylingEditorForm(o: PropertyEditable):
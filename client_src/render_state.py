@@ -0,0 +1,108 @@
+"""
+Copyright© 2024 Evert van de Waal
+
+This file is part of dsmgen.
+
+Dsmgen is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+Dsmgen is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Foobar; if not, write to the Free Software
+Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+from typing import Any, Dict, Hashable, Set
+
+MISSING = object()
+
+
+class MutationCounter:
+    """ Counts the changes made to the DOM when updating shapes, so that tests can check updates stay small. """
+    def __init__(self):
+        self.count = 0
+
+    def add(self, nr: int = 1) -> None:
+        self.count += nr
+
+    def reset(self) -> int:
+        """ Return the number of mutations since the last reset. """
+        count, self.count = self.count, 0
+        return count
+
+
+dom_mutations = MutationCounter()
+
+
+class RetainedElement:
+    """ Wraps an SVG element, and only writes the attributes that changed since they were last written.
+        The shape descriptors in svg_shapes can update a RetainedElement like a regular element.
+        With `primed`, values the element already has are recorded without writing them, see `RenderState.prime`.
+    """
+    def __init__(self, element, written: Dict[Any, Any], primed: bool = False):
+        self.element = element
+        self.written = written
+        self.primed = primed
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self.written.get(key, MISSING) != value:
+            self.written[key] = value
+            if not (self.primed and self.hasValue(key, value)):
+                self.element[key] = value
+                dom_mutations.add()
+
+    def hasValue(self, key: str, value: Any) -> bool:
+        """ Check if the element already has a value for an attribute. """
+        current = self.element.attrs.get(key)
+        return current is not None and str(current) == str(value)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.element[key]
+
+    @property
+    def children(self):
+        # The values written to children are stored under the index of the child.
+        return [RetainedElement(c, self.written.setdefault(('child', i), {}), self.primed)
+                for i, c in enumerate(self.element.children)]
+
+    def __getattr__(self, name):
+        return getattr(self.element, name)
+
+
+class RenderState:
+    """ The values a shape was last drawn with.
+
+        A shape stores the values its SVG elements depend on, like position, size, text and style.
+        When updating, `changes` reports which of these changed, so only the affected elements are updated.
+        The attributes written to each element are kept as well, see `RetainedElement`.
+    """
+    def __init__(self, **values):
+        self.values: Dict[str, Any] = values
+        self.elements: Dict[Hashable, Dict[Any, Any]] = {}
+        self.last_changes: Set[str] = set()
+
+    def changes(self, **values) -> Set[str]:
+        changed = {k for k, v in values.items() if self.values.get(k, MISSING) != v}
+        self.values.update(values)
+        self.last_changes = changed
+        return changed
+
+    def element(self, slot: Hashable, element) -> RetainedElement:
+        """ Return a wrapper for an element. The `slot` identifies the element within the shape. """
+        return RetainedElement(element, self.elements.setdefault(slot, {}))
+
+    def prime(self, slot: Hashable, element) -> RetainedElement:
+        """ Return a wrapper for an element that was just created. Use it to run the update function of the
+            element once. The values written are recorded, but only those the element was not created with
+            are written to it: the function creating an element can compute some values differently.
+        """
+        return RetainedElement(element, self.elements.setdefault(slot, {}), primed=True)
+
+    def forget(self, slot: Hashable) -> None:
+        """ Called when the element in a slot is replaced or removed. """
+        self.elements.pop(slot, None)
@@ -24,13 +24,16 @@ import math
 from math import inf
 from dataclasses import dataclass, field
 import json
-from typing import List, Dict, Self, Optional, Type, Callable
+from typing import List, Dict, Self, Optional, Type, Callable, Tuple
 from square_routing import routeSquare
-from point import Point
-from svg_shapes import (BasicShape, renderText, VAlign, HAlign, line_patterns, path_ending, path_origin, Box, Square,
-                        Rect)
+from orthogonal_routing import ObstacleGraph
+from batch_routing import getIntersection, routeCenterToCenter
+from point import Point, flatten, nearest_segment
+from svg_shapes import (BasicShape, renderText, placeText, VAlign, HAlign, line_patterns, path_ending, path_origin, Box, Square,
+                        Rect, text_style_items, connection_style_items)
 from storable_element import StorableElement
 from copy import copy
+from instrumentation import profiler
 
 # CSS class given to all handles shapes are decorated with.
 handle_class = 'line_handle'
@@ -72,24 +75,40 @@ class HIDDEN:
     def __init__(self, t):
         self.type = t
 
+class TextWidget(BasicShape):
+    """ Draws the text of a shape, which is obtained from the attribute `text_attr` of its details. """
+    style_items = dict(text_style_items)
+    text_attr = 'text'
+    @classmethod
+    def getShape(cls, details):
+        # The text lines are wrapped in a group.
+        g = svg.g()
+        _ = g <= renderText(getattr(details, cls.text_attr, ''), details)
+        return g
+    @classmethod
+    def updateShape(cls, shape, details):
+        # Simply delete the previous text and write anew.
+        shape.clear()
+        _ = shape <= renderText(getattr(details, cls.text_attr, ''), details)
+    @classmethod
+    def moveShape(cls, shape, details):
+        """ Only update the position of the lines. Can be used if the text and its layout did not change.
+            `shape` is the RetainedElement for the text group.
+        """
+        for line, (_, x, y) in zip(shape.children, placeText(getattr(details, cls.text_attr, ''), details)):
+            line['x'], line['y'] = x, y
+
+# The text widgets by the attribute they show, see `Text`.
+text_widgets = {'text': TextWidget}
+
 def Text(text_attr):
     """ Depending on the shape, the text is obtained from any attribute in the details.
         So we make the text widget available though a function that bind it to an attribute.
+        The widget for each attribute is defined once, as defining a shape type registers it.
     """
-    class TextWidget(BasicShape):
-        style_items = dict(font='Arial', fontsize='16', textcolor='#000000', xmargin=2, ymargin=2, halign=HAlign.CENTER, valign=VAlign.CENTER)
-        @classmethod
-        def getShape(cls, details):
-            # The text lines are wrapped in a group.
-            g = svg.g()
-            _ = g <= renderText(getattr(details, text_attr, ''), details)
-            return g
-        @classmethod
-        def updateShape(cls, shape, details):
-            # Simply delete the previous text and write anew.
-            shape.clear()
-            _ = shape <= renderText(getattr(details, text_attr, ''), details)
-    return TextWidget
+    if text_attr not in text_widgets:
+        text_widgets[text_attr] = type(f'TextWidget_{text_attr}', (TextWidget,), {'text_attr': text_attr})
+    return text_widgets[text_attr]
 
 class UpdateType(enum.IntEnum):
     add = enum.auto()
@@ -134,15 +153,11 @@ class OwnerInterface:
                 owner = self.owner()
                 return owner.evaluateOwnership(widget, pos, ex_owner)
         # Check if this widget is actually dropped on a child container.
-        containers: List[OwnerInterface] = [c for c in self.get_children() if isinstance(c, OwnerInterface)]
+        containers: List[OwnerInterface] = [c for c in self.getChildrenAt(pos) if isinstance(c, OwnerInterface)]
         for c in containers:
             # A container can not contain itself
             if c is widget:
                 continue
-            c_pos = c.getPos()
-            c_size = c.getSize()
-            if pos.x < c_pos.x or pos.x > c_pos.x+c_size.x or pos.y < c_pos.y or pos.y > c_pos.y+c_size.y:
-                continue
             # The release point is inside this container. Make it the owner.
             return c.evaluateOwnership(widget, pos, self)
 
@@ -151,11 +166,34 @@ class OwnerInterface:
             # If we already were the owner, do nothing.
             if owner == self:
                 return
-            owner.children.remove(widget)
+            owner.detachChild(widget)
             widget.delete()
-        self.get_children().append(widget)
+        self.attachChild(widget)
         widget.create(self)
 
+    def getChildrenAt(self, pos: Point) -> List[Type[Self]]:
+        """ Return the children whose outline contains the given point. """
+        result = []
+        for c in self.get_children():
+            c_pos = c.getPos()
+            c_size = c.getSize()
+            if pos.x < c_pos.x or pos.x > c_pos.x+c_size.x or pos.y < c_pos.y or pos.y > c_pos.y+c_size.y:
+                continue
+            result.append(c)
+        return result
+
+    def attachChild(self, widget) -> None:
+        self.get_children().append(widget)
+
+    def detachChild(self, widget) -> None:
+        children = self.get_children()
+        if widget in children:
+            children.remove(widget)
+
+    def childGeometryChanged(self, widget) -> None:
+        """ Called by a child shape when it was moved or resized. """
+        pass
+
     def load_diagram(self):
         """ Some diagrams can load data from a data source. """
         pass
@@ -232,6 +270,7 @@ class Shape(Stylable, StorableElement):
     def __post_init__(self):
         self.shape = None
         self.highlight_shape = None
+        self.render_state = None
         self.subscribers = {}
 
         if not isinstance(self.styling, dict):
@@ -247,20 +286,29 @@ class Shape(Stylable, StorableElement):
         return Point(x=self.x, y=self.y)
     def setPos(self, new: Point):
         self.x, self.y = new.astuple()
-        self.updateShape(self.shape)
+        if self.shape is not None:
+            self.updateShape(self.shape)
         if self.highlight_shape:
             self.highlight_shape.attrs['x'] = self.x
             self.highlight_shape.attrs['y'] = self.y
+        self.notifyGeometryChange()
         for s in self.subscribers.values():
             s(self)
     def getSize(self) -> Point:
         return Point(x=self.width, y=self.height)
     def setSize(self, new: Point):
         self.width, self.height = new.astuple()
-        self.updateShape(self.shape)
+        if self.shape is not None:
+            self.updateShape(self.shape)
         if self.highlight_shape:
             self.highlight_shape.attrs['width'] = self.width
             self.highlight_shape.attrs['height'] = self.height
+        self.notifyGeometryChange()
+
+    def notifyGeometryChange(self):
+        """ Let the owner know this shape has moved or was resized, e.g. to keep its spatial index up to date. """
+        if self.owner and (owner := self.owner()):
+            owner.childGeometryChanged(self)
 
     def getShape(self):
         shape_type = self.getShapeDescriptor()
@@ -272,7 +320,8 @@ class Shape(Stylable, StorableElement):
         shape_type.updateShape(shape, self)
 
     def delete(self):
-        self.shape.remove()
+        if self.shape is not None:
+            self.shape.remove()
 
     def subscribe(self, role, f):
         self.subscribers[role] = f
@@ -334,17 +383,7 @@ class Shape(Stylable, StorableElement):
         return self.getPos() + self.getSize()/2
 
     def getIntersection(self, b):
-        halfsize = self.getSize()/2
-        a = self.getCenter()
-        delta = b - a
-        if abs(delta.x) > 1:
-            rc = delta.y / delta.x
-            i_left = Point(math.copysign(halfsize.x, delta.x), math.copysign(rc*halfsize.x, delta.y))
-            if abs(i_left.y) < halfsize.y:
-                return i_left + a
-        rc = delta.x / delta.y
-        i_top = Point(math.copysign(rc*halfsize.y, delta.x), math.copysign(halfsize.y, delta.y))
-        return i_top + a
+        return getIntersection(self.getPos(), self.getSize(), b)
 
     def getConnectionTarget(self, ev):
         """ Determine if the user clicked on a child like a port """
@@ -358,7 +397,9 @@ class Shape(Stylable, StorableElement):
         values = json.loads(values_json)
         for key, value in values.items():
             setattr(self, key, value)
-        self.updateShape(self.shape)
+        if self.shape is not None:
+            self.updateShape(self.shape)
+        self.notifyGeometryChange()
 
     def load(self, diagram):
         diagram.addBlock(self)
@@ -439,8 +480,29 @@ class CP:
     def onDrag(self):
         pass
 
+class RouteCacheStatistics:
+    """ Counts how often connections could keep their previous route, to diagnose the performance of dragging. """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self) -> Tuple[int, int]:
+        """ Return the number of (hits, misses) since the last reset. """
+        result = (self.hits, self.misses)
+        self.hits = self.misses = 0
+        return result
+
+    def __str__(self):
+        return f'Route cache: {self.hits} hits, {self.misses} misses'
+
+
+route_cache_stats = RouteCacheStatistics()
+
+
 class RoutingStrategy:
     name: str = ""
+    # A route that only depends on the two blocks and the waypoints can be re-used while these do not change.
+    cacheable: bool = True
     def decorate(self, connection, canvas):
         raise NotImplementedError()
     def clear_decorations(self):
@@ -455,7 +517,11 @@ class RoutingStrategy:
         pass
     @staticmethod
     def name_lookup() -> Dict[str, type]:
-        return {cls.name: cls for cls in RoutingStrategy.__subclasses__()}
+        def subclasses(cls):
+            for sub in cls.__subclasses__():
+                yield sub
+                yield from subclasses(sub)
+        return {cls.name: cls for cls in subclasses(RoutingStrategy)}
 
 class RouteCenterToCenter(RoutingStrategy):
     name = 'center2center'
@@ -511,13 +577,10 @@ class RouteCenterToCenter(RoutingStrategy):
         self.decorators = []
 
     def route(self, shape, all_blocks):
-        # Determine the centers of both blocks
-        c_a = shape.start.getCenter()
-        c_b = shape.finish.getCenter()
-
         # Get the points where the line intersects both blocks
-        i_a = shape.start.getIntersection(c_b if not shape.waypoints else shape.waypoints[0])
-        i_b = shape.finish.getIntersection(c_a if not shape.waypoints else shape.waypoints[-1])
+        i_a, *_, i_b = routeCenterToCenter((shape.start.getPos(), shape.start.getSize()),
+                                           (shape.finish.getPos(), shape.finish.getSize()),
+                                           shape.waypoints)
 
         # Move the line
         waypoints = ''.join(f'L {p.x} {p.y} ' for p in shape.waypoints)
@@ -644,7 +707,11 @@ class RouteSquare(RoutingStrategy):
         shape.points = routeSquare((shape.start.getPos(), shape.start.getSize()),
                                    (shape.finish.getPos(), shape.finish.getSize()),
                                    shape.waypoints)
+        self.drawPoints(shape)
 
+    @staticmethod
+    def drawPoints(shape):
+        """ Update the path of a connection to follow its `points`. """
         waypoints = ''.join(f'L {p.x} {p.y} ' for p in shape.points[1:])
         start, end = shape.points[0], shape.points[-1]
         shape.path['d'] = f"M {start.x} {start.y} {waypoints}"
@@ -652,6 +719,36 @@ class RouteSquare(RoutingStrategy):
         shape.terminations = (start, end, (start+end)/2)
 
 
+def obstacleRect(block) -> Tuple[float, float, float, float]:
+    """ The area of a block in an `ObstacleGraph`. """
+    return block.x, block.y, block.width, block.height
+
+
+class RouteAroundBlocks(RouteSquare):
+    """ Squared lines that go around the other blocks in the diagram.
+        When the user has added waypoints, these determine the route like with the `square` router.
+    """
+    name = 'orthogonal'
+    # The route goes around all other blocks, so it can change when any of them moves.
+    cacheable = False
+
+    def route(self, shape, all_blocks):
+        owner = shape.owner
+        graph = getattr(owner, 'obstacle_graph', None)
+        if graph is None and all_blocks:
+            # The diagram keeps the graph up to date when blocks are added, moved or removed (see `Diagram`),
+            # so the blocks are only added here when the graph is created.
+            graph = owner.obstacle_graph = ObstacleGraph()
+            graph.update((id(b), obstacleRect(b)) for b in all_blocks)
+        if shape.waypoints or graph is None:
+            super().route(shape, all_blocks)
+            return
+        start = shape.start.getPos().astuple() + shape.start.getSize().astuple()
+        finish = shape.finish.getPos().astuple() + shape.finish.getSize().astuple()
+        shape.points = graph.route(id(shape), start, finish)
+        self.drawPoints(shape)
+
+
 @dataclass
 class Relationship(Stylable):
     start: Shape = None
@@ -661,7 +758,7 @@ class Relationship(Stylable):
     z: float = 0.0
     order: int = 0
     styling: dict = field(default_factory=dict)
-    default_style = dict(linecolor='#000000', linewidth='2', endmarker='arrow', startmarker='', routing_method='square')
+    default_style = dict(connection_style_items)
 
     def __hash__(self):
         return id(self)
@@ -673,6 +770,11 @@ class Relationship(Stylable):
         self.points: Optional[List[Point]] = None
         self.owner: Optional[OwnerInterface] = None
         self.terminations: List[Point] = []
+        # The SVG elements, created by `route`.
+        self.path = None
+        self.selector = None
+        # The geometry the current route was calculated for, see `getRouteKey`.
+        self.route_key = None
 
     @property
     def canvas(self):
@@ -695,23 +797,7 @@ class Relationship(Stylable):
         # Find the spot to insert the waypoint.
         # We insert it where the distance to the line between the two adjacent points is smallest
         allpoints = [self.terminations[0]] + self.waypoints + [self.terminations[1]]
-        adjacents = zip(allpoints[:-1], allpoints[1:])
-        distances = []
-        for a, b in adjacents:
-            v = b - a
-            vmin = a - b
-            n = Point(x=v.y, y=-v.x)
-            d1 = pos - a
-            d2 = pos - b
-            # Check if the point is "behind" the segment
-            # These we give infinite distance
-            if v.dot(d1) < 0 or vmin.dot(d2) < 0:
-                distances.append(math.inf)
-            else:
-                distances.append(abs(n.dot(d1)))
-        # Find the smallest distance
-        minimum = min(distances)
-        index = distances.index(minimum)
+        index = max(0, nearest_segment(flatten(allpoints), pos.x, pos.y))
         self.waypoints.insert(index, pos)
         return index
 
@@ -724,7 +810,21 @@ class Relationship(Stylable):
 
         self.reroute(all_blocks)
 
-    def reroute(self, all_blocks):
+    def getRouteKey(self, method_name: str) -> Tuple:
+        """ The details that determine the route of this connection. """
+        return (method_name, id(self.start), self.start.getPos().astuple(), self.start.getSize().astuple(),
+                id(self.finish), self.finish.getPos().astuple(), self.finish.getSize().astuple(),
+                tuple(p.astuple() for p in self.waypoints))
+
+    def reroute(self, all_blocks) -> bool:
+        """ Update the path of the connection. Returns False if the connection did not need to be re-routed. """
+        method_name = self.getStyle('routing_method', 'square')
+        route_key = self.getRouteKey(method_name)
+        if route_key == self.route_key:
+            route_cache_stats.hits += 1
+            return False
+        route_cache_stats.misses += 1
+
         if self.points:
             first_point = copy(self.points[0])
             last_point = copy(self.points[-1])
@@ -732,7 +832,6 @@ class Relationship(Stylable):
             first_point = None
             last_point = None
 
-        method_name = self.getStyle('routing_method', 'square')
         router_cls = RoutingStrategy.name_lookup().get(method_name, RouteSquare)
         if type(self.router) != router_cls:
             # If this is NOT the first time routing, erase all waypoints.
@@ -740,7 +839,12 @@ class Relationship(Stylable):
                 self.waypoints = []
             self.router = router_cls()
 
-        self.router.route(self, all_blocks)
+        if profiler.enabled:
+            with profiler.measure(self.router.name, 'routing'):
+                self.router.route(self, all_blocks)
+        else:
+            self.router.route(self, all_blocks)
+        self.route_key = self.getRouteKey(method_name) if self.router.cacheable else None
         if first_point is not None:
             first_delta = self.points[0] - first_point
             last_delta = self.points[-1] - last_point
@@ -756,11 +860,13 @@ class Relationship(Stylable):
                 # Linked to the last point
                 m.setPos(m.getPos() + last_delta)
             m.updateShape()
+        return True
 
     def route(self, all_blocks):
         """ Create the graphical elements of a connection, but leave the actual route empty.
             `reroute` needs to be called to actually define the path (attribute `d`) taken by the connection.
         """
+        self.route_key = None
         # Create the line
         details = dict(d="", stroke=self.getStyle('linecolor'), stroke_width=self.getStyle('linewidth'),
                              marker_end=f"url('#{self.getStyle('endmarker')}')",
@@ -780,6 +886,9 @@ class Relationship(Stylable):
         _ = self.owner.get_canvas() <= self.path
 
     def delete(self):
+        # A connection in a large diagram is not drawn until it is scrolled into view.
+        if self.path is None:
+            return
         self.selector.remove()
         self.path.remove()
 
@@ -874,13 +983,13 @@ class Container(Shape, OwnerInterface):
                 wp = [p for p in c.waypoints
                       if self.x <= p.x <= self.x + self.width and self.y <= p.y <= self.y + self.height]
             for p in wp:
-                p.x += delta.x
-                p.y += delta.y
+                p.iadd(delta)
 
         # Re-route any relationships to the children
         for c in connections:
             # For now, routing does not automatically avoid blocks.
-            c.reroute([])
+            if c.path is not None:
+                c.reroute([])
 
         # Set the new position of this shape
         super().setPos(new)
@@ -0,0 +1,124 @@
+"""
+Copyright© 2024 Evert van de Waal
+
+This file is part of dsmgen.
+
+Dsmgen is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+Dsmgen is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Foobar; if not, write to the Free Software
+Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+from typing import Any, Dict, List, Tuple
+from point import Point
+
+
+CellRange = Tuple[int, int, int, int]
+
+
+class SpatialIndex:
+    """ A uniform grid over the bounding boxes of the shapes in a diagram.
+
+        Diagrams need to find the blocks at a location, e.g. when a block is dropped into a container
+        or when an area is selected. Scanning all blocks for this becomes noticeable in large diagrams,
+        so the blocks are bucketed into square cells and a query only checks the cells it overlaps.
+
+        Shapes are not hashable (they are dataclasses), so the index keys on their identity.
+    """
+    def __init__(self, cell_size: int = 128):
+        self.cell_size = cell_size
+        # For each cell, the items that overlap it, keyed by item identity.
+        self.cells: Dict[Tuple[int, int], Dict[int, Any]] = {}
+        # For each item: the item itself, the range of cells it is stored in and its insertion order.
+        self.items: Dict[int, Tuple[Any, CellRange, int]] = {}
+        self.counter = 0
+
+    def __contains__(self, item) -> bool:
+        return id(item) in self.items
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @staticmethod
+    def getBox(item) -> Tuple[float, float, float, float]:
+        """ Return the bounding box of an item as (minx, miny, maxx, maxy) """
+        x, y = item.x or 0, item.y or 0
+        return x, y, x + (item.width or 0), y + (item.height or 0)
+
+    def getCellRange(self, minx, miny, maxx, maxy) -> CellRange:
+        s = self.cell_size
+        return int(minx // s), int(miny // s), int(maxx // s), int(maxy // s)
+
+    def cellsIn(self, cell_range: CellRange):
+        cx0, cy0, cx1, cy1 = cell_range
+        for cx in range(cx0, cx1+1):
+            for cy in range(cy0, cy1+1):
+                yield cx, cy
+
+    def add(self, item) -> None:
+        """ Add an item to the index, or update its location if it was already added. """
+        if id(item) in self.items:
+            self.update(item)
+            return
+        cell_range = self.getCellRange(*self.getBox(item))
+        for key in self.cellsIn(cell_range):
+            self.cells.setdefault(key, {})[id(item)] = item
+        self.items[id(item)] = (item, cell_range, self.counter)
+        self.counter += 1
+
+    def remove(self, item) -> None:
+        if id(item) not in self.items:
+            return
+        _, cell_range, _ = self.items.pop(id(item))
+        for key in self.cellsIn(cell_range):
+            cell = self.cells.get(key)
+            if cell is None:
+                continue
+            cell.pop(id(item), None)
+            if not cell:
+                del self.cells[key]
+
+    def update(self, item) -> None:
+        """ Called when an item has moved or was resized. Items that are not in the index are ignored. """
+        if id(item) not in self.items:
+            return
+        _, old_range, order = self.items[id(item)]
+        new_range = self.getCellRange(*self.getBox(item))
+        if new_range == old_range:
+            return
+        self.remove(item)
+        for key in self.cellsIn(new_range):
+            self.cells.setdefault(key, {})[id(item)] = item
+        self.items[id(item)] = (item, new_range, order)
+
+    def clear(self) -> None:
+        self.cells = {}
+        self.items = {}
+
+    def query(self, minx, miny, maxx, maxy, ordered=True) -> List[Any]:
+        """ Return the items whose bounding box overlaps the given area, in the order they were added. """
+        candidates = {}
+        for key in self.cellsIn(self.getCellRange(minx, miny, maxx, maxy)):
+            candidates.update(self.cells.get(key, {}))
+        result = []
+        for item in candidates.values():
+            x0, y0, x1, y1 = self.getBox(item)
+            if x1 < minx or x0 > maxx or y1 < miny or y0 > maxy:
+                continue
+            result.append(item)
+        if ordered:
+            result.sort(key=lambda i: self.items[id(i)][2])
+        return result
+
+    def queryPoint(self, pos: Point) -> List[Any]:
+        """ Return the items whose bounding box contains the given point. """
+        return self.query(pos.x, pos.y, pos.x, pos.y)
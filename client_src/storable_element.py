@@ -46,10 +46,28 @@ class ReprCategory(IntEnum):
     laned_instance = auto()
 
 
+# The names of the fields of each dataclass, see `field_names`.
+field_names_cache: Dict[type, Tuple[str, ...]] = {}
+
+
+def field_names(cls) -> Tuple[str, ...]:
+    """ Return the names of the fields of a dataclass or dataclass instance.
+        The generated model classes list their fields in `schema_fields`, so these need not be inspected
+        at runtime (`dataclasses.fields` is slow in Brython). Other classes are inspected once.
+    """
+    if not isinstance(cls, type):
+        cls = type(cls)
+    names = field_names_cache.get(cls)
+    if names is None:
+        names = vars(cls).get('schema_fields') or tuple(f.name for f in fields(cls))
+        field_names_cache[cls] = names
+    return names
+
+
 def from_dict(cls, **details) -> Self:
     """ Construct an instance of this class from a dictionary of key:value pairs. """
     # Use only elements accepted by this dataclass.
-    keys = [f.name for f in fields(cls)]
+    keys = field_names(cls)
     kwargs = {k:v for k, v in details.items() if k in keys}
     return cls(**kwargs)
 
@@ -70,7 +88,7 @@ class StorableElement:
         return fields(cls)
     def asdict(self, ignore: List[str]=None) -> Dict[str, Any]:
         ignore = ignore or []   # Use a safe default value for the ignore argument
-        keys = [f.name for f in fields(self) if f.name not in ignore]
+        keys = [k for k in field_names(self) if k not in ignore]
         result = {k: self.__dict__[k] for k in keys}
         result['__classname__'] = type(self).__name__
         return result
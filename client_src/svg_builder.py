@@ -0,0 +1,139 @@
+"""
+Copyright© 2024 Evert van de Waal
+
+This file is part of dsmgen.
+
+Dsmgen is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+Dsmgen is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Foobar; if not, write to the Free Software
+Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+import sys
+import types
+import logging
+from typing import Any, Dict, List, Optional
+from xml.sax.saxutils import escape, quoteattr
+
+
+def attrName(key: str) -> str:
+    """ Convert a keyword argument to an attribute name, as Brython does. """
+    if key == 'Class':
+        return 'class'
+    return key.replace('_', '-')
+
+
+class Element:
+    """ A lightweight SVG element for drawing outside the browser.
+        It supports the part of the Brython DOM interface that is used by the shapes in `svg_shapes`:
+        adding children with `<=`, reading and writing attributes with `[]`, and `remove` and `clear`.
+    """
+    def __init__(self, tagName: str, content: Any = '', **attrs):
+        self.tagName = tagName
+        self.text = content if isinstance(content, str) else ''
+        self.children: List[Element] = []
+        self.parent: Optional[Element] = None
+        self.style: Dict[str, Any] = {}
+        style = attrs.pop('style', None)
+        self.attrs: Dict[str, Any] = {attrName(k): v for k, v in attrs.items()}
+        if style:
+            self['style'] = style
+        if not isinstance(content, str):
+            _ = self <= content
+
+    def __le__(self, other):
+        children = other if isinstance(other, (list, tuple)) else [other]
+        for child in children:
+            child.parent = self
+            self.children.append(child)
+        return self
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key == 'style':
+            if isinstance(value, dict):
+                self.style.update(value)
+            elif value:
+                for item in value.split(';'):
+                    if ':' in item:
+                        k, v = item.split(':', maxsplit=1)
+                        self.style[k.strip()] = v.strip()
+        else:
+            self.attrs[key] = value
+
+    def __getitem__(self, key: str) -> Any:
+        return self.attrs[key]
+
+    def remove(self) -> None:
+        if self.parent is not None:
+            self.parent.children.remove(self)
+            self.parent = None
+
+    def clear(self) -> None:
+        for child in self.children:
+            child.parent = None
+        self.children = []
+
+    def bind(self, event, handler=None):
+        # There are no events outside the browser.
+        return handler
+
+
+class SvgFactory:
+    """ Create elements as `svg.rect(...)`, like the `browser.svg` module in Brython. """
+    def __getattr__(self, tagName: str):
+        if tagName.startswith('__'):
+            raise AttributeError(tagName)
+        return lambda content='', **attrs: Element(tagName, content, **attrs)
+
+
+class Console:
+    def log(self, *args):
+        logging.debug(' '.join(str(a) for a in args))
+
+
+svg = SvgFactory()
+console = Console()
+
+
+def installAsBrowser() -> None:
+    """ Make the builder available as the `browser` module, so the client modules that only draw
+        (like `svg_shapes`) can be imported outside the browser.
+        Does nothing when running in Brython, or when another `browser` module is available.
+    """
+    try:
+        import browser
+    except ImportError:
+        module = types.ModuleType('browser')
+        module.svg = svg
+        module.console = console
+        sys.modules['browser'] = module
+
+
+def styleString(element) -> str:
+    style = getattr(element, 'style', None)
+    if style is None:
+        return ''
+    items = style.items() if isinstance(style, dict) else vars(style).items()
+    return ';'.join(f'{k}:{v}' for k, v in items if v is not None)
+
+
+def serialize(element) -> str:
+    """ Write an element and its children as SVG text.
+        Also works for elements that are not created by this module, if they have `attrs` and `children`.
+    """
+    tag = getattr(element, 'tagName', None) or type(element).__name__
+    attrs = [f' {k}={quoteattr(str(v))}' for k, v in element.attrs.items() if v is not None]
+    if style := styleString(element):
+        attrs.append(f' style={quoteattr(style)}')
+    content = escape(element.text or '') + ''.join(serialize(c) for c in element.children)
+    if not content:
+        return f"<{tag}{''.join(attrs)}/>"
+    return f"<{tag}{''.join(attrs)}>{content}</{tag}>"
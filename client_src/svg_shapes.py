@@ -19,14 +19,13 @@ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 """
 
 import enum
-from typing import List, Tuple
+from typing import Any, Callable, Dict, List, Tuple
 from collections.abc import Generator
 import math
-from itertools import chain
-from copy import copy
 from browser import svg, console
 from fontsizes import font_sizes
 from square_routing import Point, routeSquare
+from path_geometry import CompiledPath, tokenize
 
 try:
     import pyphen
@@ -51,21 +50,92 @@ class HAlign(enum.IntEnum):
 
 POINT_TO_PIXEL = 1.3333
 
+class LRUCache:
+    """ A dictionary that holds a limited number of items, dropping the least recently used. """
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.items = {}
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, default=None):
+        if key in self.items:
+            # Move the item to the end of the dictionary, which holds the most recently used items.
+            value = self.items.pop(key)
+            self.items[key] = value
+            self.hits += 1
+            return value
+        self.misses += 1
+        return default
+
+    def set(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+        if len(self.items) > self.max_size:
+            del self.items[next(iter(self.items))]
+
+    def clear(self):
+        self.items.clear()
+        self.hits = self.misses = 0
+
+
+# The layout of texts that were wrapped before, and the width of words in font units.
+text_layout_cache = LRUCache(2000)
+word_width_cache = LRUCache(20000)
+hyphenators = {}
+
+
+def getHyphenator(lang='nl_NL'):
+    """ Creating a hyphenation dictionary is expensive, so it is done once for each language. """
+    if lang not in hyphenators:
+        hyphenators[lang] = pyphen.Pyphen(lang=lang)
+    return hyphenators[lang]
+
+
+def getWordWidth(word, font_file='Arial.ttf'):
+    """ The width of a word in font units, i.e. not scaled for the font size. """
+    key = (word, font_file)
+    size = word_width_cache.get(key)
+    if size is None:
+        font = font_sizes[font_file]['sizes']
+        size = sum(font.get(ord(ch), font[32]) for ch in word)
+        word_width_cache.set(key, size)
+    return size
+
+
+def clearTextCache():
+    text_layout_cache.clear()
+    word_width_cache.clear()
+
+
 def getTextWidth(text, font_file='Arial.ttf', fontsize='10'):
-    font = font_sizes[font_file]['sizes']
     normalized_width = 1 / POINT_TO_PIXEL / int(fontsize)
-    normalized_size = sum(font.get(ord(ch), font[32]) for ch in text)
+    normalized_size = getWordWidth(text, font_file)
     return normalized_size / normalized_width
 
 
-def wrapText(text, width, font_file='Arial.ttf', fontsize='10'):
+def wrapText(text, width, font_file='Arial.ttf', fontsize='10', lang='nl_NL'):
+    """ Split a text into lines that fit within `width` pixels.
+        The result is cached, as the same texts are laid out again each time a shape is redrawn.
+    """
+    key = (text, width, font_file, fontsize, lang)
+    lines = text_layout_cache.get(key)
+    if lines is None:
+        lines = tuple(layoutText(text, width, font_file, fontsize, lang))
+        text_layout_cache.set(key, lines)
+    return list(lines)
+
+
+def layoutText(text, width, font_file='Arial.ttf', fontsize='10', lang='nl_NL'):
     # Separate into words and determine the size of each part
     font = font_sizes[font_file]['sizes']
     parts = text.split()
     normalized_width = width / POINT_TO_PIXEL / int(fontsize)
-    sizes = [sum(font.get(ord(ch), font[32]) for ch in part) for part in parts]
+    sizes = [getWordWidth(part, font_file) for part in parts]
     if pyphen:
-        dic = pyphen.Pyphen(lang='nl_NL')
+        dic = getHyphenator(lang)
 
     # Now fill the lines
     line_length = 0
@@ -79,18 +149,18 @@ def wrapText(text, width, font_file='Arial.ttf', fontsize='10'):
                     # Find the largest part that fits
                     for a, b in dic.iterate(part):
                         a = a + '-'
-                        size = sum(font.get(ord(ch), font[32]) for ch in a)
+                        size = getWordWidth(a, font_file)
                         if line_length + size + font[32]*(len(current_line)-1) <= normalized_width:
                             current_line.append(a)
                             part = b
                             line_length += size
-                            size = sum(font.get(ord(ch), font[32]) for ch in b)
+                            size = getWordWidth(b, font_file)
                             break
                     else:
                         # No part fitted. Check this is not an empty line, otherwise the word will never fit.
                         if not current_line:
                             # Just add the word and let the user deal with it.
-                            size = sum(font.get(ord(ch), font[32]) for ch in part)
+                            size = getWordWidth(part, font_file)
                             break
                 lines.append(' '.join(current_line))
                 current_line = []
@@ -105,14 +175,17 @@ def wrapText(text, width, font_file='Arial.ttf', fontsize='10'):
         lines.append(' '.join(current_line))
     return lines
 
-def renderText(text, d):
+# The default style for the texts in shapes.
+text_style_items = dict(font='Arial', fontsize='16', textcolor='#000000', xmargin=2, ymargin=2, halign=HAlign.CENTER,
+                        valign=VAlign.CENTER)
+
+def placeText(text, d):
+    """ Determine the lines for a text and where they are placed: returns a list of (line, x, y). """
     font_file = d.getStyle('font', 'Arial')+'.ttf'
     fontsize = float(d.getStyle('fontsize', 12))
     xmargin = int(d.getStyle('xmargin', '5'))
     ymargin = int(d.getStyle('ymargin', xmargin))
     lines = wrapText(text, d.width-2*xmargin, font_file, fontsize)
-    # Now render these lines
-    anchor = {HAlign.LEFT: 'start', HAlign.CENTER: 'middle', HAlign.RIGHT: 'end'}[d.getStyle('halign', HAlign.LEFT)]
     lineheight = font_sizes[font_file]['lineheight'] * fontsize * float(d.getStyle('linespace', '1.5'))
     # Calculate where the text must be placed.
     xpos = int({HAlign.LEFT: d.x+xmargin, HAlign.CENTER: d.x+d.width/2, HAlign.RIGHT: d.x+d.width-xmargin}[d.getStyle('halign', HAlign.LEFT)])
@@ -120,10 +193,14 @@ def renderText(text, d):
             VAlign.CENTER: d.y+(d.height-(len(lines)+.5)*lineheight)/2,
             VAlign.BOTTOM: d.y+d.height-len(lines)*lineheight*fontsize - ymargin
            }[d.getStyle('valign', VAlign.CENTER)]
+    return [(line, xpos, int(ypos+lineheight*(i+1))) for i, line in enumerate(lines)]
 
-    rendered = [svg.text(line, x=xpos, y=int(ypos+lineheight*(i+1)), text_anchor=anchor, font_size=fontsize,
+def renderText(text, d):
+    fontsize = float(d.getStyle('fontsize', 12))
+    anchor = {HAlign.LEFT: 'start', HAlign.CENTER: 'middle', HAlign.RIGHT: 'end'}[d.getStyle('halign', HAlign.LEFT)]
+    rendered = [svg.text(line, x=x, y=y, text_anchor=anchor, font_size=fontsize,
                          font_family=d.getStyle('font', 'Arial'), fill=d.getStyle('textcolor'))
-                for i, line in enumerate(lines)]
+                for line, x, y in placeText(text, d)]
     return rendered
 
 
@@ -142,8 +219,68 @@ def drawSquaredLine(start, end, gridline):
 ###############################################################################
 # Some predetermined shapes
 
+class ShapeRegistry:
+    """ The shape types by name, with the default style of each type.
+        Shape types are added when their class is defined, so lookups do not need to scan the class hierarchy.
+        The default styles are flattened over the bases of the class, the `style_items` of a class override those
+        of its bases. The `style_items` of a class should not be changed after it has been defined.
+    """
+    def __init__(self):
+        self.types: Dict[str, type] = {}
+        self.defaults: Dict[type, Dict[str, Any]] = {}
+        # When set, the scalable shapes are drawn as a `<use>` of a symbol defined by `getSymbolDefinitions`.
+        # Blocks with other shapes or with ports are drawn from the symbols in `symbol_cache`.
+        # The client sets this with `?symbols` in its URL.
+        self.use_symbols: bool = False
+        self.symbol_types: Dict[type, type] = {}
+
+    def register(self, cls) -> None:
+        self.types[cls.__name__.lower()] = cls
+        self.defaults[cls] = self.flattenStyle(cls)
+
+    def get(self, name: str) -> type:
+        try:
+            cls = self.types[name.lower()]
+        except KeyError:
+            raise RuntimeError(f"Unknown shape type {name}")
+        if self.use_symbols and cls.scalable:
+            return self.getSymbolType(cls)
+        return cls
+
+    def getSymbolType(self, cls) -> type:
+        """ Return a variant of a shape type that draws it as a `<use>` of its symbol. """
+        if cls not in self.symbol_types:
+            self.symbol_types[cls] = type(cls.__name__, (UseSymbol, cls), {'symbol_of': cls})
+        return self.symbol_types[cls]
+
+    def getDefaults(self, cls) -> Dict[str, Any]:
+        """ Return the default style for a shape type. The dictionary is shared and should not be modified. """
+        try:
+            return self.defaults[cls]
+        except KeyError:
+            # Descriptors that are not derived from BasicShape, like MsgShape.
+            defaults = self.defaults[cls] = self.flattenStyle(cls)
+            return defaults
+
+    @staticmethod
+    def flattenStyle(cls) -> Dict[str, Any]:
+        style = {}
+        for base in reversed(cls.mro()):
+            style.update(base.__dict__.get('style_items', {}))
+        return style
+
+
+shape_registry = ShapeRegistry()
+
+
 class BasicShape:
     style_items = {'bordercolor': '#000000', 'bordersize': '2', 'blockcolor': '#ffffff'}
+    # True if the outline of the shape scales with its size, so it can be drawn from a symbol.
+    scalable = False
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'symbol_of' not in cls.__dict__:
+            shape_registry.register(cls)
     @classmethod
     def getShape(cls, details):
         raise NotImplementedError
@@ -152,14 +289,10 @@ class BasicShape:
         raise NotImplementedError
     @staticmethod
     def getDescriptor(name):
-        name = name.lower()
-        for cls in BasicShape.getShapeTypes():
-            if cls.__name__.lower() == name.lower():
-                return cls
-        raise RuntimeError(f"Unknown shape type {name}")
+        return shape_registry.get(name)
     @classmethod
     def getShapeTypes(cls):
-        return cls.__subclasses__() + list(chain.from_iterable(c.getShapeTypes() for c in cls.__subclasses__()))
+        return [c for c in shape_registry.types.values() if issubclass(c, cls) and c is not cls]
 
     @classmethod
     def getType(cls):
@@ -168,22 +301,101 @@ class BasicShape:
     @classmethod
     def getStyle(cls, key, details):
         # Find a default value for the style item
-        default = cls.style_items.get(key, None)
-        if default is None:
-            for c in cls.mro():
-                if key in c.style_items:
-                    default = c.style_items[key]
-                    break
-        return details.getStyle(key, default)
+        return details.getStyle(key, shape_registry.getDefaults(cls).get(key, None))
 
     @classmethod
     def getDefaultStyle(cls):
         """ Return a new dictionary with defaults for all stylable items in the shape and its bases. """
-        style = {}
-        for base in reversed(cls.mro()):
-            style.update(getattr(base, 'style_items', {}))
-        style.update(cls.style_items)
-        return style
+        return dict(shape_registry.getDefaults(cls))
+
+    @classmethod
+    def getSymbolId(cls):
+        return f'shape-{cls.getType()}'
+
+    @classmethod
+    def getSymbol(cls):
+        """ Return a symbol with the outline of the shape. Its colours are inherited from the `<use>` element. """
+        size = SymbolDetails.size
+        symbol = svg.symbol(id=cls.getSymbolId(), viewBox=f"0 0 {size} {size}", preserveAspectRatio='none')
+        outline = cls.getShape(SymbolDetails())
+        # Keep the line width the same as for shapes that are not scaled.
+        outline['vector-effect'] = 'non-scaling-stroke'
+        symbol <= outline
+        return symbol
+
+
+# The style items that a symbol takes from the `<use>` element, so blocks with different colours can share it.
+symbol_colours = ['blockcolor', 'bordercolor', 'bordersize']
+
+
+class SymbolDetails:
+    """ The details used to draw the outline of a shape in a symbol, at the origin.
+        Without `details`, the outline is drawn at the size of the viewBox of a scalable symbol.
+    """
+    size = 100
+    def __init__(self, details=None):
+        self.details = details
+        self.x, self.y = 0, 0
+        self.width, self.height = (details.width, details.height) if details else (self.size, self.size)
+    def getStyle(self, key, default=None):
+        if key in symbol_colours:
+            return 'inherit'
+        if self.details:
+            return self.details.getStyle(key, default)
+        return default
+
+
+class SymbolCache:
+    """ The symbols shared by blocks that look the same, apart from their position and colours.
+        A symbol is drawn at the size of the blocks that use it, so parts with a fixed size, like the ports or the
+        fold of a note, are drawn as they are without symbols. A block is then drawn as a single `<use>`.
+        The symbols are counted by the blocks that use them, and removed when they are no longer used.
+    """
+    def __init__(self):
+        self.defs = svg.defs()
+        self.symbols: Dict[Any, Any] = {}
+        self.users: Dict[Any, int] = {}
+        self.count = 0
+
+    def acquire(self, key, draw: Callable[[], List[Any]]) -> str:
+        """ Return the id of the symbol for `key`. If there is none, it is made from the elements returned by `draw`. """
+        if key not in self.symbols:
+            self.count += 1
+            symbol = svg.symbol(id=f'block-{self.count}', overflow='visible')
+            symbol <= draw()
+            self.defs <= symbol
+            self.symbols[key] = symbol
+            self.users[key] = 0
+        self.users[key] += 1
+        return self.symbols[key]['id']
+
+    def release(self, key) -> None:
+        self.users[key] -= 1
+        if self.users[key] == 0:
+            self.symbols.pop(key).remove()
+            del self.users[key]
+
+
+symbol_cache = SymbolCache()
+
+
+class UseSymbol:
+    """ Draws a shape as a `<use>` of the symbol of the shape type `symbol_of`.
+        Mixed into the shape type by `ShapeRegistry.getSymbolType`.
+    """
+    symbol_of = None
+    @classmethod
+    def getShape(cls, details):
+        shape = svg.use(href=f'#{cls.symbol_of.getSymbolId()}')
+        cls.updateShape(shape, details)
+        return shape
+    @classmethod
+    def updateShape(cls, shape, details):
+        shape['x'], shape['y'] = str(details.x), str(details.y)
+        shape['width'], shape['height'] = str(details.width), str(details.height)
+        shape['fill'] = cls.getStyle('blockcolor', details)
+        shape['stroke'] = cls.getStyle('bordercolor', details)
+        shape['stroke-width'] = cls.getStyle('bordersize', details)
 
 
 class Rect(BasicShape):
@@ -245,6 +457,7 @@ class Square(BasicShape):
 
 class Ellipse(BasicShape):
     style_items = {}
+    scalable = True
     @classmethod
     def getShape(cls, details):
         return svg.ellipse(cx=str(details.x+details.width//2), cy=str(details.y+details.height//2),
@@ -327,6 +540,7 @@ class Component(BasicShape):
             child['style'] = style
 
 class Diamond(Note):
+    scalable = True
     @classmethod
     def getPoints(cls, details):
         return [(details.x+a, details.y+b) for a, b in [
@@ -543,18 +757,21 @@ class Tape(Drum):
 
 class TriangleDown(Drum):
     style_items = {}
+    scalable = True
     @classmethod
     def getPath(cls, details):
         return f'M {details.x} {details.y} h {details.width} l -{details.width//2} {details.height} L {details.x} {details.y}'
 
 class TriangleUp(Drum):
     style_items = {}
+    scalable = True
     @classmethod
     def getPath(cls, details):
         return f'M {details.x} {details.y+details.height} h {details.width} l -{details.width//2} -{details.height} L {details.x} {details.y+details.height}'
 
 class Hourglass(Drum):
     style_items = {}
+    scalable = True
     @classmethod
     def getPath(cls, details):
         return f'M {details.x} {details.y} h {details.width} l -{details.width} {details.height} h {details.width} l -{details.width} -{details.height}'
@@ -572,150 +789,49 @@ class Label(Note):
             (0, details.height),
             (0,0)]]
 
-def path_parser(d:str) -> Generator[(str, List[float])]:
+def path_parser(d: str) -> Generator[(str, List[float])]:
     """ Split a path into its mnemonics + arguments """
-    parts = [p if ',' not in p else [float(f) for f in p.split(',')] for p in d.split()]
-
-    it = iter(parts)
-    last_mnemonic = None
-    try:
-        while True:
-            arguments = []
-            # Get the mnemonic
-            p = next(it)
-            if isinstance(p, str):
-                last_mnemonic = p
-            elif isinstance(p, list):
-                arguments.extend(p)
-            else:
-                arguments.append(p)
-            required_arguments = {'m': 2, 'l': 2, 'h': 1, 'v': 1, 'c': 6, 'q': 4, 'z': 0}[last_mnemonic.lower()]
-            while len(arguments) < required_arguments:
-                a = next(it)
-                if isinstance(a, list):
-                    arguments.extend(a)
-                else:
-                    arguments.append(float(a))
-            yield (last_mnemonic, arguments)
-    except StopIteration:
-        return
-
-def absposes(d: str) -> Generator[Point]:
-    """ Generate a list of all point & control points for a path, in absolute positions. """
-    position = None
-    for command, coods in path_parser(d):
-        match command:
-            case 'M' | 'L' | 'C' | 'Q':
-                results = [Point(*c) for c in zip(coods[0:2:], coods[1:2:])]
-                yield from results
-                position = results[-1]
-            case 'm' | 'l' | 'c' | 'q':
-                assert position
-                results = [position+Point(*c) for c in zip(coods[0:2:], coods[1:2:])]
-                yield from results
-                position = results[-1]
-            case 'V':
-                position = Point(position.x, coods[0])
-                yield position
-            case 'v':
-                position = Point(position.x, position.y+coods[0])
-                yield position
-            case 'H':
-                position = Point(coods[0], position.y)
-                yield position
-            case 'h':
-                position = Point(coods[0] + position.x, position.y)
-                yield position
+    return tokenize(d)
+
+def absposes(d: str) -> List[Point]:
+    """ Return a list of all point & control points for a path, in absolute positions. """
+    return CompiledPath(d).points()
 
 
 def path_origin(d: str) -> Tuple[Point, float]:
     """ Determine the first point of a path and the direction it takes from there, in radians. """
-    it = absposes(d)
-    first = next(it)
-    second = next(it)
-    direction = math.atan2(second.y - first.y, second.x - first.x)
-    return first, direction
+    return CompiledPath(d).origin()
 
 def path_ending(d: str) -> Tuple[Point, float]:
-    """ Determine the first point of a path and the direction it takes from there, in radians. """
-    all_poses = absposes(d)
-    first = all_poses[-1]
-    second = all_poses[-2]
-    direction = math.atan2(second.y - first.y, second.x - first.x)
-    return first, direction
-
-def normalize_path(d: str):
-    # Make the path relative, except the first bit, which should be an M mnemonic.
-    it = path_parser(d)
-    relative_parts = []
-    initial = next(it)
-    assert initial[0] == 'M'
-    position = initial[1]
-    count = 0
-    command = None
-    relative_parts.extend(['M', copy(position)])
-    min_pos = copy(position)
-    max_pos = copy(position)
-    for p in it:
-        command, coods = p
-        relative_parts.append(command.lower())
-        if command == 'C':
-            relative_parts.extend([[c[0] - position[0], c[1] - position[1]] for c in zip(coods[0::2], coods[1::2])])
-            position = [coods[4], coods[5]]
-        if command == 'c':
-            relative_parts.extend(list(zip(coods[0::2], coods[1::2])))
-            position = [coods[4] + position[0], coods[5] + position[1]]
-        if command in 'ML':
-            relative_parts.append([coods[0] - position[0], coods[1] - position[1]])
-            position = coods
-        if command == 'ml':
-            relative_parts.append(coods)
-            position = [coods[0] + position[0], coods[1] + position[1]]
-        if command in 'HV':
-            hv = 0 if command.lower() == 'h' else 1
-            relative_parts.append(float(coods[0]) - position[hv])
-            position = [coods[0] if i==hv else f for i,f in enumerate(position)]
-        if command == 'hv':
-            hv = 0 if command.lower() == 'h' else 1
-            relative_parts.append(float(coods[0]))
-            position = [coods[0]+f if i==hv else f for i,f in enumerate(position)]
-        min_pos = [a if a < b else b for a, b in zip(position, min_pos)]
-        max_pos = [a if a > b else b for a, b in zip(position, max_pos)]
-
-    # Scale the path to [0,0], [1,1]
-    scale = [max_pos[0]-min_pos[0], max_pos[1]-min_pos[1]]
-    normalize_parts = []
-    for p in relative_parts:
-        if isinstance(p, str):
-            command = p
-            normalize_parts.append(p)
-            continue
-        if command == 'h':
-            normalize_parts.append(p/scale[0])
-        elif command == 'v':
-            normalize_parts.append(p/scale[1])
-        else:
-            normalize_parts.append([p[0] / scale[0], p[1] / scale[1]])
-    # Apply the offset (only the first coordinate is absolute)
-    normalize_parts[1] = [a-(b/s) for a, b, s in zip(normalize_parts[1], min_pos, scale)]
-    return normalize_parts
+    """ Determine the last point of a path and the direction back into the path, in radians. """
+    return CompiledPath(d).ending()
+
+class PathTemplate:
+    """ A path that is drawn at different positions and sizes, e.g. one drawn in InkScape.
+        The path is compiled once (see `path_geometry`), and scaled so its end points fit the box it is drawn in.
+    """
+    def __init__(self, d: str):
+        self.path = CompiledPath(d)
+        self.bounds = self.path.bounds()
+
+    def render(self, x, y, width, height) -> str:
+        xmin, ymin, xmax, ymax = self.bounds
+        sx = width / (xmax - xmin)
+        sy = height / (ymax - ymin)
+        return self.path.render(sx, sy, x - xmin*sx, y - ymin*sy)
+
 
 class Cloud(Drum):
     style_items = {}
     # Normalize a path generated by InkScape for easy moving and scaling.
     # All steps must be relative to the first position.
     d = 'M 33.158846,50.637579 C 24.723638,32.861747 44.647127,18.397258 62.128717,33.206332 73.12788,10.907646 106.48349,17.249888 104.54954,35.879815 c 21.01165,6.106901 10.9017,34.898043 -5.715567,32.584623 0.721563,13.176636 -21.693818,15.09918 -28.593097,6.650085 C 63.325548,83.805268 44.881237,81.566417 43.120355,70.929496 27.384339,81.579617 15.079869,55.78997 33.158846,50.637579 Z'
-    parts = normalize_path(d)
+    path = PathTemplate(d)
+    scalable = True
 
     @classmethod
     def getPath(cls, details):
-        # Scale the co-ordinates
-        size = [details.width, details.height]
-        parts = [[f*size[i] for i,f in enumerate(p)] if isinstance(p, list) else p for p in cls.parts]
-        # Set the origin of the shape
-        parts[1] = [parts[1][0]+details.x, parts[1][1]+details.y]
-        # Return the results as a string.
-        return ' '.join([','.join(str(f) for f in p) if isinstance(p, list) else p for p in parts])
+        return cls.path.render(details.x, details.y, details.width, details.height)
 
 
 class MsgShape:
@@ -780,6 +896,10 @@ wire_line_endings = {
     'one_or_many': 'M 0 0 v 10 M 0 5 l 10 5 M 0 5 l 10 -5'
 }
 
+# The default style for connections.
+connection_style_items = dict(linecolor='#000000', linewidth='2', endmarker='arrow', startmarker='',
+                              routing_method='square')
+
 line_patterns = {
     'dashed': 'stroke-dasharray="20,20"',
     'dotted': 'stroke-dasharray="5,5"',
@@ -808,6 +928,17 @@ def getMarkerDefinitions():
 
     return defs
 
+def getSymbolDefinitions():
+    """ Symbols for the shapes that can be scaled, and the symbols of `symbol_cache`.
+        Used when `shape_registry.use_symbols` is set.
+    """
+    defs = svg.defs()
+    for cls in shape_registry.types.values():
+        if cls.scalable:
+            defs <= cls.getSymbol()
+    defs <= symbol_cache.defs
+    return defs
+
 ###############################################################################
 # Some icons / glyphs used in the application
 def chain_icon(x, y, s, stroke='#000000', fill='#ffffff'):
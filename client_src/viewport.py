@@ -0,0 +1,190 @@
+"""
+Copyright© 2024 Evert van de Waal
+
+This file is part of dsmgen.
+
+Dsmgen is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 3 of the License, or
+(at your option) any later version.
+
+Dsmgen is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Foobar; if not, write to the Free Software
+Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+from browser import svg
+from weakref import ref
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class Viewport:
+    """ Only create the SVG elements for the part of a large diagram that can be seen.
+
+        When a large diagram is loaded, its blocks and connections are added to the diagram without
+        creating their SVG elements (their `shape` remains None): they are "deferred". The elements
+        are created when the area they are in is scrolled into view. Connections are created when
+        either of their ends is shown, which also causes the block at the other end to be shown.
+
+        When zoomed out far, blocks are shown as simple rectangles without text or ports: deferred blocks
+        are not created, blocks that are already drawn are hidden. Zooming in replaces these placeholders
+        with the actual blocks. Connections between blocks that are drawn remain visible.
+    """
+    def __init__(self, diagram, margin: float = 200, lod_scale: float = 4.0):
+        self.diagram = diagram
+        self.margin = margin            # Elements this close to the visible area are also shown.
+        self.lod_scale = lod_scale      # Above this number of diagram units per pixel, placeholders are used.
+        self.deferred_blocks: Dict[int, Any] = {}
+        self.deferred_connections: Dict[int, Any] = {}
+        self.port_owners: Dict[int, Any] = {}
+        self.placeholders: Dict[int, Any] = {}
+        self.zoomed_out = False
+
+    def clear(self) -> None:
+        for p in self.placeholders.values():
+            p.remove()
+        self.deferred_blocks, self.deferred_connections, self.port_owners, self.placeholders = {}, {}, {}, {}
+        self.zoomed_out = False
+
+    def isDeferred(self, widget) -> bool:
+        return id(widget) in self.deferred_blocks or id(widget) in self.deferred_connections
+
+    def getViewBox(self) -> Optional[Tuple[float, float, float, float]]:
+        canvas = self.diagram.canvas
+        if canvas is None:
+            return None
+        viewbox = canvas.attrs.get('viewBox', None)
+        if viewbox:
+            x, y, w, h = [float(v) for v in viewbox.split()]
+            return x, y, w, h
+        width, height = getattr(canvas, 'clientWidth', 0), getattr(canvas, 'clientHeight', 0)
+        if not (width and height):
+            return None
+        return 0.0, 0.0, float(width), float(height)
+
+    def getVisibleArea(self) -> Optional[Tuple[float, float, float, float]]:
+        """ Return (minx, miny, maxx, maxy) of the visible area plus the margin, or None if not known. """
+        viewbox = self.getViewBox()
+        if viewbox is None:
+            return None
+        x, y, w, h = viewbox
+        m = self.margin
+        return x - m, y - m, x + w + m, y + h + m
+
+    def isZoomedOut(self) -> bool:
+        viewbox = self.getViewBox()
+        width = getattr(self.diagram.canvas, 'clientWidth', 0)
+        if viewbox is None or not width:
+            return False
+        return viewbox[2] / width > self.lod_scale
+
+    def load(self, blocks: List[Any], connections: List[Any]) -> None:
+        """ Add blocks and connections to the diagram without creating them.
+            `update` needs to be called to create the ones that are visible.
+        """
+        for block in blocks:
+            self.deferBlock(block)
+        for connection in connections:
+            self.deferConnection(connection)
+
+    def show(self, widget) -> None:
+        """ Ensure a block, or the block a port belongs to, is created. """
+        block = self.port_owners.get(id(widget), widget)
+        if id(block) in self.deferred_blocks:
+            self.materialiseBlock(block)
+
+    def deferBlock(self, block) -> None:
+        block.owner = ref(self.diagram)
+        self.diagram.attachChild(block)
+        self.deferred_blocks[id(block)] = block
+        for port in getattr(block, 'ports', []):
+            self.port_owners[id(port)] = block
+
+    def deferConnection(self, connection) -> None:
+        self.diagram.connections.append(connection)
+        self.diagram.indexConnection(connection)
+        self.deferred_connections[id(connection)] = connection
+
+    def forget(self, widget) -> None:
+        """ Called when an element is removed from the diagram. """
+        self.deferred_blocks.pop(id(widget), None)
+        self.deferred_connections.pop(id(widget), None)
+        if (placeholder := self.placeholders.pop(id(widget), None)) is not None:
+            placeholder.remove()
+
+    def update(self) -> None:
+        """ Create the elements that came into view, e.g. after scrolling or zooming. """
+        zoomed_out = self.isZoomedOut()
+        if zoomed_out != self.zoomed_out:
+            self.zoomed_out = zoomed_out
+            self.setLowDetail(zoomed_out)
+        if not (self.deferred_blocks or self.deferred_connections):
+            return
+        area = self.getVisibleArea()
+        if area is None:
+            candidates = list(self.deferred_blocks.values())
+        else:
+            candidates = [b for b in self.diagram.getChildrenIn(*area) if id(b) in self.deferred_blocks]
+
+        if zoomed_out:
+            for block in candidates:
+                self.showPlaceholder(block)
+        else:
+            for block in candidates:
+                self.materialiseBlock(block)
+            # Show the connections to these blocks, including the blocks at the other end.
+            for block in candidates:
+                for connection in self.diagram.getConnectionsToShape(block):
+                    if id(connection) in self.deferred_connections:
+                        self.show(connection.start)
+                        self.show(connection.finish)
+        # Show the connections of which both ends are shown.
+        for connection in list(self.deferred_connections.values()):
+            if not (self.isHidden(connection.start) or self.isHidden(connection.finish)):
+                self.materialiseConnection(connection)
+
+    def setLowDetail(self, low_detail: bool) -> None:
+        """ Swap the blocks that are drawn for placeholders, or back again. """
+        for block in self.diagram.children:
+            if id(block) in self.deferred_blocks or block.shape is None:
+                continue
+            if low_detail:
+                self.hideBlock(block)
+            else:
+                block.shape.style['display'] = ''
+                if (placeholder := self.placeholders.pop(id(block), None)) is not None:
+                    placeholder.remove()
+
+    def isHidden(self, widget) -> bool:
+        return id(self.port_owners.get(id(widget), widget)) in self.deferred_blocks
+
+    def materialiseBlock(self, block) -> None:
+        self.forget(block)
+        block.create(self.diagram)
+        if self.zoomed_out:
+            self.hideBlock(block)
+
+    def hideBlock(self, block) -> None:
+        block.shape.style['display'] = 'none'
+        self.showPlaceholder(block)
+
+    def materialiseConnection(self, connection) -> None:
+        del self.deferred_connections[id(connection)]
+        connection.create(self.diagram, self.diagram.children)
+
+    def showPlaceholder(self, block) -> None:
+        if id(block) in self.placeholders:
+            return
+        placeholder = svg.rect(x=block.x, y=block.y, width=block.width, height=block.height,
+                               fill='#e0e0e0', stroke='#a0a0a0', Class='placeholder')
+        _ = self.diagram.canvas <= placeholder
+        self.placeholders[id(block)] = placeholder
+
+    def geometryChanged(self, block) -> None:
+        if (placeholder := self.placeholders.get(id(block), None)) is not None:
+            for key in ['x', 'y', 'width', 'height']:
+                placeholder.attrs[key] = getattr(block, key)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark for generating the Rust code of a large program.
+
+A synthetic program is made from chains of a counter, a toggle and a digital output, where each digital
+output is connected to its own pin of the micro controller. The benchmark measures building the
+program graph and generating the complete program from it.
+
+Run from this directory, after the project was generated with `run.py`:
+    python benchmark_code_generation.py [nr_blocks ...]
+"""
+import sys
+from time import perf_counter
+
+import generate_rust_embedded as gen
+from program_graph import ProgramGraph
+
+
+def mk_program(nr_blocks: int) -> dict:
+    """ Make the exported data (see `ProgramData.export`) of a program with about `nr_blocks` blocks. """
+    ids = iter(range(1, 100 * nr_blocks + 100))
+    blocks, ports, connections = [], [], []
+
+    def block(type_name, type_parameters='', parameters=None):
+        b = dict(Id=next(ids), type_name=type_name, type_id=0, type_parameters=type_parameters,
+                 parameters=parameters or {'parameters': {}}, diagram=1, parent=None)
+        blocks.append(b)
+        return b
+
+    def port(b, name, type_name, **parameters):
+        p = dict(Id=next(ids), name=name, type_name=type_name, parent_block=b['Id'], parent_type_id=0, order=0,
+                 parameters=parameters)
+        ports.append(p)
+        return p
+
+    def connect(source, target, type_name='SynchronousChannel'):
+        connections.append(dict(Id=next(ids), type_name=type_name, source=source['Id'], target=target['Id']))
+
+    mcu = block('arduino_uno')
+    previous = None
+    for i in range(max(1, nr_blocks // 3)):
+        counter = block('counter', 'maximum:int', {'maximum': 100 + i})
+        counter_in, counter_out = port(counter, 'in', 'Input'), port(counter, 'count', 'Output')
+        toggle = block('toggle')
+        toggle_in, toggle_out = port(toggle, 'in', 'Input'), port(toggle, 'out', 'Output')
+        do = block('DO', 'type:PinType', {'parameters': {'type': 1}})
+        do_in = port(do, 'input', 'Input')
+        port(do, 'enable', 'Input')
+        do_pin = port(do, 'pin', 'ConfigInput', peripheral_class=2)
+        pin = port(mcu, f'D{i}', 'ConfigOutput', peripheral_class=2)
+
+        connect(counter_out, toggle_in)
+        connect(toggle_out, do_in)
+        connect(pin, do_pin, 'ConfigChannel')
+        if previous:
+            connect(previous, counter_in)
+        previous = toggle_out
+
+    return {
+        'blocks': blocks,
+        'connections': connections,
+        'ports': ports,
+        'block_lu': {b['Id']: b for b in blocks},
+        'connection_lu': {c['Id']: c for c in connections},
+        'port_lu': {p['Id']: p for p in ports},
+    }
+
+
+def benchmark(nr_blocks: int):
+    data = mk_program(nr_blocks)
+    mcu_block = data['blocks'][0]['Id']
+
+    t0 = perf_counter()
+    ProgramGraph(data)
+    t_graph = perf_counter() - t0
+
+    t0 = perf_counter()
+    code = gen.ArduinoCodeGenerator('benchmark', data, mcu_block).full_program()
+    t_generate = perf_counter() - t0
+
+    print(f"{len(data['blocks']):6} blocks | graph: {t_graph*1000:8.1f} ms | "
+          f"generate: {t_generate*1000:8.1f} ms | {len(code.splitlines())} lines")
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [100, 1000]
+    for n in sizes:
+        benchmark(n)
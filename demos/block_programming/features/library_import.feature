@@ -0,0 +1,66 @@
+Feature: Import a library of blocks
+
+    Background:
+        Given the MCU description STM32F446RETx.xml
+            """
+            <?xml version="1.0" encoding="UTF-8" standalone="no"?>
+            <Mcu xmlns="http://mcd.rou.st.com/modules.php?name=mcu" Family="STM32F4" Package="LQFP64" RefName="STM32F446RETx">
+                <Core>Arm Cortex-M4</Core>
+                <IP InstanceName="ADC1" Name="ADC" Version="aditf2_v1_1Cube"/>
+                <IP InstanceName="TIM1" Name="TIM1_8" Version="gptimer2_v2_x_Cube"/>
+                <IP InstanceName="USART2" Name="USART" Version="sci2_v1_1_Cube"/>
+                <Pin Name="VBAT" Position="1" Type="Power"/>
+                <Pin Name="PC13" Position="2" Type="I/O">
+                    <Signal Name="GPIO"/>
+                    <Signal Name="RTC_TAMP1"/>
+                </Pin>
+                <Pin Name="PA0-WKUP" Position="14" Type="I/O">
+                    <Signal Name="ADC1_IN0"/>
+                    <Signal Name="TIM2_CH1"/>
+                </Pin>
+            </Mcu>
+            """
+
+    Scenario: reading an MCU description
+        When parsing the MCU descriptions
+        Then the package of STM32F446RETx is LQFP64
+        And the pins of STM32F446RETx are
+            | position | name     | signals           |
+            | 1        | VBAT     |                   |
+            | 2        | PC13     | GPIO,RTC_TAMP1    |
+            | 14       | PA0-WKUP | ADC1_IN0,TIM2_CH1 |
+        And the peripherals of STM32F446RETx are
+            | name   | instance |
+            | ADC    | ADC1     |
+            | TIM1_8 | TIM1     |
+            | USART  | USART2   |
+
+    Scenario: parsed descriptions are cached
+        When parsing the MCU descriptions with a cache
+        Then 1 MCU descriptions are parsed
+        When parsing the MCU descriptions with a cache
+        Then 0 MCU descriptions are parsed
+        And the MCU descriptions are the same as before
+        When the MCU description STM32F446RETx.xml is changed
+        And parsing the MCU descriptions with a cache
+        Then 1 MCU descriptions are parsed
+        And the cache contains 2 MCU descriptions
+
+    Scenario: storing a library
+        Given an empty database
+        And a library with the Basic IO blocks and the MCU descriptions
+        When storing the library as stdlib in a dry run
+        Then the changes are 63 added, 0 removed and 0 changed
+        And the library stdlib contains 0 items
+        When storing the library as stdlib
+        Then the library stdlib contains 63 items
+        And the Ids of the stored items in stdlib match their details
+        When storing the library as stdlib in a dry run
+        Then the changes are 0 added, 0 removed and 0 changed
+        When block DO is removed from the library
+        And block Clock gets an extra parameter offset
+        And storing the library as stdlib in a dry run
+        Then the changes are 0 added, 4 removed and 1 changed
+        When storing the library as stdlib
+        Then the library stdlib contains 59 items
+        And the Ids of the stored items in stdlib match their details
@@ -0,0 +1,29 @@
+Feature: Generate the projects for several programs
+
+    Background:
+        Given the programs
+            | diagram | name    |
+            | 1       | blinky  |
+            | 2       | flasher |
+            | 3       | counter |
+
+    Scenario: loading the programs
+        When loading the programs blinky, counter
+        Then the diagrams loaded are 1, 3
+
+    Scenario: generating the code for programs in parallel
+        When loading the programs blinky, flasher, counter
+        And generating the code with 2 jobs
+        Then the code of blinky is the same as when it is generated on its own
+        And the code of flasher is the same as when it is generated on its own
+        And the code of counter is the same as when it is generated on its own
+
+    Scenario: projects are copied from a cached template
+        Given a board with a local project template
+        When creating project my-blinky for the board
+        And creating project my-flasher for the board
+        Then the template project was generated 1 times
+        And project my-blinky contains Cargo.toml, src/main.rs
+        And the file my-blinky/Cargo.toml contains 'name = "my-blinky"'
+        And the file my-blinky/src/main.rs contains 'use my_blinky::block_base;'
+        And the file my-flasher/Cargo.toml contains 'name = "my-flasher"'
@@ -0,0 +1,142 @@
+
+import io
+import os.path
+import json
+import tempfile
+import dataclasses
+from contextlib import redirect_stdout
+
+from behave import *
+import library_import
+import set_std_library
+from build import block_programming_data as dm
+
+
+def temporary_dir(context):
+    tmp = tempfile.TemporaryDirectory()
+    context.add_cleanup(tmp.cleanup)
+    return tmp.name
+
+def parse_mcus(context, cache=None):
+    """ Parse the MCU descriptions, and record the progress reports. """
+    context.progress = []
+    files = sorted(os.path.join(context.mcu_dir, f) for f in os.listdir(context.mcu_dir))
+    results = library_import.parse_files(files, library_import.parse_mcu_file, cache, 1,
+                                         lambda *report: context.progress.append(report))
+    context.parsed = {os.path.basename(f).split('.')[0]: d for f, d in results.items()}
+
+def library_items(session, name):
+    """ The records in library folder `name`. """
+    for l in session.query(dm._Entity).filter(dm._Entity.parent == 1):
+        if l.subtype == dm.LibraryFolder.__name__ and dm.LibraryFolder.decode(l).name == name:
+            return library_import.load_tree(session, dm._Entity, l.Id, lambda record: record)
+    return []
+
+
+@given('the MCU description {fname}')
+def step_impl(context, fname):
+    context.mcu_dir = os.path.join(temporary_dir(context), 'mcu')
+    os.mkdir(context.mcu_dir)
+    with open(os.path.join(context.mcu_dir, fname), 'w') as f:
+        f.write(context.text)
+
+@when('the MCU description {fname} is changed')
+def step_impl(context, fname):
+    with open(os.path.join(context.mcu_dir, fname), 'a') as f:
+        f.write('\n<!-- Changed -->\n')
+
+@when('parsing the MCU descriptions')
+def step_impl(context):
+    parse_mcus(context)
+
+@when('parsing the MCU descriptions with a cache')
+def step_impl(context):
+    if 'cache' not in context:
+        context.cache = library_import.ParseCache(os.path.join(os.path.dirname(context.mcu_dir), 'cache'))
+    context.previous = context.parsed if 'parsed' in context else None
+    parse_mcus(context, context.cache)
+
+@then('the package of {mcu} is {package}')
+def step_impl(context, mcu, package):
+    assert context.parsed[mcu]['package'] == package, context.parsed[mcu]['package']
+
+@then('the pins of {mcu} are')
+def step_impl(context, mcu):
+    expected = [[r['position'], r['name'], r['signals'].split(',') if r['signals'] else []] for r in context.table]
+    assert context.parsed[mcu]['pins'] == expected, context.parsed[mcu]['pins']
+
+@then('the peripherals of {mcu} are')
+def step_impl(context, mcu):
+    expected = [[r['name'], r['instance']] for r in context.table]
+    assert context.parsed[mcu]['ips'] == expected, context.parsed[mcu]['ips']
+
+@then('{count:d} MCU descriptions are parsed')
+def step_impl(context, count):
+    # The first progress report counts the files that were read from the cache.
+    _, cached, total = context.progress[0]
+    assert total - cached == count, context.progress
+
+@then('the MCU descriptions are the same as before')
+def step_impl(context):
+    assert context.parsed == context.previous, context.parsed
+
+@then('the cache contains {count:d} MCU descriptions')
+def step_impl(context, count):
+    assert len(os.listdir(context.cache.directory)) == count, os.listdir(context.cache.directory)
+
+
+@given('an empty database')
+def step_impl(context):
+    original = dm.engine, dm.Session
+    def restore():
+        dm.engine.dispose()
+        dm.engine, dm.Session = original
+    context.add_cleanup(restore)
+    dm.changeDbase('sqlite://')
+
+@given('a library with the Basic IO blocks and the MCU descriptions')
+def step_impl(context):
+    parse_mcus(context)
+    context.library = {
+        'Basic IO': dict(set_std_library.stdlib['Basic IO']),
+        'Micro Controllers': {name: set_std_library.mcu_blocks(d) for name, d in context.parsed.items()}
+    }
+
+@when('block {block:w} is removed from the library')
+def step_impl(context, block):
+    del context.library['Basic IO'][block]
+
+@when('block {block:w} gets an extra parameter {name:w}')
+def step_impl(context, block, name):
+    definition = context.library['Basic IO'][block]
+    parameters = dict(definition.parameters, **{name: set_std_library.Parameter(int, 0)})
+    context.library['Basic IO'][block] = dataclasses.replace(definition, parameters=parameters)
+
+@when('storing the library as {name:w} in a dry run')
+def step_impl(context, name):
+    with redirect_stdout(report := io.StringIO()):
+        set_std_library.store_library(name, context.library, dry_run=True)
+    context.report = report.getvalue()
+
+@when('storing the library as {name:w}')
+def step_impl(context, name):
+    with redirect_stdout(io.StringIO()):
+        set_std_library.store_library(name, context.library)
+
+@then('the changes are {added:d} added, {removed:d} removed and {changed:d} changed')
+def step_impl(context, added, removed, changed):
+    counts = dict(line.split(': ') for line in context.report.splitlines() if not line.startswith(' '))
+    assert counts == {'Added': str(added), 'Removed': str(removed), 'Changed': str(changed)}, context.report
+
+@then('the library {name:w} contains {count:d} items')
+def step_impl(context, name, count):
+    with dm.session_context() as session:
+        items = library_items(session, name)
+        assert len(items) == count, len(items)
+
+@then('the Ids of the stored items in {name:w} match their details')
+def step_impl(context, name):
+    with dm.session_context() as session:
+        for record in library_items(session, name):
+            details = json.loads(record.details)
+            assert (details['Id'], details['parent']) == (record.Id, record.parent), (record.Id, details)
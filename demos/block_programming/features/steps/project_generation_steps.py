@@ -0,0 +1,91 @@
+
+import os
+import tempfile
+
+from behave import *
+import generate_rust_embedded as gen
+import project_generator
+from benchmark_code_generation import mk_program
+from supported_mcus import CpuSupport, create_from_template
+
+
+def names(text):
+    return [n.strip() for n in text.split(',') if n.strip() not in ['', 'none']]
+
+def diagram_data(context, diagram):
+    """ The exported data of a program, with more blocks in each next diagram. """
+    return mk_program(diagram + 2)
+
+def program_diagram(context, name):
+    return next(d for d, u in context.units.items() if u.name == name)
+
+
+@given('the programs')
+def step_impl(context):
+    context.diagrams = {int(r['diagram']): r['name'] for r in context.table}
+
+@when('loading the programs {programs}')
+def step_impl(context, programs):
+    context.loaded = []
+    def load_diagram(diagram):
+        context.loaded.append(diagram)
+        return diagram_data(context, diagram)
+    by_name = {n: i for i, n in context.diagrams.items()}
+    context.units = project_generator.load_units({n: by_name[n] for n in names(programs)}, load_diagram)
+
+@when('generating the code with {jobs:d} jobs')
+def step_impl(context, jobs):
+    context.code = project_generator.generate_code(context.units, jobs)
+
+@then('the diagrams loaded are {diagrams}')
+def step_impl(context, diagrams):
+    assert sorted(context.loaded) == [int(d) for d in names(diagrams)], context.loaded
+
+@then('the code of {program} is the same as when it is generated on its own')
+def step_impl(context, program):
+    diagram = program_diagram(context, program)
+    data = diagram_data(context, diagram)
+    expected = gen.ArduinoCodeGenerator(program, data, data['blocks'][0]['Id']).full_program()
+    assert context.code[diagram] == expected, context.code[diagram]
+
+
+@given('a board with a local project template')
+def step_impl(context):
+    tmp = tempfile.TemporaryDirectory()
+    context.add_cleanup(tmp.cleanup)
+    cwd = os.getcwd()
+    context.add_cleanup(os.chdir, cwd)
+    os.chdir(tmp.name)
+
+    context.generated = 0
+    def create_project(project_name, cpu_support, destination):
+        # Stands in for `cargo generate`, including the files of a build.
+        context.generated += 1
+        files = {'Cargo.toml': f'[package]\nname = "{project_name}"\n',
+                 'src/main.rs': f'use {project_name.replace("-", "_")}::block_base;\n',
+                 'target/debug/program': '', '.git/HEAD': ''}
+        for fname, text in files.items():
+            path = os.path.join(destination, project_name, fname)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(text)
+    context.board = CpuSupport('test_board', 'Test board', 'templates/test_board', '', create_project)
+
+@when('creating project {name} for the board')
+def step_impl(context, name):
+    create_from_template(name, context.board, 'build/project_templates')
+
+@then('the template project was generated {count:d} times')
+def step_impl(context, count):
+    assert context.generated == count, context.generated
+
+@then('project {name} contains {fnames}')
+def step_impl(context, name, fnames):
+    found = sorted(os.path.relpath(os.path.join(root, f), name) for root, _, files in os.walk(name) for f in files)
+    assert found == sorted(names(fnames)), found
+
+@then("the file {fname} contains '{text}'")
+def step_impl(context, fname, text):
+    with open(fname) as f:
+        contents = f.read()
+    assert text in contents, contents
@@ -1,15 +1,17 @@
 #!/usr/bin/env python3
 
 import sys
+import glob
+import shutil
 import argparse
 from dataclasses import dataclass
 from typing import List, Dict, Any, Optional
 import os.path
-import subprocess
 import yaml
 
 from supported_mcus import CpuSupport
-from supported_mcus import supported_mcus
+from supported_mcus import supported_mcus, create_from_template
+from program_graph import ProgramGraph
 
 
 try:
@@ -70,64 +72,59 @@ class ProgramData:
         return base_dict
 
 
-def get_program_data(name: str) -> Optional[ProgramData]:
-    """ name: path to the program, including its own name."""
+def find_program(name: str) -> Optional[int]:
+    """ Return the Id of the diagram of a program.
+        name: path to the program, including its own name.
+    """
     #  For now, only support root programs.
     assert '/' not in name
 
-    # First find the diagram _entity
-    with dm.session_context() as session:
-        result = session.query(dm._Entity).filter(dm._Entity.type == dm.EntityType.Diagram
-             and dm._Entity.subtype == 'ProgramDefinition'
-             and dm._Entity.parent == 2
-        ).all()
-
-        diagrams = [dm.AWrapper.load_from_db(repr) for repr in result]
-        diagram = [d for d in diagrams if getattr(d, 'name', '') == name]
-        if len(diagram) != 1:
-            return None
-
-        # Find the elements associated with the program (diagram)
-        # Plus the associated model item
-        result = (session.query(dm._Representation, dm._Entity)
-                  .filter(dm._Representation.diagram == diagram[0].Id)
-                  .filter(dm._Entity.Id == dm._Representation.entity)
-                  .all())
-
-        data = []
-        for repr, entity in result:
-            d = dm.AWrapper.load_from_db(repr)
-            d._entity = dm.AWrapper.load_from_db(entity)
-            data.append(d)
-
-        # Return the blocks and connections
-        blocks = [d for d in data if d.category in [dm.ReprCategory.block, dm.ReprCategory.block_instance]]
-        relationships = [d for d in data if d.category == dm.ReprCategory.relationship]
-        ports = {d.Id:d for d in data if d.category == dm.ReprCategory.port}
-        return ProgramData(blocks, relationships, ports)
-
-def write_resource_getter(port: dict, data:dict) -> str:
-    connection = [c for c in data['connections'] if c['target'] == port['Id']]
-    if not connection:
+    diagram = [d.Id for d in dm.iter_entities(dm.ProgramDefinition) if d.name == name]
+    if len(diagram) != 1:
+        return None
+    return diagram[0]
+
+
+def get_program_data(name: str) -> Optional[ProgramData]:
+    """ name: path to the program, including its own name."""
+    diagram_id = find_program(name)
+    if diagram_id is None:
+        return None
+    return get_diagram_data(diagram_id)
+
+
+def get_diagram_data(diagram_id: int) -> ProgramData:
+    """ Load the blocks, connections and ports in the diagram of a program. """
+    # The elements in the program (diagram), plus the associated model items
+    data = list(dm.iter_diagram_contents(diagram_id))
+
+    # Return the blocks and connections
+    blocks = [d for d in data if d.category in [dm.ReprCategory.block, dm.ReprCategory.block_instance]]
+    relationships = [d for d in data if d.category == dm.ReprCategory.relationship]
+    ports = {d.Id:d for d in data if d.category == dm.ReprCategory.port}
+    return ProgramData(blocks, relationships, ports)
+
+def write_resource_getter(port: dict, graph: ProgramGraph) -> str:
+    source_port = graph.source_port(port['Id'])
+    if source_port is None:
         return 'NoResource()'
     else:
-        source_port = data['port_lu'][connection[0]['source']]
         return f'pins.{source_port['name'].lower()}'
 
 
-def write_block_construction(block, data) -> str:
+def write_block_construction(block, graph: ProgramGraph) -> str:
     values = []
     if block['type_parameters']:
         parameters = block['parameters']
         if isinstance(parameters, dict) and len(parameters) == 1 and 'parameters' in parameters:
             parameters = parameters['parameters']
         values = [repr(parameters[i.split(':')[0]]) for i in block['type_parameters'].split(',')]
-    resources = [p for p in data['ports'] if p['parent_block'] == block['Id'] and p['type_name'] == dm.ConfigInput.__name__]
-    resource_definitions = [write_resource_getter(p, data) for p in resources]
+    resources = graph.block_ports(block['Id'], dm.ConfigInput.__name__)
+    resource_definitions = [write_resource_getter(p, graph) for p in resources]
     values = ', '.join(resource_definitions+values)
     return f'block{block['Id']}({values})'
 
-def write_block_declaration(block: dict, data: dict) -> str:
+def write_block_declaration(block: dict, graph: ProgramGraph) -> str:
     # return f'lib::{block._entity.name} block{block.Id}'
 
     values = []
@@ -136,8 +133,8 @@ def write_block_declaration(block: dict, data: dict) -> str:
         if isinstance(parameters, dict) and len(parameters) == 1 and 'parameters' in parameters:
             parameters = parameters['parameters']
         values = [repr(parameters[i.split(':')[0]]) for i in block['type_parameters'].split(',')]
-    resources = [p for p in data['ports'] if p['parent_block'] == block['Id'] and p['type_name'] == dm.ConfigInput.__name__]
-    resource_definitions = [write_resource_getter(p, data) for p in resources]
+    resources = graph.block_ports(block['Id'], dm.ConfigInput.__name__)
+    resource_definitions = [write_resource_getter(p, graph) for p in resources]
     values = ', '.join(resource_definitions+values)
     return f'lib::{block['type_name']}({values})'
 
@@ -161,31 +158,29 @@ def write_resource_acquisition(connection: dict, port_lu: dict) -> Optional[str]
     resource_name = source_port['name']
     return f'auto& resource{target_port['Id']} = pins.{resource_name.lower()};'
 
-def create_project(name: str, mcu_settings: CpuSupport):
+def create_project(name: str, mcu_settings: CpuSupport, cache_dir: str = 'build/project_templates'):
     # delete the project if it already exists
-    if os.path.exists(name):
-        subprocess.run(f'rm -rf {name}', shell=True)
+    shutil.rmtree(name, ignore_errors=True)
 
-    # Create the project using cargo
+    # Copy the project from a template, that is created using cargo only once.
     project_name = name.replace('_', '-')
-    mcu_settings.create_project(project_name, mcu_settings)
-    subprocess.run(f'cp rust_target/src/*.rs {name}/src', shell=True)
+    create_from_template(project_name, mcu_settings, cache_dir)
+    for fname in glob.glob('rust_target/src/*.rs'):
+        shutil.copy(fname, os.path.join(name, 'src'))
 
 
 def write_program(cpu_support:CpuSupport, data: dict):
     #initializations = [write_resource_acquisition(c, data) for c in data.connections]
-    blocks = [b for b in sorted(data['blocks'], key=lambda i: i['Id']) if b['parent'] is None]
-    block_lu = data['block_lu']
-    port_lu = data['port_lu']
+    graph = ProgramGraph(data)
+    blocks = sorted(graph.children(None), key=lambda i: i['Id'])
     for i, b in enumerate(blocks):
         b['order'] = i
         for port_type in ['Input', 'Output']:
-            for j, port in enumerate(p for p in sorted(data['ports'], key=lambda k: k['Id'])
-                                     if p['parent_block'] == b['Id'] and p['type_name'] == port_type):
+            for j, port in enumerate(sorted(graph.block_ports(b['Id'], port_type), key=lambda k: k['Id'])):
                 port['order'] = j
-    initializations = [write_block_construction(b, data) for b in blocks]
-    block_declarations = [write_block_declaration(b, data) for b in data['blocks']]
-    connections = [write_connection(c, port_lu, block_lu) for c in data['connections']]
+    initializations = [write_block_construction(b, graph) for b in blocks]
+    block_declarations = [write_block_declaration(b, graph) for b in graph.blocks]
+    connections = [write_connection(c, graph.port_lu, graph.block_lu) for c in graph.connections]
 
     initializations = [i for i in initializations if i is not None]
     connections = [c for c in connections if c is not None]
@@ -231,18 +226,19 @@ def indent(prefix: str, text: str) -> str:
 
 
 class ProgramGenerator:
-    def __init__(self, block_id, program_data, mcu_block=None):
+    def __init__(self, block_id, program_data, mcu_block=None, graph: Optional[ProgramGraph] = None):
         self.block_id = block_id
         self.program_data = program_data
-        self.my_blocks = [b for b in self.program_data['blocks'] if b['parent'] == self.block_id]
-        self.mcu_block = self.my_blocks.index(program_data['block_lu'][mcu_block])
-        block_ids = set(b['Id'] for b in self.my_blocks)
-        self.my_ports = [p for p in self.program_data['ports'] if p['parent_block'] in block_ids]
+        self.graph = graph or ProgramGraph(program_data)
+        self.my_blocks = self.graph.children(self.block_id)
+        self.block_order = {b['Id']: i for i, b in enumerate(self.my_blocks)}
+        self.mcu_block = self.block_order[mcu_block]
+        self.my_ports = [p for p in self.graph.ports if p['parent_block'] in self.block_order]
         port_ids = set(p['Id'] for p in self.my_ports)
-        self.my_connections = [c for c in self.program_data['connections'] if c['source'] in port_ids and c['type_name'] != 'ConfigChannel']
+        self.my_connections = [c for c in self.graph.connections if c['source'] in port_ids and c['type_name'] != 'ConfigChannel']
         # Order the ports
-        input_counts = {i:0 for i in block_ids}
-        output_counts = {i:0 for i in block_ids}
+        input_counts = {i:0 for i in self.block_order}
+        output_counts = {i:0 for i in self.block_order}
         for p in self.my_ports:
             # Don't order the configuration ports: those are for compile time, not runtime connections.
             if 'config' in p['type_name'].lower():
@@ -253,7 +249,18 @@ class ProgramGenerator:
             else:
                 p['order'] = input_counts[p['parent_block']]
                 input_counts[p['parent_block']] += 1
-        pass
+
+        # The resources used by the blocks become the parameters of the program.
+        self.my_parameters = []
+        for p in self.my_ports:
+            if p['type_name'] == dm.ConfigInput.__name__:
+                source = self.graph.source_port(p['Id'])
+                self.my_parameters.append((p['name'], p['parent_block'], lookup_resource_type(p), p['Id'],
+                                           source['Id'] if source else None))
+        self.parameter_order = {p[3]: i for i, p in enumerate(self.my_parameters)}
+        self.block_parameters = {}
+        for i, p in enumerate(self.my_parameters):
+            self.block_parameters.setdefault(p[1], []).append(f'P{i}')
 
     @property
     def inner_blocks(self):
@@ -263,11 +270,8 @@ class ProgramGenerator:
         return self.my_ports
     @property
     def parameters(self):
-        """ Return a tuple (name, recipient, type, port_id) """
-        config_ports = [p for p in self.inner_ports if p['type_name'] == 'ConfigInput']
-        connection_lu = {c['target']: c['source'] for c in self.program_data['connections']}
-        return [(p['name'], p['parent_block'], lookup_resource_type(p), p['Id'], connection_lu.get(p['Id'], None))
-                for p in config_ports]
+        """ Return a tuple (name, recipient, type, port_id, source_port_id) """
+        return self.my_parameters
 
     @property
     def connections(self):
@@ -286,11 +290,9 @@ class ProgramGenerator:
             else:
                 type_parameters_names = type_parameters.keys()
             values = [repr(parameters[k]) for k in type_parameters_names]
-        resources = [p for p in self.program_data['ports'] if
-                     p['parent_block'] == block['Id'] and p['type_name'] == dm.ConfigInput.__name__]
+        resources = self.graph.resources(block['Id'])
         if resources:
-            resource_order_lu = {p[3]: i for i, p in enumerate(self.parameters)}
-            resource_txts = [f'P{resource_order_lu[p['Id']]}' for p in resources]
+            resource_txts = [f'P{self.parameter_order[p['Id']]}' for p in resources]
             resource_definitions = [r.lower() for r in resource_txts]
             resource_txt = ', '.join(resource_txts)
             values = ', '.join(resource_definitions + values)
@@ -299,21 +301,19 @@ class ProgramGenerator:
         return f'lib::{block['type_name']}::new({values})'
 
     def connection_constructor(self, connection_id:int) -> str:
-        order = {b['Id']:i for i, b in enumerate(self.inner_blocks)}
         connection = self.connections[connection_id]
-        port_lu = self.program_data['port_lu']
-        block_lu = self.program_data['block_lu']
+        port_lu = self.graph.port_lu
         if connection['type_name'] == dm.ConfigChannel.__name__:
             return ''
         source_port = port_lu[connection['source']]
         target_port = port_lu[connection['target']]
-        source_block = order[source_port['parent_block']]
-        target_block = order[target_port['parent_block']]
+        source_block = self.block_order[source_port['parent_block']]
+        target_block = self.block_order[target_port['parent_block']]
         return (f'Connection(({source_block}, {source_port['order']}),'
                 f'({target_block}, {target_port['order']}))')
 
     def get_program_name(self):
-        return self.program_data['block_lu'][self.block_id] if self.block_id else "TheProgram"
+        return self.graph.block_lu[self.block_id] if self.block_id else "TheProgram"
 
     def get_param_decl(self):
         if parameters := self.parameters:
@@ -332,28 +332,20 @@ class ProgramGenerator:
 
     def get_block_decl(self, b_id):
         b = self.inner_blocks[b_id]
-        parameter_lu = {p[1]: p for p in self.parameters}
         result = f'lib::{b['type_name']}'
-        if b['Id'] in parameter_lu:
-            pargs = '<' + ','.join(f'P{i}' for i, p in enumerate(self.parameters) if p[1] == b['Id']) + '>'
-            result += pargs
+        if b['Id'] in self.block_parameters:
+            result += '<' + ','.join(self.block_parameters[b['Id']]) + '>'
         return result
 
     def get_blocks_decl(self):
-        block_params = {}
-        for i, p in enumerate(self.parameters):
-            if p[1] not in block_params:
-                block_params[p[1]] = [f'P{i}']
-            else:
-                block_params[p[1]].append(f'P{i}')
-        block_params = {i: '<'+', '.join(v)+'>' for i, v in block_params.items()}
+        block_params = {i: '<'+', '.join(v)+'>' for i, v in self.block_parameters.items()}
         return ',\n                '.join(f'block{i}: lib::{b['type_name']}{block_params.get(b['Id'], '')}' for i, b in enumerate(self.inner_blocks))
 
     def get_program_instance_args(self):
         """ Determine the arguments to pass to a program when instantiating it. """
         args = []
         for parameter in self.parameters:
-            resource = self.program_data['port_lu'][parameter[4]]
+            resource = self.graph.port_lu[parameter[4]]
             match parameter[2]:
                 case 'OutputPin':
                     args.append(f'pins.{resource['name'].lower()}.into_output()')
@@ -421,9 +413,10 @@ class ArduinoCodeGenerator:
         self.name = name
         self.program_data = program_data
         self.mcu_block = mcu_block
+        self.graph = ProgramGraph(program_data)
 
     def get_program_generator(self, block_id):
-        return ProgramGenerator(block_id, self.program_data, self.mcu_block)
+        return ProgramGenerator(block_id, self.program_data, self.mcu_block, self.graph)
 
     def full_program(self):
         program_generator = self.get_program_generator(None)
@@ -471,29 +464,16 @@ if __name__ == '__main__':
     parser.add_argument('program_name', nargs='*', )
     parser.add_argument('--test', '-t', action='store_true')
     parser.add_argument('--export-data', '-d', action='store_true')
+    parser.add_argument('--jobs', '-j', type=int, default=None, help='The number of programs rendered in parallel')
+    parser.add_argument('--template-cache', default='build/project_templates',
+                        help='Directory where the empty Rust projects made by `cargo generate` are kept')
     args = parser.parse_args()
 
     if not args.test:
+        import project_generator
         dm.changeDbase('sqlite:///build/data/diagrams.sqlite3')
-        for program_name in args.program_name:
-            data = get_program_data(program_name).export()
-            if not data:
-                print(f"Could not find program named {args.program_name}", file=sys.stderr)
-                sys.exit(1)
-
-            if args.export_data:
-                yaml.dump(data, open(program_name + '.yml', 'w'), sort_keys=True, indent=4)
-
-            # Find the MCU being used in the program
-            supported_mcus = {m.name: m for m in supported_mcus}
-            mcu_block = [b for b in data['blocks'] if b['type_name'] in supported_mcus]
-            assert len(mcu_block) == 1
-            mcu_settings = supported_mcus[mcu_block[0]['type_name']]
-            proj_name = program_name.replace('_', '-')
-            create_project(proj_name, mcu_settings)
-
-            generator = ArduinoCodeGenerator(proj_name, data, 1)
-            open(f'{proj_name}/src/main.rs', 'w').write(generator.full_program())
+        sys.exit(project_generator.generate_projects(args.program_name, args.jobs, args.export_data,
+                                                     args.template_cache))
     else:
         define_tests()
         from test_frame import run_tests
@@ -8,7 +8,6 @@ from typing import Dict, Optional, Any
 
 import build.public.block_programming_client as client
 import build.block_programming_data as server_data
-import sqlite3
 
 from browser import ajax
 
@@ -49,14 +48,12 @@ class IntegrationContext(ic.IntegrationContext):
 
 test_diagram_name = 'integration_test_program'
 def delete_test_diagram():
-    dbfile = 'build/data/diagrams.sqlite3'
-    db = sqlite3.connect(dbfile)
-    cur = db.cursor()
-    diagrams = cur.execute(f'SELECT Id FROM _entity WHERE parent == 2 AND json_extract(details, "$.name")="{test_diagram_name}";')
-    for data in diagrams:
-        cur.execute(f'DELETE FROM _representation WHERE diagram == {data[0]};')
-        cur.execute(f'DELETE FROM _entity WHERE Id == {data[0]};')
-    db.commit()
+    server_data.changeDbase('sqlite:///build/data/diagrams.sqlite3')
+    diagrams = [d.Id for d in server_data.iter_children(2) if getattr(d, 'name', '') == test_diagram_name]
+    with server_data.session_context() as session:
+        for Id in diagrams:
+            session.query(server_data._Representation).filter(server_data._Representation.diagram == Id).delete()
+            session.query(server_data._Entity).filter(server_data._Entity.Id == Id).delete()
 
 @prepare
 def prepare_integration_checks():
@@ -0,0 +1,204 @@
+""" Support for importing large libraries of blocks into the database.
+
+Reading the vendor descriptions of micro controllers is the slow part of building the library. The files are
+parsed in parallel, with a streaming parser, into a small intermediate representation. That representation is
+cached on disk, keyed by the hash of the file, so unchanged files are only parsed once.
+
+The library itself is stored in a single transaction, with all records inserted at once.
+Before storing, the new library can be compared with the library in the database (a dry run).
+"""
+import os
+import sys
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from xml.etree import ElementTree as ET
+
+from sqlalchemy import func, insert
+
+
+# Increase when the intermediate representation changes, so cached results are not used anymore.
+PARSER_VERSION = 1
+
+MCU_NS = '{http://mcd.rou.st.com/modules.php?name=mcu}'
+
+
+def report_progress(stage: str, done: int, total: int):
+    """ The default progress report: a single line on stderr that is updated. """
+    print(f'\r{stage}: {done}/{total}', end='\n' if done == total else '', file=sys.stderr, flush=True)
+
+
+def parse_mcu_file(fname: str) -> Dict[str, Any]:
+    """ Read the package, pins and peripherals from an STM32 MCU description, without building the whole tree.
+
+        Returns a dictionary that can be stored as JSON:
+            package: the name of the package, e.g. LQFP64
+            pins: a list of [position, name, [signal names]]
+            ips: a list of [peripheral name, instance name]
+    """
+    package = None
+    pins = []
+    ips = []
+    signals = []
+    stack = []
+    for event, elem in ET.iterparse(fname, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem.tag)
+            if len(stack) == 1:
+                package = elem.attrib.get('Package')
+            elif elem.tag == MCU_NS + 'Pin':
+                signals = []
+            continue
+
+        stack.pop()
+        parent = stack[-1] if stack else None
+        if elem.tag == MCU_NS + 'Signal' and parent == MCU_NS + 'Pin':
+            signals.append(elem.attrib['Name'])
+        elif elem.tag == MCU_NS + 'Pin':
+            pins.append([elem.attrib['Position'], elem.attrib['Name'], signals])
+            elem.clear()
+        elif elem.tag == MCU_NS + 'IP' and len(stack) == 1:
+            ips.append([elem.attrib['Name'], elem.attrib['InstanceName']])
+            elem.clear()
+    return {'package': package, 'pins': pins, 'ips': ips}
+
+
+def file_hash(fname: str) -> str:
+    h = hashlib.sha1(str(PARSER_VERSION).encode('utf8'))
+    with open(fname, 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+class ParseCache:
+    """ Parsed files, stored as JSON files named after the hash of the original file. """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            with open(self.path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, value: Any):
+        tmp = self.path(key) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp, self.path(key))
+
+
+def parse_files(files: List[str], parse: Callable[[str], Any] = parse_mcu_file, cache: Optional[ParseCache] = None,
+                jobs: Optional[int] = None, progress: Callable[[str, int, int], None] = report_progress) \
+        -> Dict[str, Any]:
+    """ Parse files in parallel. Returns the result of `parse` for each file.
+        `parse` must be a module-level function, so it can be called in another process.
+    """
+    results = {}
+    keys = {}
+    todo = []
+    for f in files:
+        keys[f] = key = file_hash(f)
+        cached = cache.get(key) if cache else None
+        if cached is None:
+            todo.append(f)
+        else:
+            results[f] = cached
+
+    done = len(results)
+    progress('Parsing', done, len(files))
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for f, result in zip(todo, executor.map(parse, todo)):
+                results[f] = result
+                if cache:
+                    cache.put(keys[f], result)
+                done += 1
+                progress('Parsing', done, len(files))
+    return {f: results[f] for f in files}
+
+
+def next_id(session, table) -> int:
+    return (session.query(func.max(table.Id)).scalar() or 0) + 1
+
+
+def assign_ids(objects: Iterable[Any], first_id: int) -> List[Any]:
+    """ Give new objects consecutive Ids, as they are produced.
+        When `objects` is a generator, it can use the Id of an object (e.g. as parent) after it was yielded.
+        This assumes no other process adds records while the objects are stored.
+    """
+    result = []
+    for i, obj in enumerate(objects):
+        obj.Id = first_id + i
+        result.append(obj)
+    return result
+
+
+def insert_all(session, objects: List[Any], progress: Callable[[str, int, int], None] = report_progress):
+    """ Insert new entities (`AWrapper` instances with their Id set) with a single statement per table.
+        This is much faster than `store`, which commits twice for each entity to find its Id.
+        The caller commits the transaction.
+    """
+    by_table: Dict[Any, List[Dict[str, Any]]] = {}
+    for obj in objects:
+        rows = by_table.setdefault(obj.get_db_table(), [])
+        rows.append(dict(obj.extract_record_values(), Id=obj.Id, details=obj.asjson()))
+    done = 0
+    for table, rows in by_table.items():
+        session.execute(insert(table), rows)
+        done += len(rows)
+        progress('Storing', done, len(objects))
+
+
+def load_tree(session, table, root_id: int, decode: Callable[[Any], Any]) -> List[Any]:
+    """ Load all records below `root_id`, and decode them into entities. """
+    children: Dict[int, List[int]] = {}
+    for Id, parent in session.query(table.Id, table.parent):
+        children.setdefault(parent, []).append(Id)
+    ids = []
+    todo = [root_id]
+    while todo:
+        ids.extend(c := children.get(todo.pop(), []))
+        todo.extend(c)
+    result = []
+    # Stay below the maximum number of parameters in a query.
+    for i in range(0, len(ids), 500):
+        result.extend(decode(r) for r in session.query(table).filter(table.Id.in_(ids[i:i+500])))
+    return result
+
+
+def tree_contents(objects: Iterable[Any], root_id: int) -> Dict[Tuple[str, ...], Dict[str, Any]]:
+    """ Describe the objects below `root_id` by their path of names, e.g. ('LibraryFolder math', 'BlockDefinition gain').
+        The details of each object exclude the Ids, so trees stored at different times can be compared.
+        Objects with the same path (same class and name in the same folder) are not distinguished.
+    """
+    children: Dict[int, List[Any]] = {}
+    for obj in objects:
+        children.setdefault(obj.parent, []).append(obj)
+    contents = {}
+    todo = [(root_id, ())]
+    while todo:
+        parent_id, prefix = todo.pop()
+        for obj in children.get(parent_id, []):
+            path = prefix + (f'{type(obj).__name__} {getattr(obj, "name", "")}',)
+            # Compare the details as they are stored in the database.
+            contents[path] = {k: v for k, v in json.loads(obj.asjson()).items() if k not in ['Id', 'parent']}
+            todo.append((obj.Id, path))
+    return contents
+
+
+def diff_trees(old: Dict[Tuple[str, ...], Dict[str, Any]], new: Dict[Tuple[str, ...], Dict[str, Any]]) \
+        -> Tuple[List[str], List[str], List[str]]:
+    """ Compare two results of `tree_contents`. Returns the paths that were added, removed and changed. """
+    def fmt(paths):
+        return sorted(' / '.join(p) for p in paths)
+    added = fmt(new.keys() - old.keys())
+    removed = fmt(old.keys() - new.keys())
+    changed = fmt(p for p in new.keys() & old.keys() if new[p] != old[p])
+    return added, removed, changed
@@ -0,0 +1,61 @@
+""" Indexed lookups on the exported data of a program.
+
+The code generators need, for each block, its ports, and for each port, the connections to and from it.
+Searching the lists of blocks, ports and connections for these makes generating large programs quadratic.
+A `ProgramGraph` builds the indices once per program, after which each lookup is a dictionary access.
+"""
+from typing import Any, Dict, List, Optional
+
+
+ConfigInput = 'ConfigInput'
+
+
+class ProgramGraph:
+    """ The blocks, ports and connections of a program, as exported by `ProgramData.export`.
+        The lookups return the dictionaries of the exported data, in the order they have in that data.
+    """
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.blocks: List[dict] = data['blocks']
+        self.ports: List[dict] = data['ports']
+        self.connections: List[dict] = data['connections']
+        self.block_lu: Dict[int, dict] = data.get('block_lu') or {int(b['Id']): b for b in self.blocks}
+        self.port_lu: Dict[int, dict] = data.get('port_lu') or {int(p['Id']): p for p in self.ports}
+
+        self.blocks_by_parent: Dict[Optional[int], List[dict]] = {}
+        for b in self.blocks:
+            self.blocks_by_parent.setdefault(b['parent'], []).append(b)
+
+        # Ports by parent block, and by parent block and type.
+        self.ports_by_block: Dict[int, List[dict]] = {}
+        self.ports_by_block_type: Dict[tuple, List[dict]] = {}
+        for p in self.ports:
+            self.ports_by_block.setdefault(p['parent_block'], []).append(p)
+            self.ports_by_block_type.setdefault((p['parent_block'], p['type_name']), []).append(p)
+
+        self.connections_by_target: Dict[int, List[dict]] = {}
+        for c in self.connections:
+            self.connections_by_target.setdefault(c['target'], []).append(c)
+
+    def children(self, parent_id: Optional[int]) -> List[dict]:
+        """ The blocks directly inside a block, or the top-level blocks for parent None. """
+        return self.blocks_by_parent.get(parent_id, [])
+
+    def block_ports(self, block_id: int, type_name: Optional[str] = None) -> List[dict]:
+        """ The ports of a block, optionally only those of a specific type. """
+        if type_name is None:
+            return self.ports_by_block.get(block_id, [])
+        return self.ports_by_block_type.get((block_id, type_name), [])
+
+    def resources(self, block_id: int) -> List[dict]:
+        """ The resources a block needs, i.e. its configuration inputs. """
+        return self.block_ports(block_id, ConfigInput)
+
+    def incoming(self, port_id: int) -> List[dict]:
+        return self.connections_by_target.get(port_id, [])
+
+    def source_port(self, port_id: int) -> Optional[dict]:
+        """ The port connected to an input port, if any. """
+        if connections := self.incoming(port_id):
+            return self.port_lu[connections[0]['source']]
+        return None
@@ -0,0 +1,97 @@
+""" Generating the code for several programs at once.
+
+The project generator loads each program once and renders the programs in parallel.
+The Rust project for each program is copied from a cached template project.
+"""
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+import generate_rust_embedded as gen
+from supported_mcus import CpuSupport, supported_mcus
+
+
+@dataclass
+class CodeUnit:
+    """ A program: the contents of a single diagram. """
+    diagram: int
+    name: str
+    data: Dict[str, Any]
+
+
+def load_units(programs: Dict[str, int], load_diagram: Callable[[int], Dict[str, Any]]) -> Dict[int, CodeUnit]:
+    """ Load the programs. Each diagram is loaded once.
+        programs: the Id of the diagram of each program, by name.
+        load_diagram: returns the exported data (see `ProgramData.export`) of a diagram.
+    """
+    units = {}
+    for name, diagram in programs.items():
+        if diagram not in units:
+            units[diagram] = CodeUnit(diagram, name, load_diagram(diagram))
+    return units
+
+
+def find_mcu(data: Dict[str, Any]) -> Tuple[CpuSupport, int]:
+    """ Return the settings for the micro controller used in a program, and the Id of its block. """
+    mcus = {m.name: m for m in supported_mcus}
+    mcu_blocks = [b for b in data['blocks'] if b['type_name'] in mcus]
+    if len(mcu_blocks) != 1:
+        raise ValueError(f"A program must contain exactly one supported micro controller, found {len(mcu_blocks)}")
+    return mcus[mcu_blocks[0]['type_name']], mcu_blocks[0]['Id']
+
+
+def render_program(unit: CodeUnit) -> str:
+    _, mcu_block = find_mcu(unit.data)
+    generator = gen.ArduinoCodeGenerator(unit.name.replace('_', '-'), unit.data, mcu_block)
+    return generator.full_program()
+
+
+def parallel_map(function: Callable, jobs: Optional[int], *arguments: List[Any]) -> List[Any]:
+    """ Call a module-level function for each set of arguments, in separate processes. """
+    count = len(arguments[0])
+    jobs = min(jobs or os.cpu_count() or 1, count)
+    if jobs <= 1:
+        return [function(*args) for args in zip(*arguments)]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(function, *arguments))
+
+
+def generate_code(units: Dict[int, CodeUnit], jobs: Optional[int] = None) -> Dict[int, str]:
+    """ Return the code of main.rs for each program, by the Id of its diagram. """
+    programs = list(units.values())
+    return dict(zip([u.diagram for u in programs], parallel_map(render_program, jobs, programs)))
+
+
+def generate_projects(program_names: List[str], jobs: Optional[int] = None, export_data: bool = False,
+                      cache_dir: str = 'build/project_templates') -> int:
+    """ Generate a Rust project for each program. Returns the exit code for the command line. """
+    programs = {}
+    for name in program_names:
+        diagram = gen.find_program(name)
+        if diagram is None:
+            print(f"Could not find program named {name}", file=sys.stderr)
+            return 1
+        programs[name] = diagram
+
+    units = load_units(programs, lambda d: gen.get_diagram_data(d).export())
+    if export_data:
+        for name, diagram in programs.items():
+            with open(name + '.yml', 'w') as f:
+                yaml.dump(units[diagram].data, f, sort_keys=True, indent=4)
+
+    try:
+        code = generate_code(units, jobs)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    for name, diagram in programs.items():
+        mcu_settings, _ = find_mcu(units[diagram].data)
+        proj_name = name.replace('_', '-')
+        gen.create_project(proj_name, mcu_settings, cache_dir)
+        with open(f'{proj_name}/src/main.rs', 'w') as f:
+            f.write(code[diagram])
+    return 0
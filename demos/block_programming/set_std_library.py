@@ -1,4 +1,5 @@
 """ Script to load the standard library into the database """
+import argparse
 import glob
 import pathlib
 from enum import IntEnum, auto
@@ -6,8 +7,8 @@ from dataclasses import dataclass, field
 from itertools import chain
 from os import path
 from typing import List, Any, Tuple, Optional, Dict, Generator
-from xml.etree import ElementTree as ET
 
+import library_import
 from build import block_programming_data as dm
 from build.block_programming_data import PinType, PinInterrupt
 
@@ -260,16 +261,10 @@ stdlib = {
     }
 }
 
-def read_pinconfig(fname: pathlib.Path) -> Dict[str, BlockDefinition]:
-    ns = {'mcu': 'http://mcd.rou.st.com/modules.php?name=mcu'}
-    xml = ET.parse(fname)
-    mcu = xml.find('.', ns)
-    pins = {
-        p.attrib['Position']: (p.attrib['Name'], ','.join([s.attrib['Name'] for s in p.findall('mcu:Signal', ns)]))
-        for p in xml.findall('.//mcu:Pin', ns)
-    }
+def mcu_blocks(mcu: Dict[str, Any]) -> Dict[str, BlockDefinition]:
+    """ Create the blocks for a micro controller, from its description as read by `library_import.parse_mcu_file`. """
     orientation_lu = {0: Orientation.LEFT, 1: Orientation.BOTTOM, 2: Orientation.RIGHT, 3: Orientation.TOP}
-    match mcu.attrib['Package']:
+    match mcu['package']:
         case "LQFP32":
             orientations = {str(k+1): (orientation_lu[k // 8], k % 8) for k in range(32)}
         case "LQFP64":
@@ -277,8 +272,9 @@ def read_pinconfig(fname: pathlib.Path) -> Dict[str, BlockDefinition]:
         case "LQFP144":
             orientations = {str(k+1): (orientation_lu[k // 36], k % 36) for k in range(144)}
         case _:
-            raise RuntimeError(f"Packege {mcu.attrib['Package']} not supported")
+            raise RuntimeError(f"Packege {mcu['package']} not supported")
 
+    pins = {position: (name, ','.join(signals)) for position, name, signals in mcu['pins']}
     pin_ports = {f'{k}: {v[0]}': Port(
         PortType.IOConfig,
         orientation=orientations[k][0],
@@ -290,10 +286,10 @@ def read_pinconfig(fname: pathlib.Path) -> Dict[str, BlockDefinition]:
     pc = dm.PeripheralClass
     for name, peripheral_class in dict(TIM1_8=pc.Timer, ADC=pc.Adc, I2C=pc.I2c, UART=pc.Uart, USART=pc.Uart, SPI=pc.Spi,
                                        CAN=pc.Can, WWDG=pc.Watchdog).items():
-        peripherals.update({t.attrib['InstanceName']: Port(
+        peripherals.update({instance: Port(
             PortType.IOConfig,
             data_type=peripheral_class
-        ) for t in mcu.findall('mcu:IP', ns) if t.attrib['Name'] == name})
+        ) for ip, instance in mcu['ips'] if ip == name})
 
     return {
         'io_pins': BlockDefinition('', {}, pin_ports),
@@ -301,9 +297,14 @@ def read_pinconfig(fname: pathlib.Path) -> Dict[str, BlockDefinition]:
     }
 
 
-def read_pinconfigs(p: pathlib.Path, wanted_mcus: List[str]):
-    files = list(chain.from_iterable(glob.glob(path.join(p, w)) for w in wanted_mcus))
-    micro_controllers = {path.basename(f).split('.')[0]: read_pinconfig(f) for f in files}
+def read_pinconfigs(p: str, wanted_mcus: List[str], cache_dir: Optional[str] = None, jobs: Optional[int] = None):
+    """ Read the micro controllers from the STM32 MCU descriptions in directory `p`.
+        The files are parsed in parallel, and the results cached in `cache_dir`.
+    """
+    files = list(chain.from_iterable(sorted(glob.glob(path.join(p, w))) for w in wanted_mcus))
+    cache = library_import.ParseCache(cache_dir) if cache_dir else None
+    descriptions = library_import.parse_files(files, library_import.parse_mcu_file, cache, jobs)
+    micro_controllers = {path.basename(f).split('.')[0]: mcu_blocks(d) for f, d in descriptions.items()}
     return micro_controllers
 
 def arduino():
@@ -313,16 +314,6 @@ def arduino():
     return {'arduino_uno': BlockDefinition(outputs=pins)}
 
 
-mcus = read_pinconfigs(
-    '/opt/st/stm32cubeide_1.16.1/plugins/com.st.stm32cube.common.mx_6.12.1.202409122256/db/mcu',
-    ['STM32F446R*', 'STM32H743ZIT*']
-)
-mcus.update(arduino())
-
-
-stdlib['Micro Controllers'] = mcus
-
-
 def create_instances(lib: Dict, parent: dm.LibraryFolder) -> Generator[dm.LibraryFolder | dm.BlockDefinition, None, None]:
     for name, value in lib.items():
         if isinstance(value, dict):
@@ -361,29 +352,61 @@ def create_instances(lib: Dict, parent: dm.LibraryFolder) -> Generator[dm.Librar
                     case PortType.Buffered:
                         yield dm.BufferedOut(name=n, parent=new_block.Id, data_type=i.data_type.__name__, orientation=Orientation.RIGHT)
 
-def store_library(name: str, library):
+def store_library(name: str, library, dry_run: bool = False):
+    """ Replace the library folder `name` in the database with the contents of `library`.
+        The changes are reported. With `dry_run`, the database is not changed.
+    """
     dm.init_db()
     with dm.session_context() as session:
-        # Delete any existing standard library
         lib = dm.LibraryFolder.retrieve(1, session)
         assert lib.name == 'Library'
-        existing_stdlib = None
+        existing = None
         for l in session.query(dm._Entity).filter(dm._Entity.parent==lib.Id):
             if l.subtype == dm.LibraryFolder.__name__:
                 lo = dm.LibraryFolder.decode(l)
-                if lo.name == 'stdlib':
-                    existing_stdlib = l
-        if existing_stdlib:
+                if lo.name == name:
+                    existing = l
+        old_contents = {}
+        if existing:
+            old_contents = library_import.tree_contents(
+                library_import.load_tree(session, dm._Entity, existing.Id, dm.AWrapper.load_from_db), existing.Id)
+
+        # Create the library objects, with the Ids they will get in the database.
+        library_obj = dm.LibraryFolder(name=name, parent=lib.Id, description='Standard library for use with micro controllers')
+        objects = library_import.assign_ids(chain([library_obj], create_instances(library, library_obj)),
+                                            library_import.next_id(session, dm._Entity))
+
+        added, removed, changed = library_import.diff_trees(
+            old_contents, library_import.tree_contents(objects, library_obj.Id))
+        for title, paths in [('Added', added), ('Removed', removed), ('Changed', changed)]:
+            print(f'{title}: {len(paths)}')
+            if dry_run:
+                for p in paths:
+                    print(f'    {p}')
+        if dry_run:
+            session.rollback()
+            return
+
+        if existing:
             # Because of the parent and "on_cascade - delete" rule, we only need to delete the parent.
-            session.delete(existing_stdlib)
-            session.commit()
-
-        # Create the standard library object. This also tells us which IDs will be generated by the DB.
-        stdlib_obj = dm.LibraryFolder(name='stdlib', parent=lib.Id, description='Standard library for use with micro controllers')
-        stdlib_obj.store(session)
-        assert stdlib_obj.Id
-
-        for b in create_instances(stdlib, stdlib_obj):
-            b.store(session)
-
-store_library('stdlib', stdlib)
+            session.delete(existing)
+            session.flush()
+        library_import.insert_all(session, objects)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load the standard library into the database')
+    parser.add_argument('--mcu-dir', default='/opt/st/stm32cubeide_1.16.1/plugins/com.st.stm32cube.common.mx_6.12.1.202409122256/db/mcu',
+                        help='The directory with the STM32 MCU descriptions')
+    parser.add_argument('--mcus', nargs='*', default=['STM32F446R*', 'STM32H743ZIT*'],
+                        help='Patterns for the MCU description files to read')
+    parser.add_argument('--cache', default='build/library_cache', help='Directory where parsed MCU files are cached')
+    parser.add_argument('--jobs', '-j', type=int, default=None, help='The number of files parsed in parallel')
+    parser.add_argument('--dry-run', action='store_true', help='Only report the differences with the database')
+    args = parser.parse_args()
+
+    mcus = read_pinconfigs(args.mcu_dir, args.mcus, args.cache, args.jobs)
+    mcus.update(arduino())
+    stdlib['Micro Controllers'] = mcus
+
+    store_library('stdlib', stdlib, args.dry_run)
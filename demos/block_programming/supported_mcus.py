@@ -1,4 +1,6 @@
 
+import os
+import shutil
 from dataclasses import dataclass
 from typing import Callable
 import subprocess
@@ -13,11 +15,52 @@ class CpuSupport:
     main_template: str
     create_project: Callable
 
-def create_arduino(project_name, cpu_support):
-    cmd = f'cargo generate --git {cpu_support.cargo_template} -n {project_name} -d board="{cpu_support.board_name}"'
+def create_arduino(project_name, cpu_support, destination='.'):
+    # The template can also be a local directory, e.g. a clone of the template repository.
+    source = '--path' if os.path.isdir(cpu_support.cargo_template) else '--git'
+    cmd = (f'cargo generate {source} {cpu_support.cargo_template} -n {project_name} -d board="{cpu_support.board_name}"'
+           f' --destination {destination}')
     print('Executing:', cmd)
     subprocess.run(cmd,
-                   shell=True)
+                   shell=True, check=True)
+
+
+# The name of the project that is kept as template, and replaced by the name of the actual project.
+template_name = 'dsmgen-template'
+
+
+def project_template(cpu_support, cache_dir='build/project_templates') -> str:
+    """ Return the directory with an empty project for a CPU.
+        The project is only generated (with `cargo generate`) the first time, afterwards it is copied from the cache,
+        so new projects can be made without network access.
+    """
+    directory = os.path.join(cache_dir, cpu_support.name)
+    if not os.path.exists(os.path.join(directory, 'Cargo.toml')):
+        os.makedirs(cache_dir, exist_ok=True)
+        shutil.rmtree(os.path.join(cache_dir, template_name), ignore_errors=True)
+        cpu_support.create_project(template_name, cpu_support, cache_dir)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(os.path.join(cache_dir, template_name), directory)
+    return directory
+
+
+def create_from_template(project_name, cpu_support, cache_dir='build/project_templates'):
+    """ Create a new project by copying the cached template project, and giving it its own name. """
+    template = project_template(cpu_support, cache_dir)
+    shutil.copytree(template, project_name, ignore=shutil.ignore_patterns('target', '.git'))
+    crate_name = project_name.replace('-', '_')
+    for root, _, files in os.walk(project_name):
+        for fname in files:
+            path = os.path.join(root, fname)
+            try:
+                with open(path, encoding='utf8') as f:
+                    text = f.read()
+            except UnicodeDecodeError:
+                continue
+            new_text = text.replace(template_name, project_name).replace(template_name.replace('-', '_'), crate_name)
+            if new_text != text:
+                with open(path, 'w', encoding='utf8') as f:
+                    f.write(new_text)
 
 
 supported_mcus = [
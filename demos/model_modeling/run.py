@@ -19,4 +19,4 @@ import run_project
 specs = glob.glob('*_spec.py')[0]
 project = os.path.basename(specs)[:-8]
 
-run_project.run(specs, project, 5102)
+run_project.run(specs, project, 5102, watch_changes='--watch' in sys.argv)
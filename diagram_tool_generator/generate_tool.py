@@ -34,10 +34,19 @@ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 import os, os.path
 import inspect
 import importlib
-from dataclasses import fields
-from typing import Self, Any, List, Dict
+from dataclasses import dataclass, field, fields
+from typing import Self, Any, List, Dict, Tuple, Callable, Optional
+from collections import Counter, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
 import argparse
 import sys
+import json
+import hashlib
+import stat
+import tempfile
+import traceback
 
 from mako.template import Template
 
@@ -55,16 +64,38 @@ def load_specification(module_name: str, specification):
     return new_mod, spec
 
 
+class FieldTypeCache:
+    """ Memoises the analysis of field types. The templates analyse the same fields many times.
+
+        Results are stored per (owner, field type). Field types are not always hashable, so they are identified by
+        their `id`. The field type is stored with the result, so it can not be replaced by another object with the
+        same `id`. The results are shared: callers must not modify them.
+    """
+    def __init__(self):
+        self.results: Dict[Tuple[Any, int], Tuple[Any, Any]] = {}
+
+    def get(self, owner, field_type, analyse: Callable[[], Any]):
+        key = (owner, id(field_type))
+        entry = self.results.get(key)
+        if entry is None or entry[0] is not field_type:
+            entry = self.results[key] = (field_type, analyse())
+        return entry[1]
+
+
 class Generator:
+    # The options of a field type do not depend on the specification, so these are shared by all generators.
+    type_options_cache = FieldTypeCache()
+
     def __init__(self, config, module_name):
         self.config = config
         self.module_name = module_name
+        self.type_cache = FieldTypeCache()
         md = sys.modules[module_name].md
         self.md = md
 
         # Check for names that are duplicated
         all_names = [c.__name__ for c in md.all_model_items]
-        duplicates = set([x for x in all_names if all_names.count(x) > 1])
+        duplicates = {x for x, count in Counter(all_names).items() if count > 1}
         assert not duplicates, f'Duplicate names in the definitions {duplicates}'
         # Generate some look up tables and dependency lists
         all_names: dict[str, Any] = {c.__name__: c for c in md.all_model_items}
@@ -166,27 +197,55 @@ class Generator:
 
 
     def order_dependencies(self):
-        # Order the elements by the number of xrefs they have
+        """ Order the elements so that each element comes after the elements it refers to.
+            Uses Kahn's algorithm: an element is ready as soon as the last of its dependencies is ordered.
+        """
+        waiting_for = {name: len(xr) for name, xr in self.dependencies.items()}
+        dependants = {name: [] for name in self.dependencies}
+        for name, xr in self.dependencies.items():
+            for n in xr:
+                dependants[n].append(name)
+
+        ready = deque(name for name, count in waiting_for.items() if count == 0)
         order_items = []
-        last_nr_ordered = 0
-        while len(order_items) < len(self.all_names):
-            for name, xr in self.dependencies.items():
-                if name in order_items:
-                    continue
-                # Check if all dependencies already have been ordered
-                if all(n in order_items for n in xr):
-                    order_items.append(name)
-            # If during this pass no new items were ordered, there is a circular reference.
-            if len(order_items) == last_nr_ordered:
-                # A circular reference can not be ordered.
-                raise RuntimeError("Ordering stuck on circular reference")
-            last_nr_ordered = len(order_items)
+        while ready:
+            name = ready.popleft()
+            order_items.append(name)
+            for d in dependants[name]:
+                waiting_for[d] -= 1
+                if waiting_for[d] == 0:
+                    ready.append(d)
+
+        if len(order_items) < len(self.dependencies):
+            # A circular reference can not be ordered.
+            raise RuntimeError(f"Ordering stuck on circular reference: {' -> '.join(self.find_cycle(waiting_for))}")
+
+        # Keep the order of earlier versions, so the generated files do not change: these added the elements
+        # in passes over the definitions, in which an element was added when its dependencies were already added.
+        index = {name: i for i, name in enumerate(self.dependencies)}
+        passes = {}
+        for name in order_items:
+            passes[name] = max((passes[n] + (index[n] > index[name]) for n in self.dependencies[name]), default=0)
+        order_items.sort(key=lambda n: (passes[n], index[n]))
         return [self.all_names[n] for n in order_items]
 
+    def find_cycle(self, waiting_for: Dict[str, int]) -> List[str]:
+        """ Return a circular chain of references between the elements that could not be ordered. """
+        # Follow the unordered dependencies until an element is visited twice.
+        name = next(n for n, count in waiting_for.items() if count)
+        path = []
+        while name not in path:
+            path.append(name)
+            name = next(n for n in sorted(self.dependencies[name]) if waiting_for[n])
+        return path[path.index(name):] + [name]
+
 
 
     def get_type(self, field_type) -> str:
         """ Return the type of an attribute for use in the client """
+        return self.type_cache.get(None, field_type, lambda: self.analyse_type(field_type))
+
+    def analyse_type(self, field_type) -> str:
         if isinstance(field_type, tuple):
             possible_types = [t for t in field_type if not (isinstance(t, type) and issubclass(t, mdef.OptionalAnnotation)) ]
             assert possible_types, f'No type defined for field {field_type}'
@@ -212,6 +271,10 @@ class Generator:
     @staticmethod
     def get_type_options(field_type):
         """ Return the possible types of a field, and the options given to the field. """
+        return Generator.type_options_cache.get(None, field_type, lambda: Generator.analyse_type_options(field_type))
+
+    @staticmethod
+    def analyse_type_options(field_type):
         if isinstance(field_type, model_definition.XRef):
             return Generator.get_type_options(field_type.types) + field_type.options
         if isinstance(field_type, list) or isinstance(field_type, tuple):
@@ -225,6 +288,10 @@ class Generator:
 
 
     def get_inner_types(self, owner, field_type):
+        """ Find out what the inner type of a field is. Used to find cross-references between items. """
+        return self.type_cache.get(owner, field_type, lambda: self.analyse_inner_types(owner, field_type))
+
+    def analyse_inner_types(self, owner, field_type):
         def get_type(field_type):
             if isinstance(field_type, str):
                 return self.md.get_cls_by_name(field_type)
@@ -232,14 +299,13 @@ class Generator:
                 return owner
             return field_type
 
-        """ Find out what the inner type of a field is. Used to find cross-references between items. """
         if type(field_type) in [list, tuple]:
             possible_types = [t for t in field_type if
                               not (isinstance(t, type) and issubclass(t, mdef.OptionalAnnotation))]
             if Self in field_type:
                 possible_types.append(owner)
             assert possible_types, f'No type defined for field {field_type}'
-            return (t for ts in possible_types for t in self.get_inner_types(owner, ts))
+            return [t for ts in possible_types for t in self.get_inner_types(owner, ts)]
         if isinstance(field_type, mdef.XRef):
             return [get_type(t) for t in field_type.types if
                     not (isinstance(t, type) and issubclass(t, mdef.OptionalAnnotation))]
@@ -253,6 +319,14 @@ class Generator:
         spec_fields = ', '.join(spec_fields)
         return spec_fields
 
+    def get_reference_fields(self, entity) -> List[str]:
+        """ The names of the fields of an entity that hold the Id of another entity. """
+        def is_reference(field_type):
+            if isinstance(field_type, (list, tuple)):
+                return any(is_reference(t) for t in field_type)
+            return isinstance(field_type, mdef.XRef)
+        return [f.name for f in fields(entity) if is_reference(f.type)]
+
     def determine_dependencies(self, all_names):
         xrefs = {}
 
@@ -345,12 +419,15 @@ class Generator:
 
 
     @staticmethod
-    def load_from_config(config: Configuration):
+    def load_from_config(config: Configuration, times: Optional['StageTimes'] = None):
+        times = StageTimes() if times is None else times
         # Find and import the specified model
         module_name = config.model_name
-        new_mod, spec = load_specification(module_name, config.model_def)
-        sys.modules[module_name] = new_mod
-        generator = Generator(config, module_name)
+        with times.measure('load'):
+            new_mod, spec = load_specification(module_name, config.model_def)
+            sys.modules[module_name] = new_mod
+        with times.measure('analyse'):
+            generator = Generator(config, module_name)
         return generator, module_name
 
     def get_messages(self, target):
@@ -360,14 +437,92 @@ class Generator:
 
 
 
-def generate_tool(config: Configuration):
-
+# The templates and the files generated from them, relative to the client and server directories.
+targets = [
+    ('templates/client.html', 'client_dir', '{}_client.html'),
+    ('templates/client.py', 'client_dir', '{}_client.py'),
+    ('templates/data_model.py', 'server_dir', '{}_data.py'),
+    ('templates/server.py', 'server_dir', '{}_run.py'),
+]
+
+# The file in the server directory that holds the fingerprints of the inputs of each generated file.
+# Each model has its own manifest, so models that share a server directory can be generated in parallel.
+manifest_name = '.{}_generated.json'
+
+
+class StageTimes(dict):
+    """ The time spent in each stage of generating a tool, in seconds. """
+    stages = ['load', 'analyse', 'render', 'write']
+
+    def __init__(self):
+        super().__init__((s, 0.0) for s in self.stages)
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self[stage] += perf_counter() - start
+
+
+def fingerprint(*parts: str | bytes) -> str:
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(p.encode('utf8') if isinstance(p, str) else p)
+        # Separate the parts, so moving text from one part to the next changes the fingerprint.
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def file_mode(path: str) -> int:
+    """ The permissions of an existing file, or those a new file gets from the umask. """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_if_changed(target: str, content: str) -> bool:
+    """ Write a file only if its content changes, so its timestamp and any caches of it remain valid.
+        The file is replaced in one step, so a running server never reads a half-written file.
+        Returns True if the file was written.
+    """
+    if os.path.exists(target) and read_file(target) == content.encode('utf8'):
+        return False
+    mode = file_mode(target)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target) or '.', prefix=f'.{os.path.basename(target)}.',
+                               suffix='.tmp')
+    try:
+        # mkstemp creates a file only the owner can read, give it the permissions of a normally written file.
+        os.chmod(tmp, mode)
+        with os.fdopen(fd, 'w', encoding='utf8') as out:
+            out.write(content)
+        os.replace(tmp, target)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return True
+
+
+def generate_tool(config: Configuration, force: bool = False, times: Optional[StageTimes] = None) -> List[str]:
+    """ Generate the files for a tool. Returns the files that were (re-)rendered.
+
+        A file is only rendered again when one of its inputs changed: the specification, the template,
+        `ReprCategory`, the configuration or the generator itself. Use `force` to render all files.
+        The time spent in each stage is added to `times`, if given.
+    """
+    times = StageTimes() if times is None else times
     homedir = config.homedir
     tooldir = os.path.dirname(__file__)
 
-    generator, module_name = Generator.load_from_config(config)
-
-
     def ensure_dir_exists(p):
         ap = os.path.normpath(os.path.join(homedir, p))
         if not os.path.exists(ap):
@@ -382,36 +537,113 @@ def generate_tool(config: Configuration):
         """ Return a directory relative to the homedir """
         return os.path.normpath(os.path.join(homedir, basedir, p))
 
-
-
-    #for cls in mdef.model_definition.entity:
-    #    for f in fields(cls):
-    #        print(f'{cls.__name__}.{f.name}: {get_type(f.type)} = {get_default(f.type)}')
-
-    for tmpl, target in [
-        ('templates/client.html', f'{config.client_dir}/{module_name}_client.html'),
-        ('templates/client.py', f'{config.client_dir}/{module_name}_client.py'),
-        ('templates/data_model.py', f'{config.server_dir}/{module_name}_data.py'),
-        ('templates/server.py', f'{config.server_dir}/{module_name}_run.py'),
-    ]:
+    # The inputs shared by all files.
+    common = fingerprint(read_file(config.model_def), repr(sorted(vars(config).items())),
+                         read_file(__file__), read_file(mdef.__file__))
+
+    manifest_path = os.path.join(config.server_dir, manifest_name.format(config.model_name))
+    try:
+        with open(manifest_path) as f:
+            manifest: Dict[str, str] = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    module_dir = os.path.join(config.server_dir, '.mako_modules')
+    generator = None
+    rendered = []
+    for tmpl, directory, name in targets:
+        template_path = hdir(tooldir, tmpl)
+        target = os.path.join(getattr(config, directory), name.format(config.model_name))
+        key = fingerprint(common, read_file(template_path))
+        if not force and manifest.get(target) == key and os.path.exists(target):
+            continue
+
+        if generator is None:
+            # Only load the specification when something needs to be rendered.
+            generator, _ = Generator.load_from_config(config, times)
         print(f'Rendering {tmpl} to {target}')
-        template = Template(open(hdir(tooldir, tmpl)).read())
-        result = template.render(
-            config=config,
-            generator=generator
-        )
-        with open(target, 'w') as out:
-            out.write(result)
-
-
-
-if __name__ == '__main__':
+        with times.measure('render'):
+            # Mako keeps the compiled templates in the cache directory, and only compiles them again when they change.
+            # The module file is named explicitly: by default Mako nests it under the absolute path of the template.
+            template = Template(filename=template_path,
+                                module_filename=os.path.join(module_dir, os.path.basename(tmpl) + '.py'))
+            result = template.render(
+                config=config,
+                generator=generator
+            )
+        with times.measure('write'):
+            write_if_changed(target, result)
+        manifest[target] = key
+        rendered.append(target)
+
+    if rendered:
+        with times.measure('write'):
+            write_if_changed(manifest_path, json.dumps(manifest, indent=2, sort_keys=True))
+    return rendered
+
+
+@dataclass
+class GenerationResult:
+    """ The outcome of generating the tool for one specification. """
+    specification: str
+    rendered: List[str] = field(default_factory=list)
+    times: Dict[str, float] = field(default_factory=StageTimes)
+    error: str = ''
+
+
+def generate_one(config: Configuration, force: bool = False) -> GenerationResult:
+    """ Generate a tool, and report failures in the result instead of raising them. """
+    result = GenerationResult(config.model_def)
+    try:
+        result.rendered = generate_tool(config, force, result.times)
+    except Exception:
+        result.error = traceback.format_exc()
+    result.times = dict(result.times)
+    return result
+
+
+def generate_tools(configs: List[Configuration], force: bool = False, jobs: Optional[int] = None) \
+        -> List[GenerationResult]:
+    """ Generate the tools for several specifications, each in a separate process.
+
+        Each specification is loaded and analysed once, in the process that renders all its files:
+        the analysed specification consists of classes that can not be passed between processes.
+    """
+    jobs = min(jobs or os.cpu_count() or 1, len(configs))
+    if jobs <= 1:
+        return [generate_one(c, force) for c in configs]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(generate_one, configs, [force] * len(configs)))
+
+
+def print_times(results: List[GenerationResult]):
+    width = max([len(r.specification) for r in results] + [13])
+    print(f"{'Specification':{width}} " + ' '.join(f'{s:>8}' for s in StageTimes.stages) + '    files  status')
+    for r in results:
+        print(f'{r.specification:{width}} ' + ' '.join(f'{r.times[s]:8.3f}' for s in StageTimes.stages) +
+              f"{len(r.rendered):9}  {'FAILED' if r.error else 'ok'}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
     parser = argparse.ArgumentParser()
-    parser.add_argument('specification', default='sysml_spec.py')
+    parser.add_argument('specification', nargs='+')
     parser.add_argument('--test', action='store_true')
-    args = parser.parse_args()
+    parser.add_argument('--force', action='store_true', help='Render all files, even if their inputs did not change')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='The number of specifications generated in parallel, by default the number of CPUs')
+    parser.add_argument('--homedir', default=os.getcwd(), help='The directory that holds the generated tools')
+    args = parser.parse_args(argv)
 
     public_dir = os.path.normpath(os.path.dirname(__file__)+'/../public/')
 
+    configs = [Configuration(spec, pub_dir=public_dir, homedir=args.homedir) for spec in args.specification]
+    results = generate_tools(configs, force=args.force, jobs=args.jobs)
+    for r in results:
+        if r.error:
+            print(f'Generating {r.specification} failed:\n{r.error}', file=sys.stderr)
+    print_times(results)
+    return 1 if any(r.error for r in results) else 0
+
 
-    generate_tool(Configuration(args.specification, pub_dir=public_dir))
+if __name__ == '__main__':
+    sys.exit(main())
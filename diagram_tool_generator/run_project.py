@@ -19,9 +19,15 @@ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 """
 import os.path
 import sys
+import glob
+import json
+import time
 import importlib
+import subprocess
+import dataclasses
 import generate_tool
 from pathlib import Path
+from typing import Dict, List, Set
 import shutil
 
 
@@ -48,7 +54,99 @@ def create_environment(project):
     Path('build/__init__.py').touch()
 
 
-def run(specs, project, port):
+class FileWatcher:
+    """ Detects changes to files by comparing their modification times.
+        Polling needs no extra dependencies, and is fast enough for the few hundred files in a project.
+    """
+    def __init__(self, patterns: List[str]):
+        self.patterns = patterns
+        self.mtimes = self.scan()
+
+    def scan(self) -> Dict[str, int]:
+        mtimes = {}
+        for pattern in self.patterns:
+            for path in glob.glob(pattern):
+                try:
+                    mtimes[os.path.normpath(path)] = os.stat(path).st_mtime_ns
+                except OSError:
+                    # The file was removed while scanning.
+                    pass
+        return mtimes
+
+    def changes(self) -> Set[str]:
+        """ Return the files that were added, changed or removed since the last call. """
+        mtimes = self.scan()
+        changed = {p for p in mtimes.keys() | self.mtimes.keys() if mtimes.get(p) != self.mtimes.get(p)}
+        self.mtimes = mtimes
+        return changed
+
+
+def start_server(project, port, reload_file=None) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, __file__, project, str(port)] + ([reload_file] if reload_file else []))
+
+
+def serve(project, port, reload_file=None):
+    # Run the generated tool
+    sys.path.append('build')
+    runlibname = f'{project}_run'
+    runlib = importlib.import_module(runlibname)
+    runlib.run(port, home_dir('client_src'), reload_file)
+
+
+def generate_in_subprocess(config) -> bool:
+    """ Generate the tool in a new interpreter, so changes to the generator itself are used.
+        This process keeps the versions of the generator modules that were imported when it started.
+        Returns True if the tool was generated.
+    """
+    settings = json.dumps(dataclasses.asdict(config))
+    return subprocess.run([sys.executable, __file__, '--generate'], input=settings, text=True).returncode == 0
+
+
+def watch(config, project, port, interval=0.2):
+    """ Run the tool, and update it whenever the specification, the templates or the client sources change.
+
+        Only the files affected by a change are generated again (see `generate_tool`). The server is restarted
+        when its own files change. The browsers poll the server for changes (see `live_reload` in `client_src`),
+        and reload the page when any of the files they use is changed.
+    """
+    tooldir = os.path.dirname(os.path.abspath(__file__))
+    client_src = os.path.join(tooldir, '..', 'client_src')
+    sources = FileWatcher([config.model_def, os.path.join(tooldir, 'templates', '*'), os.path.join(tooldir, '*.py')])
+    served = FileWatcher([os.path.join(config.client_dir, '*'), os.path.join(config.server_dir, f'{project}_*.py'),
+                          os.path.join(client_src, '*.py')])
+    server_files = os.path.normpath(config.server_dir) + os.sep
+    reload_file = os.path.abspath(os.path.join(config.server_dir, '.reload.json'))
+    version = 0
+    generate_tool.write_if_changed(reload_file, json.dumps({'version': version, 'modules': []}))
+
+    server = start_server(project, port, reload_file)
+    try:
+        while True:
+            time.sleep(interval)
+            if sources.changes():
+                start = time.perf_counter()
+                if not generate_in_subprocess(config):
+                    # Keep the previous version running until the error is fixed.
+                    continue
+                print(f'Generated the tool in {time.perf_counter() - start:.2f} s')
+            changed = served.changes()
+            if not changed:
+                continue
+            if any(f.startswith(server_files) for f in changed) or server.poll() is not None:
+                server.terminate()
+                server.wait()
+                server = start_server(project, port, reload_file)
+            version += 1
+            modules = sorted(os.path.basename(f) for f in changed)
+            generate_tool.write_if_changed(reload_file, json.dumps({'version': version, 'modules': modules}))
+            print(f'Updated {", ".join(modules)}')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run(specs, project, port, watch_changes=False):
+    """ Generate and run the tool. With `watch_changes`, the tool is updated when its sources change. """
     # Generate all the components of the tool.
     create_environment(project)
     config = generate_tool.Configuration(
@@ -57,8 +155,15 @@ def run(specs, project, port):
     )
     generate_tool.generate_tool(config)
 
-    # Run the generated tool
-    sys.path.append('build')
-    runlibname = f'{project}_run'
-    runlib = importlib.import_module(runlibname)
-    runlib.run(port, home_dir('client_src'))
+    if watch_changes:
+        watch(config, project, port)
+    else:
+        serve(project, port)
+
+
+if __name__ == '__main__':
+    # Used to generate the tool and to run the server in separate processes in watch mode.
+    if sys.argv[1:] == ['--generate']:
+        generate_tool.generate_tool(generate_tool.Configuration(**json.load(sys.stdin)))
+    else:
+        serve(*sys.argv[1:])
@@ -66,9 +66,11 @@ from property_editor import dataClassEditor, longstr, OptionalRef, parameter_spe
 from storable_element import Collection, StorableElement, from_dict
 from data_store import UndoableDataStore, DataConfiguration, ExtendibleJsonEncoder, parameter_values
 from model_interface import EditableParameterDetails
-from svg_shapes import getMarkerDefinitions
+from svg_shapes import getMarkerDefinitions, getSymbolDefinitions, shape_registry
 from tab_view import TabView
 from point import load_waypoints
+from instrumentation import profiler, profilingRequested, urlFlag
+from live_reload import LiveReload
 from copy import deepcopy, copy
 
 
@@ -79,6 +81,10 @@ def resolve(name: str) -> Type[ms.ModelEntity]:
         var = getattr(var, p)
     return var
 
+
+# The parameter specifications that were parsed, see `get_parameter_specs`.
+parsed_parameter_specs: Dict[str, Dict[str, type]] = {}
+
 %for cls in [c for c in generator.md.custom_types if isinstance(c, EnumType)]:
 class ${cls.__name__}(IntEnum):
 %for option in cls:
@@ -139,6 +145,9 @@ class ${entity.__name__}(ms.ModelEntity, StorableElement):
     ${key}: ${generator.get_html_type(type_)} = ${default}
     % endfor
 
+    # The names of the dataclass fields, so the client need not inspect the class (see `field_names`).
+    schema_fields = (${''.join(f'"{k}", ' for k in ['Id'] + [k for k in internal_fields if k != 'Id'])})
+
     default_styling = ${repr(generator.styling[entity.__name__])}
 
     %if hasattr(entity, 'getStyle'):
@@ -170,14 +179,16 @@ ${inspect.getsource(entity.getStyle)}
         interconnect = ${entity.interconnect.__name__}
         self_message = ${repr(entity.self_message)}
 
+        resolved_blocks = None
+
         @classmethod
         def get_allowed_blocks(cls, for_drop=False) -> Dict[str, Type[ms.ModelEntity]]:
-            # The allowed blocks are given as a Dict[str, str]. Here we replace the str references to classes
-            # by actual classes.
-            if for_drop:
-                return {k: resolve(v) for k, v in cls.allowed_drops_blocks.items()}
-            else:
-                return {k: resolve(v) for k, v in cls.allowed_create_blocks.items()}
+            # The allowed blocks are given as a Dict[str, str]. The str references to classes are replaced
+            # by actual classes once, when the first diagram is opened and all classes are defined.
+            if cls.resolved_blocks is None:
+                cls.resolved_blocks = ({k: resolve(v) for k, v in cls.allowed_drops_blocks.items()},
+                                       {k: resolve(v) for k, v in cls.allowed_create_blocks.items()})
+            return dict(cls.resolved_blocks[0 if for_drop else 1])
 
         @override
         def get_representation_category(self, block_cls) -> ReprCategory:
@@ -192,14 +203,16 @@ ${inspect.getsource(entity.getStyle)}
     class Diagram(ModeledDiagram):
         allowed_drops_blocks = {${", ".join(generator.get_allowed_drops(entity))}}
         allowed_create_blocks = {${", ".join(generator.get_allowed_creates(entity))}}
+        resolved_blocks = None
+
         @classmethod
         def get_allowed_blocks(cls, for_drop=False) -> Dict[str, Type[ms.ModelEntity]]:
-            # The allowed blocks are given as a Dict[str, str]. Here we replace the str references to classes
-            # by actual classes.
-            if for_drop:
-                return {k: resolve(v) for k, v in cls.allowed_drops_blocks.items()}
-            else:
-                return {k: resolve(v) for k, v in cls.allowed_create_blocks.items()}
+            # The allowed blocks are given as a Dict[str, str]. The str references to classes are replaced
+            # by actual classes once, when the first diagram is opened and all classes are defined.
+            if cls.resolved_blocks is None:
+                cls.resolved_blocks = ({k: resolve(v) for k, v in cls.allowed_drops_blocks.items()},
+                                       {k: resolve(v) for k, v in cls.allowed_create_blocks.items()})
+            return dict(cls.resolved_blocks[0 if for_drop else 1])
 
         def get_representation_category(self, block_cls) -> ReprCategory:
             if block_cls.is_instance_of():
@@ -293,11 +306,16 @@ ${inspect.getsource(entity.getStyle)}
 
     def get_parameter_specs(self) -> Dict[str, type]:
         field_specs = getattr(self, self.get_parameter_spec_fields())
-        if isinstance(field_specs, str):
+        if not isinstance(field_specs, str):
+            return {k.strip(): parameter_types[t.strip()] for k, t in field_specs.items()}
+        # Specifications are parsed only once. The result is shared, so it is copied.
+        keys_types = parsed_parameter_specs.get(field_specs)
+        if keys_types is None:
             fs = field_specs.strip('{}')
-            field_specs = dict(name_type.split(':') for name_type in fs.split(',')) if fs else {}
-        keys_types = {k.strip(): parameter_types[t.strip()] for k, t in field_specs.items()}
-        return keys_types
+            name_types = [name_type.split(':') for name_type in fs.split(',')] if fs else []
+            keys_types = parsed_parameter_specs[field_specs] = {k.strip(): parameter_types[t.strip()]
+                                                                for k, t in name_types}
+        return dict(keys_types)
 
     def get_editable_parameters(self) -> List[EditableParameterDetails]:
         regular_parameters = [
@@ -527,6 +545,9 @@ def run(explorer: str, canvas: str, details: str) -> Tuple[UndoableDataStore, Ta
     # There can not be multiple definitions of the line-ends, so define them globally.
     svg_tag = html.SVG(id='line_ends', height=0, width=0)
     svg_tag <= getMarkerDefinitions()
+    # The symbols for drawing shapes and ports with `<use>`. Adding `?symbols` to the URL switches this on.
+    shape_registry.use_symbols = urlFlag('symbols')
+    svg_tag <= getSymbolDefinitions()
     document <= svg_tag
 
     def on_dblclick(_event_name, event_source, data_store, details):
@@ -545,5 +566,17 @@ def run(explorer: str, canvas: str, details: str) -> Tuple[UndoableDataStore, Ta
         if cm := document.get(id=context_menu_name):
             cm.close()
 
+    if profilingRequested():
+        # Opt-in timing of the client, see `instrumentation`. Ctrl+Shift+P shows the results.
+        profiler.enable()
+        @bind(document, 'keydown')
+        def show_profiler(ev):
+            if ev.ctrlKey and ev.shiftKey and ev.key.lower() == 'p':
+                ev.preventDefault()
+                profiler.showOverlay(document)
+
+    # Reload the page when the tool is updated, if the server runs in watch mode.
+    LiveReload().start()
+
     # Return the data_store so it can be accessed in integration tests.
     return data_store, diagram_tabview
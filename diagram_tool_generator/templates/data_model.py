@@ -1,4 +1,4 @@
-from typing import List, Self, Optional, Dict, Any
+from typing import List, Self, Optional, Dict, Any, Iterator, Tuple, Type, TypeVar
 <%
 """
     Template for generating the data model for the visual modelling environment.
@@ -52,13 +52,14 @@ from datetime import datetime, time
 import os
 import os.path
 import json
+import gzip
 from enum import IntEnum, auto
 from contextlib import contextmanager
 from urllib.parse import urlparse
 import logging
 from dataclasses import dataclass, fields, asdict, field, is_dataclass
 from sqlalchemy import (create_engine, Column, Integer, String, DateTime,
-     ForeignKey, event, Time, Float, LargeBinary, Enum)
+     ForeignKey, event, Time, Float, LargeBinary, Enum, func, insert)
 from sqlalchemy.orm import scoped_session, sessionmaker, backref, relationship, reconstructor
 from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from sqlalchemy.sql import text
@@ -523,9 +524,12 @@ class AWrapper:
 
     @staticmethod
     def load_from_db(record):
-        typename = record.subtype
+        return AWrapper.load_from_columns(record.subtype, record.details)
+
+    @staticmethod
+    def load_from_columns(typename, details):
         cls = globals().get(typename)
-        details = record.details if isinstance(record.details, str) else record.details.decode('utf8')
+        details = details if isinstance(details, str) else details.decode('utf8')
         data_dict = json.loads(details)
         assert typename == data_dict['__classname__']
         data_dict = {k:v for k,v in data_dict.items() if k != '__classname__'}
@@ -697,6 +701,294 @@ class _RelationshipRepresentation(ARepresentation):
             link2=self.target_repr_id,
         )
 
+# ##############################################################################
+# # Read-only queries, for scripts that analyse a model.
+# #
+# # The queries select only the columns they need, and stream the results in batches (`yield_per`),
+# # so a script can go through a large database without holding all of it in memory.
+# # When no session is given, each iterator uses a session of its own, which is closed when the iterator is.
+
+T = TypeVar('T', bound=AWrapper)
+
+
+@contextmanager
+def read_session(session=None):
+    """ A session that is only used for reading: nothing is committed. """
+    if session is not None:
+        yield session
+        return
+    session = Session()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def entity_columns(session, cls: Optional[Type[T]] = None):
+    """ Query the class and details of entities, optionally only those of a class. """
+    query = session.query(_Entity.subtype, _Entity.details)
+    if cls is not None:
+        query = query.filter(_Entity.subtype == cls.__name__)
+    return query
+
+
+def iter_entities(cls: Optional[Type[T]] = None, session=None, batch_size: int = 500) -> Iterator[T]:
+    """ Yield all entities of a class, or all entities if `cls` is None. """
+    with read_session(session) as session:
+        for subtype, details in entity_columns(session, cls).order_by(_Entity.Id).yield_per(batch_size):
+            yield AWrapper.load_from_columns(subtype, details)
+
+
+def iter_children(parent: Optional[int], cls: Optional[Type[T]] = None, session=None,
+                  batch_size: int = 500) -> Iterator[T]:
+    """ Yield the entities directly under `parent`, optionally only those of a class. """
+    with read_session(session) as session:
+        query = entity_columns(session, cls).filter(_Entity.parent == parent)
+        for subtype, details in query.order_by(_Entity.Id).yield_per(batch_size):
+            yield AWrapper.load_from_columns(subtype, details)
+
+
+def iter_diagram_contents(diagram: int, categories: Optional[List[ReprCategory]] = None, session=None,
+                          batch_size: int = 500) -> Iterator[ARepresentation]:
+    """ Yield the representations in a diagram, with the entity they represent in their `_entity` attribute. """
+    with read_session(session) as session:
+        query = (session.query(_Representation.subtype, _Representation.details,
+                               _Entity.subtype, _Entity.details)
+                 .join(_Entity, _Entity.Id == _Representation.entity)
+                 .filter(_Representation.diagram == diagram))
+        if categories is not None:
+            query = query.filter(_Representation.category.in_([int(c) for c in categories]))
+        for repr_subtype, repr_details, subtype, details in query.order_by(_Representation.Id).yield_per(batch_size):
+            representation = AWrapper.load_from_columns(repr_subtype, repr_details)
+            representation._entity = AWrapper.load_from_columns(subtype, details)
+            yield representation
+
+
+def iter_diagram_connections(diagram: int, session=None, batch_size: int = 500) -> Iterator[Tuple[int, int, int, int]]:
+    """ Yield (representation Id, entity Id, source representation Id, target representation Id)
+        for the connections in a diagram. Only the indexed columns are read, the details are not decoded.
+    """
+    with read_session(session) as session:
+        query = (session.query(_Representation.Id, _Representation.entity, _Representation.link1, _Representation.link2)
+                 .filter(_Representation.diagram == diagram)
+                 .filter(_Representation.category == int(ReprCategory.relationship))
+                 .order_by(_Representation.Id))
+        for row in query.yield_per(batch_size):
+            yield tuple(row)
+
+
+def iter_relationships(cls: Optional[Type[T]] = None, session=None,
+                       batch_size: int = 500) -> Iterator[Tuple[int, str, int, int]]:
+    """ Yield (Id, class name, source Id, target Id) for the relationships between entities,
+        without creating objects for them.
+    """
+    with read_session(session) as session:
+        query = (session.query(_Entity.Id, _Entity.subtype, _Entity.details)
+                 .filter(_Entity.type == EntityType.Relationship))
+        if cls is not None:
+            query = query.filter(_Entity.subtype == cls.__name__)
+        for Id, subtype, details in query.order_by(_Entity.Id).yield_per(batch_size):
+            data = json.loads(details)
+            yield Id, subtype, data.get('source'), data.get('target')
+
+
+def relationship_adjacency(cls: Optional[Type[T]] = None, reverse: bool = False,
+                           session=None) -> Dict[int, List[Tuple[int, int]]]:
+    """ Return, for each entity, the (relationship Id, other entity Id) of its outgoing relationships,
+        or of its incoming relationships if `reverse` is True.
+    """
+    adjacency: Dict[int, List[Tuple[int, int]]] = {}
+    for Id, _, source, target in iter_relationships(cls, session):
+        if reverse:
+            source, target = target, source
+        adjacency.setdefault(source, []).append((Id, target))
+    return adjacency
+
+
+# ##############################################################################
+# # Export and import of (parts of) a model.
+# #
+# # An archive is a gzipped file with one JSON object per line: a header, followed by the records of the
+# # `_entity` and `_representation` tables. On import, the records get new Ids, and all references
+# # between them are updated, so an archive can be imported into any database, also more than once.
+
+archive_format = 'dsmgen-model'
+entity_columns_exported = ['Id', 'type', 'subtype', 'parent', 'order']
+representation_columns_exported = ['Id', 'subtype', 'diagram', 'entity', 'parent', 'link1', 'link2', 'link3',
+                                   'order', 'category']
+# The references in the details of a representation, to entities and to other representations.
+representation_entity_fields = ['diagram', 'block', 'relationship', 'message']
+representation_repr_fields = ['parent', 'source_repr_id', 'target_repr_id']
+
+
+def query_in_chunks(session, columns, key, ids: List[int], chunk_size: int = 500):
+    """ Query the records with the given Ids, staying below the maximum number of parameters in a query. """
+    ids = sorted(ids)
+    for i in range(0, len(ids), chunk_size):
+        yield from session.query(*columns).filter(key.in_(ids[i:i+chunk_size])).order_by(key)
+
+
+def collect_subtree(roots: List[int], session) -> Tuple[List[int], List[int]]:
+    """ Find the entities and representations to export for a number of root entities (e.g. a folder or a diagram).
+        These are the roots with everything below them, the contents of all diagrams among them, and the entities
+        these refer to (e.g. the definitions of blocks in a diagram), again with everything below them.
+    """
+    children: Dict[int, List[int]] = {}
+    for Id, parent in session.query(_Entity.Id, _Entity.parent).yield_per(5000):
+        children.setdefault(parent, []).append(Id)
+
+    entities = set()
+    representations = set()
+    todo = list(roots)
+    while todo:
+        # Add the new entities with everything below them.
+        new = []
+        while todo:
+            Id = todo.pop()
+            if Id not in entities:
+                entities.add(Id)
+                new.append(Id)
+                todo.extend(children.get(Id, []))
+        # Follow the references to other entities, except to parents.
+        for Id, subtype, details in query_in_chunks(session, [_Entity.Id, _Entity.subtype, _Entity.details],
+                                                    _Entity.Id, new):
+            references = [f for f in getattr(globals().get(subtype), 'reference_fields', ()) if f != 'parent']
+            if references:
+                data = json.loads(details)
+                todo.extend(data[f] for f in references if isinstance(data.get(f), int) and data[f] not in entities)
+        # Add the contents of diagrams, and the entities these represent.
+        for Id, entity in query_in_chunks(session, [_Representation.Id, _Representation.entity],
+                                          _Representation.diagram, new):
+            representations.add(Id)
+            if entity is not None and entity not in entities:
+                todo.append(entity)
+    return sorted(entities), sorted(representations)
+
+
+def export_model(fname: str, roots: Optional[List[int]] = None, session=None) -> Tuple[int, int]:
+    """ Write the whole model, or the parts under the `roots` with their dependencies, to an archive.
+        Returns the number of entities and representations written.
+    """
+    with read_session(session) as session, gzip.open(fname, 'wt', encoding='utf8') as f:
+        f.write(json.dumps({'format': archive_format, 'generator': GEN_VERSION, 'roots': roots}) + '\n')
+        counts = []
+        subtree = collect_subtree(roots, session) if roots is not None else None
+        for i, (table, db_table, columns) in enumerate([('entity', _Entity, entity_columns_exported),
+                                                        ('representation', _Representation,
+                                                         representation_columns_exported)]):
+            selected = [getattr(db_table, c) for c in columns] + [db_table.details]
+            if subtree is None:
+                rows = session.query(*selected).order_by(db_table.Id).yield_per(1000)
+            else:
+                rows = query_in_chunks(session, selected, db_table.Id, subtree[i])
+            count = 0
+            for row in rows:
+                record = dict(zip(columns, row[:-1]))
+                if table == 'entity':
+                    record['type'] = EntityType(record['type']).name
+                details = row[-1] if isinstance(row[-1], str) else row[-1].decode('utf8')
+                f.write(json.dumps({table: record, 'details': json.loads(details)}) + '\n')
+                count += 1
+            counts.append(count)
+    return counts[0], counts[1]
+
+
+def read_archive(fname: str) -> Iterator[Dict[str, Any]]:
+    """ Yield the header of an archive, followed by its records. """
+    with gzip.open(fname, 'rt', encoding='utf8') as f:
+        header = json.loads(f.readline())
+        if header.get('format') != archive_format:
+            raise ValueError(f"{fname} is not a model archive")
+        if header.get('generator') != GEN_VERSION:
+            raise ValueError(f"{fname} was made by generator version {header.get('generator')}, "
+                             f"this database uses version {GEN_VERSION}")
+        yield header
+        for line in f:
+            yield json.loads(line)
+
+
+def import_model(fname: str, parent: Optional[int] = None, session=None, batch_size: int = 1000) -> Tuple[int, int]:
+    """ Add the contents of an archive to the database, with new Ids.
+        The roots of a partial export, and the entities that had their parent outside the archive,
+        are placed under `parent`. Other references to entities outside the archive are cleared.
+        Returns the number of entities and representations added.
+    """
+    if session is None:
+        with session_context() as session:
+            return import_model(fname, parent, session, batch_size)
+
+    # The first pass finds the Ids in the archive, so forward references can be translated as well.
+    old_ids = {'entity': [], 'representation': []}
+    items = read_archive(fname)
+    roots = set(next(items).get('roots') or [])
+    for item in items:
+        table = 'entity' if 'entity' in item else 'representation'
+        old_ids[table].append(item[table]['Id'])
+    first_entity = (session.query(func.max(_Entity.Id)).scalar() or 0) + 1
+    first_repr = (session.query(func.max(_Representation.Id)).scalar() or 0) + 1
+    entity_ids = {old: first_entity + i for i, old in enumerate(sorted(old_ids['entity']))}
+    repr_ids = {old: first_repr + i for i, old in enumerate(sorted(old_ids['representation']))}
+
+    if engine.dialect.name == 'sqlite':
+        # Records can refer to records later in the archive: check the foreign keys when committing.
+        session.execute(text('PRAGMA defer_foreign_keys = ON;'))
+
+    def entity_ref(Id):
+        return entity_ids.get(Id)
+
+    def parent_ref(Id, old_id):
+        if old_id in roots:
+            return parent
+        # Other top-level entities, e.g. relationships, stay at the top level.
+        if Id is None:
+            return None
+        return entity_ids.get(Id, parent)
+
+    def repr_ref(Id):
+        return repr_ids.get(Id)
+
+    batches = {'entity': [], 'representation': []}
+    def flush(table):
+        if batches[table]:
+            session.execute(insert(_Entity if table == 'entity' else _Representation), batches[table])
+            batches[table] = []
+
+    items = read_archive(fname)
+    next(items)
+    for item in items:
+        details = item['details']
+        if 'entity' in item:
+            table, record = 'entity', item['entity']
+            record['type'] = EntityType[record['type']]
+            record['parent'] = parent_ref(record['parent'], record['Id'])
+            if 'parent' in details:
+                details['parent'] = parent_ref(details['parent'], record['Id'])
+            for f in getattr(globals().get(record['subtype']), 'reference_fields', ()):
+                if f != 'parent' and isinstance(details.get(f), int):
+                    details[f] = entity_ref(details[f])
+            details['Id'] = record['Id'] = entity_ids[record['Id']]
+        else:
+            table, record = 'representation', item['representation']
+            for c in ['diagram', 'entity']:
+                record[c] = entity_ref(record[c])
+            for c in ['parent', 'link1', 'link2', 'link3']:
+                record[c] = repr_ref(record[c])
+            for f in representation_entity_fields:
+                if isinstance(details.get(f), int):
+                    details[f] = entity_ref(details[f])
+            for f in representation_repr_fields:
+                if isinstance(details.get(f), int):
+                    details[f] = repr_ref(details[f])
+            details['Id'] = record['Id'] = repr_ids[record['Id']]
+        record['details'] = json.dumps(details).encode('utf8')
+        batches[table].append(record)
+        if len(batches[table]) >= batch_size:
+            flush(table)
+    flush('entity')
+    flush('representation')
+    return len(entity_ids), len(repr_ids)
+
+
 # Generated dataclasses
 % for entity in generator.ordered_items:
 <%
@@ -717,8 +1009,30 @@ class ${entity.__name__}(${stereotype}):
     %if generator.md.is_message(entity):
     association: int = None
     %endif
+    reference_fields = ${repr(tuple(generator.get_reference_fields(entity) + (['association'] if generator.md.is_message(entity) else [])))}
 
 % endfor
 
 if __name__ == '__main__':
-    init_db()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='Initialise the database, or export and import models.')
+    parser.add_argument('--dbase', help='The URL of the database to use, e.g. sqlite:///build/data/other.sqlite3')
+    commands = parser.add_subparsers(dest='command')
+    export_parser = commands.add_parser('export', help='Write the model, or parts of it, to an archive')
+    export_parser.add_argument('archive')
+    export_parser.add_argument('--root', type=int, nargs='+',
+                               help='Only export these entities (e.g. a folder or diagram) and their dependencies')
+    import_parser = commands.add_parser('import', help='Add the contents of an archive to the model')
+    import_parser.add_argument('archive')
+    import_parser.add_argument('--parent', type=int, help='The entity to place the imported entities under')
+    args = parser.parse_args()
+
+    if args.dbase:
+        changeDbase(args.dbase)
+    init_db()
+    if args.command == 'export':
+        nr_entities, nr_representations = export_model(args.archive, args.root)
+        print(f'Exported {nr_entities} entities and {nr_representations} representations to {args.archive}')
+    elif args.command == 'import':
+        nr_entities, nr_representations = import_model(args.archive, args.parent)
+        print(f'Imported {nr_entities} entities and {nr_representations} representations from {args.archive}')
\ No newline at end of file
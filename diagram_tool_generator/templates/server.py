@@ -30,7 +30,13 @@ import flask
 import magic
 import sys
 import sqlite3
-from typing import Any, Dict
+import glob
+import hashlib
+import contextlib
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
 from dataclasses import is_dataclass
 from sqlalchemy.orm import aliased
 from sqlalchemy.sql import text
@@ -54,11 +60,29 @@ app = flask.Flask(__name__)
         for e in generator.ordered_items
         if any(parameter_spec in generator.get_inner_types(e, f.type) for f in fields(e))
     }
+
+    # The field shown as text in a block, as `get_text(0)` in the client.
+    text_fields = {}
+    for e in generator.ordered_items:
+        names = [f.name for f in fields(e)
+                 if generator.field_is_type(f.type, str) or generator.field_is_type(f.type, mdef.longstr)]
+        if names:
+            text_fields[e.__name__] = names[0]
+
+    import os.path
+    client_src_dir = os.path.abspath(os.path.join(os.path.dirname(mdef.__file__), '..', 'client_src'))
+    # Relative to the server, so the generated files do not depend on where they were generated.
+    client_src_dir = os.path.relpath(client_src_dir, config.server_dir)
 %>
 INSTANCE_ENTITIES = [${ir}]
 
 PARAMETER_SPECIFICATIONS = ${repr(parameter_specifications)}
 
+# Used for drawing diagrams on the server.
+STYLING = ${repr(generator.styling)}
+TEXT_FIELDS = ${repr(text_fields)}
+CLIENT_SRC = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ${repr(client_src_dir)}))
+
 
 def get_request_data() -> Dict[str, Any]:
     if flask.request.data:
@@ -354,6 +378,43 @@ def update_entity_data(path, index):
             result = record.asjson()
             return flask.make_response(result, 202)
 
+@app.route("/data/<path:path>/bulk", methods=['POST', 'PUT'])
+def update_entities_data(path):
+    """ Update several records of a table in a single transaction. The request holds a list of records with their Id. """
+    if not (table := dm.__dict__.get(path, '')):
+        return flask.make_response('Not found', 404)
+    records = get_request_data()
+    with dm.session_context() as session:
+        if issubclass(table, dm.Base):
+            stored = {r.Id: r for r in session.query(table).filter(table.Id.in_([d['Id'] for d in records]))}
+            if len(stored) != len(records):
+                return flask.make_response('Not found', 404)
+            for data in records:
+                record = stored[data['Id']]
+                for key, value in data.items():
+                    if hasattr(record, key):
+                        setattr(record, key, value)
+                record.post_init()
+            session.commit()
+            result = json.dumps([stored[data['Id']].asdict() for data in records])
+        elif is_dataclass(table):
+            # Check all records exist before changing any of them.
+            try:
+                stored = [table.retrieve(data['Id'], session) for data in records]
+            except (dm.WrongType, dm.NotFound):
+                return flask.make_response('Not found', 404)
+            for record, data in zip(stored, records):
+                for key, value in data.items():
+                    if hasattr(record, key):
+                        setattr(record, key, value)
+                record.update(session)
+            result = '[' + ', '.join(r.asjson().decode('utf8') for r in stored) + ']'
+        else:
+            return flask.make_response('Not found', 404)
+    response = flask.make_response(result, 202)
+    response.headers['Content-Type'] = 'application/json'
+    return response
+
 @app.route("/data/<path:path>", methods=['POST', 'PUT'])
 def add_entity_data(path):
     if not (table := dm.__dict__.get(path, '')):
@@ -453,8 +514,8 @@ def get_hierarchy():
     response.headers['Content-Type'] = 'application/json'
     return response
 
-@app.route('/data/diagram_contents/<int:index>', methods=['GET'])
-def diagram_contents(index):
+def get_diagram_contents(index: int) -> List[Dict[str, Any]]:
+    """ Return the representations shown in a diagram, each with the entity it represents. """
     with (dm.session_context() as session):
         # Get the representations shown in the diagram.
         result = session.query(dm._Representation, dm._Entity).filter(dm._Representation.diagram == index) \
@@ -466,7 +527,11 @@ def diagram_contents(index):
             d = dm.AWrapper.load_from_db(repr).asdict()
             d['_entity'] = dm.AWrapper.load_from_db(entity).asdict()
             data.append(d)
+    return data
 
+@app.route('/data/diagram_contents/<int:index>', methods=['GET'])
+def diagram_contents(index):
+    data = get_diagram_contents(index)
     response = flask.make_response(
         json.dumps(data, cls=dm.ExtendibleJsonEncoder).encode('utf8'),
         200
@@ -510,6 +575,127 @@ def diagram_contents(index):
     response.headers['Content-Type'] = 'application/json'
     return response
 
+# #############################################################################
+# # Draw diagrams on the server, e.g. for documentation.
+
+render_pool = None
+render_pool_lock = threading.Lock()
+
+def init_render_worker():
+    """ Prepare a process that draws diagrams.
+        The headless renderer installs its own `browser` module, and the client sources are only added to
+        the path of these processes. This keeps both out of the server itself.
+    """
+    # The process is forked from the server: the connections of its database engine must not be shared.
+    dm.engine.dispose(close=False)
+    if CLIENT_SRC not in sys.path:
+        sys.path.append(CLIENT_SRC)
+
+def render_contents(contents: str) -> str:
+    """ Draw a diagram from its contents, as returned by `get_diagram_contents`. Runs in a render process. """
+    import headless_render
+    return headless_render.renderDiagramSvg(json.loads(contents), STYLING, TEXT_FIELDS)
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """ The processes that draw the diagrams requested from the server, started when first needed. """
+    global render_pool
+    with render_pool_lock:
+        if render_pool is None:
+            render_pool = ProcessPoolExecutor(initializer=init_render_worker)
+        return render_pool
+
+def prepare_render(index: int) -> Tuple[str, str]:
+    """ Return the contents of a diagram as JSON, and the file a drawing of these contents is cached in.
+
+        The database does not record when a diagram was modified, so the cache is keyed by a hash of
+        the diagram contents. Rendering is much slower than the query needed to compute it.
+    """
+    data = get_diagram_contents(index)
+    # Use the records as the client would receive them.
+    contents = json.dumps(data, cls=dm.ExtendibleJsonEncoder, sort_keys=True)
+    version = hashlib.sha1(contents.encode('utf8')).hexdigest()[:16]
+    cache_dir = os.path.join(dm.data_dir or '.', 'render_cache', os.path.splitext(dm.get_database_name())[0])
+    return contents, os.path.join(cache_dir, f'{index}-{version}.svg')
+
+def read_render(fname: str) -> str:
+    with open(fname, encoding='utf8') as f:
+        return f.read()
+
+def store_render(index: int, fname: str, result: str) -> str:
+    """ Cache a drawing of a diagram, replacing the drawings of older versions. """
+    cache_dir = os.path.dirname(fname)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write the new version atomically, then remove the older versions of this diagram.
+    # Other threads may be storing or removing the same files.
+    tmp_name = f'{fname}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_name, 'w', encoding='utf8') as f:
+        f.write(result)
+    os.replace(tmp_name, fname)
+    for old in glob.glob(os.path.join(cache_dir, f'{index}-*.svg')):
+        if old != fname:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(old)
+    return result
+
+def render_diagram(index: int) -> str:
+    """ Return a diagram as the text of an SVG file. Rendered diagrams are cached on disk. """
+    contents, fname = prepare_render(index)
+    try:
+        return read_render(fname)
+    except FileNotFoundError:
+        # Not rendered yet, or removed by another thread that stored a newer version.
+        pass
+    return store_render(index, fname, get_render_pool().submit(render_contents, contents).result())
+
+@app.route('/render/diagram/<int:index>.svg', methods=['GET'])
+def render_diagram_svg(index):
+    with dm.session_context() as session:
+        diagram = session.query(dm._Entity).filter(dm._Entity.Id == index).first()
+        if diagram is None or diagram.type != dm.EntityType.Diagram:
+            return flask.make_response('Not found', 404)
+    response = flask.make_response(render_diagram(index).encode('utf8'), 200)
+    response.headers['Content-Type'] = 'image/svg+xml'
+    return response
+
+def render_cli(argv: List[str]) -> int:
+    """ Render diagrams to SVG files, in parallel. """
+    parser = argparse.ArgumentParser(prog=f'{sys.argv[0]} render', description=render_cli.__doc__)
+    parser.add_argument('diagrams', nargs='*', type=int, help='The Ids of the diagrams to render (default: all).')
+    parser.add_argument('--out', default='rendered', help='The directory to write the files to.')
+    parser.add_argument('--jobs', type=int, default=None, help='The number of processes to use.')
+    args = parser.parse_args(argv)
+
+    indices = args.diagrams
+    if not indices:
+        with dm.session_context() as session:
+            indices = [d.Id for d in session.query(dm._Entity).filter(dm._Entity.type == dm.EntityType.Diagram)]
+    os.makedirs(args.out, exist_ok=True)
+    # The contents are read here, only the drawing is done in parallel.
+    pool = ProcessPoolExecutor(max_workers=args.jobs, initializer=init_render_worker)
+    jobs = {}
+    failures = 0
+    for i in indices:
+        try:
+            contents, fname = prepare_render(i)
+        except Exception as e:
+            logging.error(f'Reading diagram {i} failed: {e}')
+            failures += 1
+            continue
+        jobs[i] = (fname, None if os.path.exists(fname) else pool.submit(render_contents, contents))
+    for i, (fname, future) in jobs.items():
+        try:
+            result = read_render(fname) if future is None else store_render(i, fname, future.result())
+            out_name = os.path.join(args.out, f'diagram_{i}.svg')
+            with open(out_name, 'w', encoding='utf8') as f:
+                f.write(result)
+            print(f'Rendered diagram {i} to {out_name}')
+        except Exception as e:
+            logging.error(f'Rendering diagram {i} failed: {e}')
+            failures += 1
+    pool.shutdown()
+    return 1 if failures else 0
+
+
 # #############################################################################
 # # Serve the static data (HTML, JS and other resources)
 assets_dir = "${config.pub_dir}"
@@ -550,20 +736,36 @@ def send_static(path):
         return flask.send_from_directory(app.config['client_src'], path, mimetype=mime_type)
     return "NOT FOUND", 404
 
+@app.route('/dev/reload')
+def get_reload_state():
+    """ In watch mode (see `run_project.py`), the browsers poll for changes to the tool. """
+    reload_file = app.config.get('reload_file')
+    if not reload_file:
+        return "NOT FOUND", 404
+    try:
+        with open(reload_file) as f:
+            return flask.jsonify(json.load(f))
+    except (OSError, ValueError):
+        # The file is being replaced.
+        return "UNAVAILABLE", 503
+
 @app.route('/')
 def send_index():
     return flask.redirect("${generator.module_name}_client.html", 302)
     #return flask.send_from_directory("${config.client_dir}", 'index.html', mimetype='text/html')
 
 
-def run(port, client_src):
+def run(port, client_src, reload_file=None):
     if not os.path.exists('data'):
         os.mkdir('data')
     app.config['client_dir'] = 'public'
     app.config['client_src'] = '../'+client_src
+    app.config['reload_file'] = reload_file
     dm.init_db()
     app.run(threaded=True, host='0.0.0.0', port=int(port))
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'render':
+        sys.exit(render_cli(sys.argv[2:]))
     run(sys.argv[1] if len(sys.argv) > 1 else '5100', 'client_src')
@@ -0,0 +1,84 @@
+"""
+Benchmark for generating a tool from a large model specification.
+
+A synthetic specification is made with folders holding a number of entities, where each entity refers
+to a few of the entities defined before it. The benchmark measures loading and analysing the
+specification, and generating the client and server files from it.
+
+Run from the `test` directory with `client_src` and `diagram_tool_generator` on the python path:
+    PYTHONPATH=../client_src:../diagram_tool_generator:.. python benchmark_generator.py [nr_classes ...]
+"""
+
+import os
+import sys
+import random
+import tempfile
+from time import perf_counter
+import generate_tool as gen
+
+
+def mk_specification(nr_classes, seed=1):
+    rnd = random.Random(seed)
+    lines = ['from typing import Self, Any',
+             'from model_definition import ModelDefinition, required, longstr, XRef, hidden, detail',
+             'md = ModelDefinition()',
+             "md.ModelVersion('0.1')",
+             '',
+             '@md.ModelRoot',
+             'class RootModel:',
+             '    pass',
+             '']
+    nr_folders = max(1, nr_classes // 50)
+    for f in range(nr_folders):
+        lines += ['@md.LogicalModel',
+                  f'class Folder{f}:',
+                  '    name: str',
+                  "    parent: XRef('children', Self, RootModel, hidden)",
+                  '']
+    for i in range(nr_classes):
+        lines += ["@md.Entity(styling='shape:rect')",
+                  f'class Entity{i}:',
+                  f"    parent: XRef('children', Self, Folder{i % nr_folders}, hidden)",
+                  '    name: (str, required)',
+                  '    description: (longstr, detail)',
+                  '    count: int']
+        for j in rnd.sample(range(i), min(i, 3)):
+            lines.append(f"    ref{j}: XRef('referenced{i}', Entity{j}, hidden)")
+        lines.append('')
+    for i in range(nr_classes // 10):
+        lines += [f"@md.BlockDiagram({', '.join(f'Entity{j}' for j in rnd.sample(range(nr_classes), 5))})",
+                  f'class Diagram{i}:',
+                  '    name: str',
+                  f"    parent: XRef('children', Folder{i % nr_folders}, hidden)",
+                  '']
+    return '\n'.join(lines)
+
+
+def benchmark(nr_classes):
+    with tempfile.TemporaryDirectory() as homedir:
+        spec = os.path.join(homedir, f'bench{nr_classes}_spec.py')
+        with open(spec, 'w') as f:
+            f.write(mk_specification(nr_classes))
+        config = gen.Configuration(spec, homedir=homedir)
+
+        t0 = perf_counter()
+        generator, module_name = gen.Generator.load_from_config(config)
+        t_load = perf_counter() - t0
+        del sys.modules[module_name]
+
+        t0 = perf_counter()
+        gen.generate_tool(gen.Configuration(spec, homedir=homedir))
+        t_generate = perf_counter() - t0
+
+        t0 = perf_counter()
+        gen.generate_tool(gen.Configuration(spec, homedir=homedir))
+        t_unchanged = perf_counter() - t0
+
+    print(f"{nr_classes:6} classes | load & analyse: {t_load*1000:8.1f} ms | "
+          f"generate: {t_generate*1000:8.1f} ms | unchanged: {t_unchanged*1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [100, 1000]
+    for n in sizes:
+        benchmark(n)
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark for the geometry kernels in point.py.
+
+Compares creating new Points for each operation with updating points in place, and with
+the routines that work on flat co-ordinate lists. Also shows the memory used per point.
+
+Run from the `test` directory with `client_src` on the python path:
+    PYTHONPATH=../client_src python benchmark_point.py [nr_points]
+"""
+
+import sys
+import random
+import tracemalloc
+from time import perf_counter
+from point import Point, flatten, translate, path_string, nearest_segment
+
+
+def timeit(f, repeat=5):
+    best = None
+    for _ in range(repeat):
+        t0 = perf_counter()
+        f()
+        t = perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return best
+
+
+def benchmark(nr_points):
+    rnd = random.Random(1)
+    points = [Point(rnd.uniform(0, 1000), rnd.uniform(0, 1000)) for _ in range(nr_points)]
+    delta = Point(3, 4)
+
+    tracemalloc.start()
+    snapshot = tracemalloc.take_snapshot()
+    extra = [Point(float(i), float(i)) for i in range(nr_points)]
+    allocated = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(snapshot, 'filename'))
+    tracemalloc.stop()
+    del extra
+
+    def operators():
+        for i in range(len(points)):
+            points[i] = points[i] + delta
+
+    def in_place():
+        for p in points:
+            p.iadd(delta)
+
+    coords = flatten(points)
+
+    def flat():
+        translate(coords, delta.x, delta.y)
+
+    def path_points():
+        ''.join(f'L {p.x} {p.y} ' for p in points)
+
+    def path_flat():
+        path_string(flatten(points))
+
+    def segment_points():
+        distances = []
+        pos = Point(500, 500)
+        for a, b in zip(points[:-1], points[1:]):
+            v = b - a
+            n = Point(x=v.y, y=-v.x)
+            d1 = pos - a
+            if v.dot(d1) < 0 or (a - b).dot(pos - b) < 0:
+                distances.append(float('inf'))
+            else:
+                distances.append(abs(n.dot(d1)))
+        distances.index(min(distances))
+
+    def segment_flat():
+        nearest_segment(coords, 500, 500)
+
+    print(f"{nr_points:8} points | {allocated / nr_points:5.1f} bytes/point | "
+          f"translate: operators {timeit(operators)*1000:7.2f} ms, in place {timeit(in_place)*1000:7.2f} ms, "
+          f"flat {timeit(flat)*1000:7.2f} ms | "
+          f"path: points {timeit(path_points)*1000:7.2f} ms, flat {timeit(path_flat)*1000:7.2f} ms | "
+          f"nearest segment: points {timeit(segment_points)*1000:7.2f} ms, flat {timeit(segment_flat)*1000:7.2f} ms")
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 100000]
+    for n in sizes:
+        benchmark(n)
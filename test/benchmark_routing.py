@@ -0,0 +1,119 @@
+"""
+Benchmark for routing connections around the blocks in a diagram.
+
+Synthetic diagrams are made with blocks on a jittered grid, where each block is connected to
+one of the blocks near it. The benchmark measures routing all connections, and the work done
+when a single block is dragged around (which should only re-route the connections near it).
+
+Run from the `test` directory with `client_src` on the python path:
+    PYTHONPATH=../client_src python benchmark_routing.py [nr_blocks ...]
+"""
+
+import sys
+import random
+from time import perf_counter
+from point import Point
+from square_routing import routeSquare
+from orthogonal_routing import ObstacleGraph
+from storable_element import ReprCategory
+
+
+def mk_diagram(nr_blocks, seed=1):
+    rnd = random.Random(seed)
+    columns = int(nr_blocks ** 0.5) + 1
+    blocks = {}
+    for i in range(nr_blocks):
+        row, col = divmod(i, columns)
+        blocks[i] = (col * 200 + rnd.randint(0, 60), row * 120 + rnd.randint(0, 40), 64, 40)
+    connections = []
+    for i in range(0, nr_blocks, 2):
+        row, col = divmod(i, columns)
+        dr, dc = rnd.choice([(0, 1), (0, 2), (0, 3), (1, 0), (1, 1), (2, 0), (1, -2)])
+        if 0 <= col + dc < columns and (j := (row + dr) * columns + col + dc) < nr_blocks:
+            connections.append((i, j))
+    return blocks, connections
+
+
+def as_points(rect):
+    return Point(rect[0], rect[1]), Point(rect[2], rect[3])
+
+
+def benchmark(nr_blocks, drag_steps=20):
+    blocks, connections = mk_diagram(nr_blocks)
+
+    t0 = perf_counter()
+    for a, b in connections:
+        routeSquare(as_points(blocks[a]), as_points(blocks[b]), [])
+    t_square = perf_counter() - t0
+
+    graph = ObstacleGraph()
+    t0 = perf_counter()
+    graph.update(blocks.items())
+    t_graph = perf_counter() - t0
+
+    t0 = perf_counter()
+    for key, (a, b) in enumerate(connections):
+        graph.route(key, blocks[a], blocks[b])
+    t_route = perf_counter() - t0
+
+    # Drag a block through the middle of the diagram and re-route everything after every step.
+    # Like in a diagram, only the block that moved is updated in the graph.
+    dragged = nr_blocks // 2
+    misses = graph.stats['misses']
+    t0 = perf_counter()
+    for step in range(drag_steps):
+        x, y, w, h = blocks[dragged]
+        blocks[dragged] = (x + 7, y + 3, w, h)
+        graph.place(dragged, blocks[dragged])
+        for key, (a, b) in enumerate(connections):
+            graph.route(key, blocks[a], blocks[b])
+    t_drag = (perf_counter() - t0) / drag_steps
+    rerouted = (graph.stats['misses'] - misses) / drag_steps
+
+    print(f"{nr_blocks:6} blocks {len(connections):6} connections | "
+          f"square: {t_square*1000:8.1f} ms | graph: {t_graph*1000:7.1f} ms | "
+          f"around blocks: {t_route*1000:8.1f} ms | per drag step: {t_drag*1000:7.1f} ms, "
+          f"{rerouted:.1f} connections re-routed")
+
+
+def benchmark_diagram(nr_blocks, drag_steps=20):
+    """ The same, but with the blocks and connections of a client diagram. """
+    from browser import svg
+    from diagrams import Diagram, DiagramConfiguration
+    from shapes import Shape, Relationship
+
+    class Block(Shape):
+        @classmethod
+        def repr_category(cls):
+            return ReprCategory.block
+
+    rects, links = mk_diagram(nr_blocks)
+    blocks = [Block(x=x, y=y, width=w, height=h) for x, y, w, h in rects.values()]
+    connections = [Relationship(start=blocks[a], finish=blocks[b], styling={'routing_method': 'orthogonal'})
+                   for a, b in links]
+    diagram = Diagram(DiagramConfiguration({}, {}), [])
+    diagram.canvas = svg.svg()
+    diagram.cull_threshold = None
+
+    t0 = perf_counter()
+    diagram.viewport.load(blocks, connections)
+    diagram.viewport.update()
+    t_load = perf_counter() - t0
+
+    dragged = blocks[nr_blocks // 2]
+    t0 = perf_counter()
+    for step in range(drag_steps):
+        dragged.setPos(Point(dragged.x + 7, dragged.y + 3))
+        diagram.rerouteConnections(dragged)
+    t_drag = (perf_counter() - t0) / drag_steps
+
+    print(f"{nr_blocks:6} blocks {len(connections):6} connections | "
+          f"diagram load: {t_load*1000:8.1f} ms | per drag step: {t_drag*1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [100, 1000, 5000]
+    for n in sizes:
+        benchmark(n)
+    for n in sizes:
+        benchmark_diagram(n)
@@ -0,0 +1,63 @@
+"""
+Benchmark for drawing blocks with many ports, with and without `?symbols`.
+
+A number of MCU blocks is drawn, each with the given number of ports spread over its sides. Without symbols
+each port is an element of its own. With symbols, the outline and ports are drawn once in a symbol that
+the blocks of the same size share, and each block is a `<use>` of it plus its text.
+The benchmark counts the DOM nodes, including those of the symbols, and measures drawing the blocks.
+
+Run from the `test` directory with `client_src` and the browser stubs on the python path:
+    PYTHONPATH=../client_src:../diagram_tool_generator:..:. python benchmark_symbols.py [nr_ports ...]
+"""
+
+import sys
+from time import perf_counter
+
+import generate_project  # Ensures the client is built up to date
+# As the client is generated by the `import generate_project`, this must be BELOW that line.
+import public.sysml_client as client
+from data_store import ReprCategory
+from shapes import Orientations
+from svg_shapes import shape_registry, symbol_cache
+
+
+def count_nodes(element) -> int:
+    return 1 + sum(count_nodes(c) for c in getattr(element, 'children', []))
+
+
+def mk_blocks(nr_blocks, nr_ports):
+    entity = client.Block(Id=1, name='MCU')
+    ports = [client.FlowPort(Id=2+i, parent=1, name=f'P{i}') for i in range(nr_ports)]
+    sides = [Orientations.LEFT, Orientations.RIGHT, Orientations.TOP, Orientations.BOTTOM]
+    blocks = []
+    for b in range(nr_blocks):
+        block = entity.get_representation_cls(ReprCategory.block)(model_entity=entity, x=400*b, y=0,
+                                                                    width=300, height=300, Id=b+1)
+        block.ports = [p.get_representation_cls(ReprCategory.port)(model_entity=p, parent=b+1, Id=1000*(b+1)+i,
+                                                                   orientation=sides[i % 4], order=i // 4)
+                       for i, p in enumerate(ports)]
+        blocks.append(block)
+    return blocks
+
+
+def benchmark(nr_ports, nr_blocks=20):
+    results = []
+    for use_symbols in [False, True]:
+        shape_registry.use_symbols = use_symbols
+        blocks = mk_blocks(nr_blocks, nr_ports)
+        t0 = perf_counter()
+        shapes = [b.getShape() for b in blocks]
+        t_draw = perf_counter() - t0
+        nr_nodes = sum(count_nodes(s) for s in shapes) + count_nodes(symbol_cache.defs)
+        results.append(f"{'with' if use_symbols else 'without'} symbols {nr_nodes:6} nodes, "
+                       f"{t_draw*1000:7.1f} ms")
+        for b in blocks:
+            b.delete()
+    shape_registry.use_symbols = False
+    print(f"{nr_blocks} blocks of {nr_ports:4} ports | " + ' | '.join(results))
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [64, 128]
+    for n in sizes:
+        benchmark(n)
@@ -0,0 +1,63 @@
+"""
+Benchmark for laying out the texts in a diagram.
+
+Lays out the labels of a diagram, and then the label of a single block for each frame
+while it is being resized, as happens when shapes are redrawn.
+
+Run from the `test` directory with `client_src` and the browser stubs on the python path:
+    PYTHONPATH=../client_src:. python benchmark_text.py [nr_labels ...]
+"""
+
+import sys
+import random
+from time import perf_counter
+from svg_shapes import wrapText, layoutText, clearTextCache, text_layout_cache
+
+WORDS = ("block port flow signal controller sensor actuator interface requirement state machine "
+         "transition message handler buffer queue timer watchdog converter motor").split()
+
+
+def mk_labels(nr_labels, seed=1):
+    rnd = random.Random(seed)
+    return [' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 6))) for _ in range(nr_labels)]
+
+
+def benchmark(nr_labels, redraws=5, resize_frames=200):
+    labels = mk_labels(nr_labels)
+
+    # Redrawing the whole diagram a number of times.
+    t0 = perf_counter()
+    for _ in range(redraws):
+        for label in labels:
+            layoutText(label, 100)
+    t_uncached = perf_counter() - t0
+
+    clearTextCache()
+    t0 = perf_counter()
+    for _ in range(redraws):
+        for label in labels:
+            wrapText(label, 100)
+    t_cached = perf_counter() - t0
+    hits, misses = text_layout_cache.hits, text_layout_cache.misses
+
+    # Resizing a block back and forth over a range of widths.
+    widths = [60 + abs(i % 80 - 40) for i in range(resize_frames)]
+    t0 = perf_counter()
+    for w in widths:
+        layoutText(labels[0], w)
+    t_resize_uncached = perf_counter() - t0
+    t0 = perf_counter()
+    for w in widths:
+        wrapText(labels[0], w)
+    t_resize_cached = perf_counter() - t0
+
+    print(f"{nr_labels:6} labels | {redraws} redraws: uncached {t_uncached*1000:8.1f} ms, "
+          f"cached {t_cached*1000:8.1f} ms ({hits} hits, {misses} misses) | "
+          f"{resize_frames} resize frames: uncached {t_resize_uncached*1000:6.1f} ms, "
+          f"cached {t_resize_cached*1000:6.1f} ms")
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [100, 1000]
+    for n in sizes:
+        benchmark(n)
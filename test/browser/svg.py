@@ -148,6 +148,9 @@ class  tspan(text):
     pass
 
 
+class  symbol(svg_tag):
+    pass
+
 class  use(svg_tag):
     pass
 
@@ -307,7 +307,7 @@ class DiagramsApi(HtmlApi):
         assert self.current_diagram().mouse_events_fsm.state == diagrams.ResizeStates.DECORATED
         self.parent.parent.dispatchEvent(events.KeyDown(key='Delete'))
         # The user is presented with an acknowledgement diagram
-        self.context.expect_request('/data/_BlockRepresentation/4', 'delete', 204)
+        self.context.expect_request(f'/data/_BlockRepresentation/{rid}', 'delete', 204)
         self.press_ok()
         self.context.check_expected_response()
 
@@ -537,6 +537,8 @@ class IntegrationContext:
         self.expect_request(f'/current_database', 'get', 201, response_json="test_db")
         if hierarchy:
             self.expect_request(f'/data/hierarchy', 'get', 201, response_json=hierarchy)
+        # The test server does not run in watch mode, see `live_reload`.
+        self.expect_request('/dev/reload', 'get', 404)
 
         self.data_store, self.diagram_tabview = client.run('explorer', 'canvas', 'details')
         self.ds = DataStoreApi(self, self.data_store)
@@ -8,5 +8,11 @@ import test_dispatcher
 import generate_tool
 import test_routing
 import test_generator
+import test_spatial_index
+import test_point
+import test_scheduling
+import test_viewport
+import test_headless_render
+import test_instrumentation
 
 test_frame.run_tests()
\ No newline at end of file
@@ -229,6 +229,105 @@ def simulated_diagram_tests():
         assert conn.finish.Id == 11
         check_expected_response()
 
+    @test
+    def incremental_shape_update():
+        from render_state import dom_mutations
+        diagram, rest = new_diagram(1, MagicMock())
+        entity = client.Block(Id=1, name='block')
+        block = entity.get_representation_cls(ReprCategory.block)(model_entity=entity, x=100, y=100, height=64,
+                                                                    width=100, Id=10)
+        port_entities = [client.FlowPort(Id=2+i, parent=1, name=f'p{i}') for i in range(2)]
+        block.ports = [p.get_representation_cls(ReprCategory.port)(model_entity=p, parent=10, Id=20+i)
+                       for i, p in enumerate(port_entities)]
+        diagram.addBlock(block)
+        # Updating without changes does not touch the DOM.
+        block.updateShape()
+        dom_mutations.reset()
+        block.updateShape()
+        assert dom_mutations.reset() == 0
+        # Moving the block changes the x of the outline, the text and the ports.
+        block.setPos(Point(120, 100))
+        dom_mutations.reset()
+        block.setPos(Point(150, 100))
+        assert dom_mutations.reset() == 1 + 1 + 2
+        assert block.shape.children[0]['x'] == '150.0'
+        assert block.ports[0].shape['x'] == 245
+        # Changing the text re-renders the text only.
+        entity.name = 'new name'
+        block.updateShape()
+        assert dom_mutations.reset() == 2
+        # Adding a port adds a single element, and moves the other ports.
+        new_port = client.FlowPort(Id=5, parent=1, name='p2')
+        block.ports.append(new_port.get_representation_cls(ReprCategory.port)(model_entity=new_port, parent=10, Id=22))
+        block.updateShape()
+        assert dom_mutations.reset() == 1 + 2
+        assert len(block.shape.select('[data-category="3"]')) == 3
+
+    @test
+    def blocks_drawn_from_symbols():
+        from render_state import dom_mutations
+        from svg_shapes import shape_registry, symbol_cache
+        shape_registry.use_symbols = True
+        try:
+            diagram, rest = new_diagram(1, MagicMock())
+            entity = client.Block(Id=1, name='block')
+            port_entities = [client.FlowPort(Id=2+i, parent=1, name=f'p{i}') for i in range(3)]
+            def mk_block(Id, x):
+                block = entity.get_representation_cls(ReprCategory.block)(model_entity=entity, x=x, y=100,
+                                                                            height=60, width=100, Id=Id)
+                block.ports = [p.get_representation_cls(ReprCategory.port)(model_entity=p, parent=Id, Id=10*Id+i)
+                               for i, p in enumerate(port_entities)]
+                diagram.addBlock(block)
+                return block
+            a, b = mk_block(1, 100), mk_block(2, 300)
+
+            # Both blocks use the same symbol, holding the outline and the ports. Only the text is drawn separately.
+            use = a.shape.children[0]
+            assert type(use).__name__ == 'use' and len(a.shape.children) == 2
+            assert use['href'] == b.shape.children[0]['href'] and (use['x'], use['y']) == ('100', '100')
+            assert a.symbol_key == b.symbol_key and symbol_cache.users[a.symbol_key] == 2
+            nr_symbols = len(symbol_cache.symbols)
+            symbol = symbol_cache.symbols[a.symbol_key]
+            assert [type(e).__name__ for e in symbol.children] == ['rect'] * 4
+            assert (symbol.children[2]['x'], symbol.children[2]['y']) == (95, 25)
+            assert a.ports[1].pos == Point(200, 130) and a.ports[1].shape is None
+
+            # Moving a block only moves the use and the text. The ports move with the block.
+            a.setPos(Point(110, 100))
+            dom_mutations.reset()
+            a.setPos(Point(120, 100))
+            assert dom_mutations.reset() == 1 + 1
+            assert use['x'] == '120.0' and a.ports[1].pos == Point(220, 130)
+
+            # The ports are found by their position.
+            target = a.getConnectionTarget(events.MouseDown(target=use, offsetX=218, offsetY=133))
+            assert target is a.ports[1]
+            assert a.getConnectionTarget(events.MouseDown(target=use, offsetX=180, offsetY=133)) is a
+            use.dispatchEvent(events.MouseMove(offsetX=218, offsetY=133))
+            assert [t.text for t in a.shape.children[2:]] == ['p1']
+            use.dispatchEvent(events.MouseLeave())
+            assert len(a.shape.children) == 2
+
+            # A block that is resized gets a symbol of its own, until it has the same size again.
+            b.setSize(Point(120, 60))
+            assert b.shape.children[0]['href'] != use['href'] and len(symbol_cache.symbols) == nr_symbols + 1
+            b.setSize(Point(100, 60))
+            assert b.shape.children[0]['href'] == use['href'] and len(symbol_cache.symbols) == nr_symbols
+            # Adding a port changes the symbol.
+            new_port = client.FlowPort(Id=5, parent=1, name='p3')
+            b.ports.append(new_port.get_representation_cls(ReprCategory.port)(model_entity=new_port, parent=2, Id=23))
+            b.updateShape()
+            assert len(symbol_cache.symbols[b.symbol_key].children) == 5 and len(symbol_cache.symbols) == nr_symbols + 1
+
+            # Symbols that are no longer used are removed.
+            keys = [a.symbol_key, b.symbol_key]
+            diagram.deleteBlock(a)
+            diagram.deleteBlock(b)
+            assert not any(k in symbol_cache.symbols for k in keys)
+            assert len(symbol_cache.symbols) == len(symbol_cache.defs.children) == nr_symbols - 1
+        finally:
+            shape_registry.use_symbols = False
+
     @test
     def drag_and_drop():
         ds = mk_ds()
@@ -1469,17 +1568,15 @@ def integration_tests():
         p2 = copy(b2.getPos())
         d_x = p2.x - p1.x
         # First move it half-way across
-        # Currently, the clipping of the block happens after the initial change was sent to the database.
-        # So two changes are expected.
-        add_expected_response('/data/_BlockRepresentation/1', 'post', Response(200, json=[]))
-        add_expected_response('/data/_BlockRepresentation/2', 'post', Response(200, json=[]))
+        # Both blocks are laid out again, and stored with a single request.
+        add_expected_response('/data/_BlockRepresentation/bulk', 'post', Response(202, json=[]))
         context.diagrams.move_block(b1.Id, [d_x//2,0], expect_no_change=True)
         # The block should be back at the correct position
         assert b1.getPos() == Point(90,60)
         assert b2.getPos() == Point(174,60)
         # Now move it over the other block. The blocks should be swapped.
-        add_expected_response('/data/_BlockRepresentation/2', 'post', Response(200, json=[]))
-        context.diagrams.move_block(b1.Id, [d_x+10, 0])
+        add_expected_response('/data/_BlockRepresentation/bulk', 'post', Response(202, json=[]))
+        context.diagrams.move_block(b1.Id, [d_x+10, 0], expect_no_change=True)
         assert b1.getPos() == Point(174,60)
         assert b2.getPos() == Point(90,60)
 
@@ -1513,6 +1610,75 @@ def integration_tests():
         assert c2.waypoints == [Point(90,90)]
         check_expected_response()
 
+    @test
+    def laned_diagram_incremental_layout():
+        def actor(rid, mid, x, order):
+            return {"Id": rid, "diagram": 45, "block": mid, "parent": None, "x": x, "y": 60.0, "z": 0.0, "width": 40.0,
+                    "height": 64.0, "order": order, "orientation": None, "styling": "", "category": 6,
+                    "lane_length": 1000.0, "__classname__": "_BlockRepresentation",
+                    "_entity": {"order": 0, "Id": mid, "name": "", "description": "", "parent": 45,
+                                "__classname__": "Actor"}}
+        def message(rid, source, target, offset):
+            return {"Id": rid, "diagram": 45, "relationship": rid, "source_repr_id": source,
+                    "target_repr_id": target, "routing": f"[[{offset}, {offset}]]", "z": 0.0, "styling": {},
+                    "category": 7, "__classname__": "_RelationshipRepresentation",
+                    "_entity": {"Id": rid, "source": source+18, "target": target+18, "name": "", "kind": 1,
+                                "parent": 45, "__classname__": "SequencedMessage"}}
+        data = [actor(37, 55, 90.0, 1), actor(38, 56, 150.0, 2), actor(39, 57, 210.0, 3),
+                message(34, 37, 38, 30.0), message(35, 38, 39, 60.0)]
+        context = intergration_context(hierarchy=[
+            client.FunctionalModel(Id=1).asdict(),
+            client.SequenceDiagram(Id=45, parent=1).asdict()
+        ])
+        add_expected_response('/data/diagram_contents/45', 'get', Response(200, json=data))
+        context.explorer.dblclick_element(mid=45)
+        diagram = context.diagrams.current_diagram()
+        b1, b2, b3 = diagram.lanes
+        c1, c2 = context.diagrams.connections()
+
+        # Move the first lane past the second. Only these two lanes are displaced, the third is not stored.
+        # Both are stored with a single request.
+        def check_bulk(ids):
+            def check(url, method, data):
+                assert [d['Id'] for d in data] == ids, data
+            return check
+        add_expected_response('/data/_BlockRepresentation/bulk', 'post', Response(202, json=[]),
+                              check_request=check_bulk([37, 38]))
+        context.diagrams.move_block(37, [70, 0], expect_no_change=True)
+        assert diagram.lanes == [b2, b1, b3]
+        assert [(b.x, b.order) for b in [b1, b2, b3]] == [(150, 2), (90, 1), (210, 3)]
+        assert c1.path['d'].startswith('M 170.0 ')
+        assert c2.path['d'].startswith('M 110.0 ')
+        # Both changes are undone as a single action.
+        assert len(context.ds.undo_queue) == 1
+        add_expected_response('/data/_BlockRepresentation/37', 'post', Response(200, json=[]))
+        add_expected_response('/data/_BlockRepresentation/38', 'post', Response(200, json=[]))
+        context.diagrams.undo()
+        check_expected_response()
+        assert [(b.x, b.order) for b in [b1, b2, b3]] == [(90, 1), (150, 2), (210, 3)]
+        assert c2.path['d'].startswith('M 170.0 ')
+
+        # After the undo, the order of the lanes is restored from their positions.
+        add_expected_response('/data/_BlockRepresentation/bulk', 'post', Response(202, json=[]),
+                              check_request=check_bulk([39, 37, 38]))
+        context.diagrams.move_block(39, [-130, 0], expect_no_change=True)
+        assert diagram.lanes == [b3, b1, b2]
+        assert [b.x for b in diagram.lanes] == [90, 150, 210]
+        assert len(context.ds.undo_queue) == 1
+
+        # A deleted lane is no longer laid out.
+        add_expected_response('/data/_RelationshipRepresentation/34', 'delete', Response(204, json=[]))
+        add_expected_response('/data/_RelationshipRepresentation/35', 'delete', Response(204, json=[]))
+        context.diagrams.delete_block(rid=38)
+        assert diagram.lanes == [b3, b1]
+        assert b2 not in diagram.children
+        add_expected_response('/data/_BlockRepresentation/bulk', 'post', Response(202, json=[]),
+                              check_request=check_bulk([37, 39]))
+        context.diagrams.move_block(37, [-100, 0], expect_no_change=True)
+        assert diagram.lanes == [b1, b3]
+        assert [b.x for b in diagram.lanes] == [90, 150]
+        check_expected_response()
+
     @test
     def laned_diagram_with_msg_text():
         json_data = """[{"Id": 37, "diagram": 45, "block": 55, "parent": null, "x": 161.0, "y": 96.0, "z": 0.0, "width": 42.0, "height": 64.0, "order": 2, "orientation": null, "styling": "", "category": 6, "lane_length": 1000.0, "_entity": {"order": 0, "Id": 55, "name": "", "description": "", "parent": 45, "__classname__": "Actor"}, "__classname__": "_BlockRepresentation"}, {"Id": 38, "diagram": 45, "block": 56, "parent": null, "x": 90.0, "y": 99.0, "z": 0.0, "width": 51.0, "height": 64.0, "order": 1, "orientation": null, "styling": "", "category": 6, "lane_length": 1000.0, "_entity": {"order": 0, "Id": 56, "name": "", "description": "", "parent": 45, "__classname__": "Actor"}, "__classname__": "_BlockRepresentation"}, {"Id": 34, "diagram": 45, "relationship": 34, "source_repr_id": 37, "target_repr_id": 38, "routing": "[[50.0, 50.0]]", "z": 0.0, "styling": {}, "category": 7, "__classname__": "_RelationshipRepresentation", "_entity": {"Id": 34, "source": 55, "target": 56, "name": "answer", "kind": 1, "parent": 45, "__classname__": "SequencedMessage"}}, {"Id": 35, "diagram": 45, "relationship": 35, "source_repr_id": 37, "target_repr_id": 38, "routing": "[[13.0, 13.0]]", "z": 0.0, "styling": {}, "category": 7, "__classname__": "_RelationshipRepresentation", "_entity": {"Id": 35, "source": 55, "target": 56, "name": "Request", "kind": 1, "parent": 45, "__classname__": "SequencedMessage"}}, {"Id": 36, "diagram": 45, "relationship": 36, "source_repr_id": 37, "target_repr_id": 37, "routing": "[[80.0, 80.0]]", "z": 0.0, "styling": {}, "anchor_offsets": {"C": [20.0, 30.0]}, "anchor_sizes": {"C": [80.0,20.0]}, "category": 7, "__classname__": "_RelationshipRepresentation", "_entity": {"Id": 36, "source": 55, "target": 55, "name": "Dit is een TEST", "kind": 1, "parent": 45, "__classname__": "SequencedMessage"}}]"""
@@ -1590,6 +1756,45 @@ def integration_tests():
         assert len(context.diagrams.blocks()) == 12
         assert len(context.diagrams.connections()) == 12
 
+    @test
+    def schema_manifest():
+        from dataclasses import fields
+        from storable_element import field_names
+        # The generated field lists match the dataclasses.
+        for cls in list(client.all_entities.values()) + list(client.block_entities.values()):
+            assert cls.schema_fields == tuple(f.name for f in fields(cls)), cls.__name__
+            assert field_names(cls(Id=1)) is field_names(cls)
+        # The allowed blocks are resolved once.
+        diagram = client.BlockDefinitionDiagram.Diagram
+        assert diagram.get_allowed_blocks()['Block'] is client.Block
+        assert diagram.get_allowed_blocks() is not diagram.get_allowed_blocks()
+        # Parameter specifications are parsed once, but the caller gets its own copy.
+        block = client.Block(Id=1, parameters='a: int, b: float')
+        specs = block.get_parameter_specs()
+        assert specs == {'a': int, 'b': float}
+        specs['c'] = str
+        assert block.get_parameter_specs() == {'a': int, 'b': float}
+
+    @test
+    def live_reload():
+        from live_reload import LiveReload
+        class Reloader(LiveReload):
+            reloads = 0
+            def reload(self):
+                self.reloads += 1
+        reloader = Reloader()
+        state = {'version': 3, 'modules': []}
+        add_expected_response('/dev/reload', 'get', get_response=lambda *args: Response(200, json=dict(state)),
+                              reuse=True)
+        reloader.start()
+        assert reloader.version == 3
+        reloader.poll()
+        assert reloader.reloads == 0
+        state.update(version=4, modules=['shapes.py'])
+        reloader.poll()
+        assert reloader.reloads == 1
+        clear_expected_response()
+
 
 if __name__ == '__main__':
     # import cProfile
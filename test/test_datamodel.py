@@ -1,6 +1,7 @@
 
 import subprocess
 import os
+import tempfile
 from dataclasses import fields
 from test_frame import prepare, test, run_tests
 import generate_project     # Ensures the client is built up to date
@@ -57,5 +58,100 @@ def init():
             for f in fields(o):
                 assert getattr(o, f.name) == getattr(o2, f.name)
 
+@prepare
+def query_api():
+    import build.sysml_data as dm
+    from test_frame import cleanup
+
+    # Use a fresh database, so the contents are known.
+    original = dm.engine, dm.Session
+    dm.changeDbase('sqlite://')
+    dm.init_db()
+
+    @cleanup
+    def restore_database():
+        dm.engine, dm.Session = original
+
+    diagram = dm.BlockDefinitionDiagram(name='diagram', parent=None)
+    diagram.store()
+    blocks = [dm.Block(parent=diagram.Id, name=f'block{i}') for i in range(3)] + [dm.Note(description='note', parent=diagram.Id)]
+    for b in blocks:
+        b.store()
+    ports = [dm.FlowPort(name='output', parent=blocks[0].Id), dm.FlowPort(name='input', parent=blocks[1].Id)]
+    for p in ports:
+        p.store()
+    connection = dm.FlowPortConnection(source=ports[0].Id, target=ports[1].Id)
+    connection.store()
+    block_reprs = [dm._BlockRepresentation(diagram=diagram.Id, block=b.Id) for b in blocks[:2]]
+    for r in block_reprs:
+        r.store()
+    connection_repr = dm._RelationshipRepresentation(diagram=diagram.Id, relationship=connection.Id,
+                                                     source_repr_id=block_reprs[0].Id,
+                                                     target_repr_id=block_reprs[1].Id)
+    connection_repr.store()
+
+    @test
+    def iterate_entities():
+        assert [b.name for b in dm.iter_entities(dm.Block, batch_size=2)] == ['block0', 'block1', 'block2']
+        assert [type(e).__name__ for e in dm.iter_children(diagram.Id)] == ['Block'] * 3 + ['Note']
+        assert [p.name for p in dm.iter_children(blocks[1].Id, dm.FlowPort)] == ['input']
+        assert [d.Id for d in dm.iter_children(None, dm.BlockDefinitionDiagram)] == [diagram.Id]
+        # Stopping halfway closes the session of the iterator.
+        it = dm.iter_entities()
+        assert isinstance(next(it), dm.AWrapper)
+        it.close()
+
+    @test
+    def iterate_diagram():
+        contents = list(dm.iter_diagram_contents(diagram.Id))
+        assert [r.Id for r in contents] == [r.Id for r in block_reprs + [connection_repr]]
+        assert contents[1]._entity.name == 'block1'
+        assert contents[2]._entity.target == ports[1].Id
+        blocks_only = dm.iter_diagram_contents(diagram.Id, [dm.ReprCategory.block])
+        assert [r.Id for r in blocks_only] == [r.Id for r in block_reprs]
+        assert list(dm.iter_diagram_connections(diagram.Id)) == \
+               [(connection_repr.Id, connection.Id, block_reprs[0].Id, block_reprs[1].Id)]
+
+    @test
+    def relationship_adjacency():
+        assert list(dm.iter_relationships()) == [(connection.Id, 'FlowPortConnection', ports[0].Id, ports[1].Id)]
+        assert dm.relationship_adjacency(dm.FlowPortConnection) == {ports[0].Id: [(connection.Id, ports[1].Id)]}
+        assert dm.relationship_adjacency(reverse=True) == {ports[1].Id: [(connection.Id, ports[0].Id)]}
+        assert dm.relationship_adjacency(dm.Anchor) == {}
+
+
+    @test
+    def export_import_model():
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = os.path.join(tmp, 'model.ndjson.gz')
+            assert dm.export_model(archive) == (len(list(dm.iter_entities())), 3)
+
+            # Import the whole model into an empty database.
+            current = dm.engine, dm.Session
+            dm.changeDbase(f'sqlite:///{tmp}/other.sqlite3')
+            try:
+                dm.Base.metadata.create_all(bind=dm.engine)
+                dm.import_model(archive)
+                assert [b.name for b in dm.iter_entities(dm.Block)] == ['block0', 'block1', 'block2']
+            finally:
+                dm.engine, dm.Session = current
+
+            # Import a diagram with its contents into the same database, under the diagram itself.
+            assert dm.export_model(archive, [diagram.Id]) == (1 + len(blocks) + len(ports) + 1, 3)
+            assert dm.import_model(archive, diagram.Id) == (1 + len(blocks) + len(ports) + 1, 3)
+            copy = [d for d in dm.iter_children(diagram.Id, dm.BlockDefinitionDiagram)]
+            assert len(copy) == 1 and copy[0].Id not in [diagram.Id] + [b.Id for b in blocks]
+            copied_blocks = list(dm.iter_children(copy[0].Id, dm.Block))
+            assert [b.name for b in copied_blocks] == ['block0', 'block1', 'block2']
+            copied_ports = [p for b in copied_blocks for p in dm.iter_children(b.Id, dm.FlowPort)]
+            # The references between the copied elements point to the copies.
+            copied_connection = [c for c in dm.iter_entities(dm.FlowPortConnection) if c.Id != connection.Id]
+            assert [(c.source, c.target) for c in copied_connection] == [(copied_ports[0].Id, copied_ports[1].Id)]
+            contents = list(dm.iter_diagram_contents(copy[0].Id))
+            assert [r._entity.Id for r in contents] == [copied_blocks[0].Id, copied_blocks[1].Id,
+                                                        copied_connection[0].Id]
+            assert (contents[2].source_repr_id, contents[2].target_repr_id) == (contents[0].Id, contents[1].Id)
+
+
 if __name__ == '__main__':
     run_tests()
\ No newline at end of file
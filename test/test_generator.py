@@ -1,6 +1,9 @@
 
 import os.path
 import sys
+import shutil
+import stat
+import tempfile
 
 from test_frame import prepare, test, run_tests, cleanup
 import diagram_tool_generator.generate_tool as gen
@@ -21,6 +24,133 @@ def generator_tests():
         assert 'description' in names
         assert 'parameters' in names
 
+    @test
+    def incremental_generation():
+        with tempfile.TemporaryDirectory() as homedir:
+            spec = os.path.join(homedir, 'sysml_spec.py')
+            shutil.copy(TEST_SPEC, spec)
+            def generate(**kwargs):
+                return gen.generate_tool(gen.Configuration(spec, homedir=homedir), **kwargs)
+
+            rendered = generate()
+            assert len(rendered) == 4
+            times = {t: os.stat(t).st_mtime_ns for t in rendered}
+            # Nothing changed, so nothing is rendered.
+            assert generate() == []
+            # A change to the specification that does not affect the output renders, but does not write, all files.
+            with open(spec, 'a') as f:
+                f.write('\n# A comment\n')
+            assert sorted(generate()) == sorted(rendered)
+            assert all(os.stat(t).st_mtime_ns == m for t, m in times.items())
+            # Files that are removed are generated again.
+            os.remove(rendered[0])
+            assert generate() == [rendered[0]]
+            assert len(generate(force=True)) == 4
+            assert not [f for f in os.listdir(os.path.dirname(rendered[0])) if f.endswith('.tmp')]
+            # The files get the permissions of normally written files, not those of temporary files.
+            umask = os.umask(0o022)
+            try:
+                os.remove(rendered[0])
+                generate()
+                assert stat.S_IMODE(os.stat(rendered[0]).st_mode) == 0o644
+                os.chmod(rendered[0], 0o664)
+                generate(force=True)
+                assert stat.S_IMODE(os.stat(rendered[0]).st_mode) == 0o664
+            finally:
+                os.umask(umask)
+            # The compiled templates are kept in a flat cache directory.
+            module_dir = os.path.join(homedir, 'build', '.mako_modules')
+            assert sorted(os.listdir(module_dir)) == \
+                   ['client.html.py', 'client.py.py', 'data_model.py.py', 'server.py.py']
+
+    @test
+    def circular_reference():
+        spec_text = '\n'.join(['from typing import Self',
+                               'from model_definition import ModelDefinition, XRef, hidden',
+                               'md = ModelDefinition()',
+                               '@md.ModelRoot',
+                               'class Root:',
+                               '    pass',
+                               '@md.Entity()',
+                               'class First:',
+                               "    parent: XRef('children', Root, hidden)",
+                               "    other: XRef('firsts', 'Second', hidden)",
+                               '@md.Entity()',
+                               'class Second:',
+                               "    parent: XRef('children', Root, hidden)",
+                               "    other: XRef('seconds', First, hidden)",
+                               ''])
+        with tempfile.TemporaryDirectory() as homedir:
+            spec = os.path.join(homedir, 'circular_spec.py')
+            with open(spec, 'w') as f:
+                f.write(spec_text)
+            try:
+                gen.Generator.load_from_config(gen.Configuration(spec, homedir=homedir))
+                assert False, 'The circular reference was not detected'
+            except RuntimeError as e:
+                # The error names the classes in the cycle.
+                assert str(e).endswith(('First -> Second -> First', 'Second -> First -> Second')), str(e)
+
+    @test
+    def batch_generation():
+        with tempfile.TemporaryDirectory() as homedir:
+            spec = os.path.join(homedir, 'sysml_spec.py')
+            shutil.copy(TEST_SPEC, spec)
+            broken = os.path.join(homedir, 'broken_spec.py')
+            with open(broken, 'w') as f:
+                f.write('raise ValueError("Not a specification")\n')
+            configs = [gen.Configuration(s, homedir=homedir) for s in [spec, broken]]
+            good, bad = gen.generate_tools(configs, jobs=2)
+            assert len(good.rendered) == 4 and not good.error
+            assert all(good.times[s] > 0 for s in ['load', 'analyse', 'render', 'write'])
+            assert not bad.rendered and 'Not a specification' in bad.error
+            # Both models share the server directory, but each has its own manifest.
+            assert sorted(f for f in os.listdir(os.path.join(homedir, 'build')) if f.endswith('.json')) == \
+                   ['.sysml_generated.json']
+            # The exit status reports the failure.
+            assert gen.main([spec, '--jobs', '1', '--homedir', homedir]) == 0
+            assert gen.main([spec, broken, '--homedir', homedir]) == 1
+
+    @test
+    def watch_files():
+        from run_project import FileWatcher
+        with tempfile.TemporaryDirectory() as homedir:
+            first, second = os.path.join(homedir, 'first.py'), os.path.join(homedir, 'second.py')
+            with open(first, 'w') as f:
+                f.write('a = 1\n')
+            watcher = FileWatcher([os.path.join(homedir, '*.py')])
+            assert watcher.changes() == set()
+            with open(first, 'a') as f:
+                f.write('b = 2\n')
+            os.utime(first, ns=(0, 1))
+            shutil.copy(first, second)
+            assert watcher.changes() == {first, second}
+            os.remove(second)
+            assert watcher.changes() == {second}
+            assert watcher.changes() == set()
+
+    @test
+    def watch_uses_current_generator():
+        import run_project
+        with tempfile.TemporaryDirectory() as homedir:
+            spec = os.path.join(homedir, 'sysml_spec.py')
+            shutil.copy(TEST_SPEC, spec)
+            config = run_project.generate_tool.Configuration(spec, homedir=homedir)
+            # The generator imported by the watcher is out of date: here it generates nothing.
+            targets = run_project.generate_tool.targets
+            run_project.generate_tool.targets = []
+            try:
+                assert run_project.generate_in_subprocess(config)
+            finally:
+                run_project.generate_tool.targets = targets
+            # The tool was generated with the generator as it is on disk.
+            assert sorted(os.listdir(os.path.join(homedir, 'build'))) == \
+                   ['.mako_modules', '.sysml_generated.json', 'sysml_data.py', 'sysml_run.py']
+            # Errors in the generator are reported, not raised.
+            with open(spec, 'a') as f:
+                f.write('raise ValueError("Not a specification")\n')
+            assert not run_project.generate_in_subprocess(config)
+
 
 if __name__ == '__main__':
     run_tests()
@@ -0,0 +1,72 @@
+from test_frame import prepare, test, run_tests
+
+from xml.etree import ElementTree
+import svg_builder
+from headless_render import renderDiagramSvg
+from storable_element import ReprCategory
+
+
+records = [
+    {"Id": 1, "diagram": 3, "x": 400.0, "y": 100.0, "width": 64.0, "height": 40.0, "styling": '{"blockcolor": "yellow"}',
+     "category": int(ReprCategory.block), "__classname__": "_BlockRepresentation",
+     "_entity": {"Id": 4, "name": "Test1", "__classname__": "Block"}},
+    {"Id": 2, "diagram": 3, "x": 100.0, "y": 300.0, "width": 110.0, "height": 65.0, "styling": "",
+     "category": int(ReprCategory.block), "__classname__": "_BlockRepresentation",
+     "_entity": {"Id": 5, "description": "Notes & more", "__classname__": "Note"}},
+    {"Id": 3, "diagram": 3, "x": 300.0, "y": 300.0, "width": 64.0, "height": 40.0, "styling": "",
+     "category": int(ReprCategory.block), "__classname__": "_BlockRepresentation",
+     "_entity": {"Id": 6, "name": "With ports", "__classname__": "Block"}},
+    {"Id": 51, "diagram": 3, "parent": 3, "orientation": 8, "category": int(ReprCategory.port),
+     "__classname__": "_BlockRepresentation", "_entity": {"Id": 10, "parent": 6, "__classname__": "FlowPort"}},
+    {"Id": 52, "diagram": 3, "parent": 3, "orientation": 8, "order": 1, "category": int(ReprCategory.port),
+     "__classname__": "_BlockRepresentation", "_entity": {"Id": 11, "parent": 6, "__classname__": "FlowPort"}},
+    {"Id": 4, "diagram": 3, "source_repr_id": 1, "target_repr_id": 51, "routing": "[]", "styling": {},
+     "category": int(ReprCategory.relationship), "__classname__": '_RelationshipRepresentation',
+     "_entity": {"Id": 1, "source": 4, "target": 10, "__classname__": "FlowPortConnection"}},
+    {"Id": 5, "diagram": 3, "source_repr_id": 2, "target_repr_id": 1, "routing": "[[250, 120]]", "styling": {},
+     "category": int(ReprCategory.relationship), "__classname__": '_RelationshipRepresentation',
+     "_entity": {"Id": 2, "source": 5, "target": 4, "__classname__": "Anchor"}},
+]
+styling = {'Note': {'shape': 'note'}, 'Anchor': {'endmarker': 'none', 'routing_method': 'center2center'}}
+
+
+@prepare
+def headless_render_tests():
+    ns = {'svg': 'http://www.w3.org/2000/svg'}
+
+    @test
+    def render_diagram():
+        text = renderDiagramSvg(records, styling, {'Note': 'description'})
+        root = ElementTree.fromstring(text)
+        # The image is sized to its contents, with a margin.
+        assert root.attrib['viewBox'] == '80.0 80.0 404.0 305.0'
+        blocks = root.findall('svg:g', ns)
+        assert len(blocks) == 3
+        assert blocks[0].find('svg:rect', ns).attrib['fill'] == 'yellow'
+        assert blocks[1].find('svg:polyline', ns) is not None
+        assert [t.text for t in blocks[1].findall('svg:text', ns)] == ['Notes &', 'more']
+        # The block with ports is drawn with its ports on the left side.
+        ports = blocks[2].findall('svg:rect', ns)[1:]
+        assert [(p.attrib['x'], p.attrib['y']) for p in ports] == [('295', '305'), ('295', '325')]
+
+        paths = root.findall('svg:path', ns)
+        assert len(paths) == 2
+        # Square routing to the port, a straight line through the waypoint for the anchor.
+        assert paths[0].attrib['d'] == 'M 432.0 140.0 L 432.0 225.0 L 300.5 225.0 L 300.5 310.0'
+        assert paths[1].attrib['d'].split(' L ')[1:] == ['250.0 120.0', '400.0 120.0']
+        assert paths[1].attrib['marker-end'] == "url('#none')"
+
+    @test
+    def svg_builder_elements():
+        g = svg_builder.svg.g(Class='group')
+        rect = svg_builder.svg.rect(x=1, y=2, stroke_width=3)
+        _ = g <= [rect, svg_builder.svg.text('a & b', x=5)]
+        rect['style'] = 'fill: red; stroke: none'
+        assert svg_builder.serialize(g) == ('<g class="group"><rect x="1" y="2" stroke-width="3" '
+                                            'style="fill:red;stroke:none"/><text x="5">a &amp; b</text></g>')
+        rect.remove()
+        assert len(g.children) == 1 and rect.parent is None
+
+
+if __name__ == '__main__':
+    run_tests()
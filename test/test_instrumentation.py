@@ -0,0 +1,76 @@
+from test_frame import prepare, test, run_tests, cleanup
+
+import json
+from browser import html
+from dispatcher import EventDispatcher
+from instrumentation import Profiler, profiler, profilingRequested, urlFlag
+
+
+@prepare
+def instrumentation_tests():
+    @cleanup
+    def disable_profiler():
+        profiler.enable(False)
+        profiler.reset()
+
+    @test
+    def record_timings():
+        p = Profiler()
+        @p.timed('work', 'test')
+        def work(x):
+            return 2 * x
+
+        # Nothing is recorded until profiling is enabled.
+        assert work(1) == 2
+        assert p.summary() == []
+        p.enable()
+        assert [work(i) for i in range(3)] == [0, 2, 4]
+        with p.measure('block'):
+            pass
+        rows = {(name, category): count for name, category, count, _, _ in p.summary()}
+        assert rows == {('work', 'test'): 3, ('block', 'client'): 1}
+
+        # The events are exported in the Chrome trace format.
+        trace = json.loads(p.chromeTrace())
+        assert [e['name'] for e in trace['traceEvents']][-1] == 'block'
+        assert all(e['ph'] == 'X' and e['dur'] >= 0 for e in trace['traceEvents'])
+
+        # The results are shown in an overlay, with a row for each kind of work.
+        parent = html.DIV()
+        p.showOverlay(parent)
+        assert len(parent.select('tr')) == 3
+        p.hideOverlay()
+        assert not parent.select('tr')
+
+    @test
+    def instrumented_client():
+        profiler.enable()
+        d = EventDispatcher()
+        d.subscribe('update/*', None, lambda *args: None)
+        d.trigger_event('update/Block/1', None)
+        d.trigger_event('update/Block/2', None)
+        assert [r[:3] for r in profiler.summary()] == [('event update', 'events', 2)]
+
+    @test
+    def disabled_profiler():
+        # While disabled, all measurements share a context that records nothing.
+        p = Profiler()
+        assert p.measure('a') is p.measure('b')
+        with p.measure('a'):
+            pass
+        assert p.summary() == []
+
+    @test
+    def profiling_parameter():
+        assert profilingRequested('?profile')
+        assert profilingRequested('?diagram=3&profile=1')
+        assert not profilingRequested('')
+        assert not profilingRequested('?userprofile=1')
+        assert not profilingRequested('?profile=0')
+        # Other options of the client are switched on in the same way.
+        assert urlFlag('symbols', '?profile&symbols')
+        assert not urlFlag('symbols', '?profile')
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -0,0 +1,42 @@
+from test_frame import prepare, test, run_tests
+
+from point import Point, flatten, unflatten, translate, bounding_box, nearest_segment
+
+
+@prepare
+def point_tests():
+    @test
+    def flat_coordinates():
+        points = [Point(1, 2), Point(3, 4), Point(-5, 6)]
+        coords = flatten(points)
+        assert coords == [1, 2, 3, 4, -5, 6]
+        assert unflatten(coords) == points
+        assert flatten([]) == [] and unflatten([]) == []
+
+        # Translating changes the list itself, not the points it was made from.
+        assert translate(coords, 10, -1) is coords
+        assert coords == [11, 1, 13, 3, 5, 5]
+        assert points[0] == Point(1, 2)
+        assert bounding_box(coords) == (5, 1, 13, 5)
+        assert bounding_box([7, 8]) == (7, 8, 7, 8)
+
+    @test
+    def nearest_line_segment():
+        # A line with segments to the right, down and to the left.
+        coords = flatten([Point(0, 0), Point(100, 0), Point(100, 100), Point(0, 100)])
+        assert nearest_segment(coords, 50, 10) == 0
+        assert nearest_segment(coords, 90, 50) == 1
+        assert nearest_segment(coords, 50, 80) == 2
+        # Points that lie alongside two segments are nearest to the closest one.
+        assert nearest_segment(coords, 95, 10) == 1
+        assert nearest_segment(coords, 50, 45) == 0
+        # Points beyond the ends of all segments are not near any of them.
+        assert nearest_segment(coords, -10, -10) == -1
+        assert nearest_segment(flatten([Point(0, 0), Point(100, 0)]), 150, 0) == -1
+        # Without segments, there is nothing to be near to.
+        assert nearest_segment(flatten([Point(0, 0)]), 0, 0) == -1
+        assert nearest_segment([], 0, 0) == -1
+
+
+if __name__ == '__main__':
+    run_tests()
@@ -1,8 +1,22 @@
 
 
 from square_routing import *
+from orthogonal_routing import ObstacleGraph
+import batch_routing
+from batch_routing import routeAll
 from test_frame import prepare, test, run_tests
 
+from browser import svg
+from diagrams import Diagram, DiagramConfiguration
+from shapes import Shape, Relationship, route_cache_stats
+from data_store import ReprCategory
+
+
+class RoutedBlock(Shape):
+    @classmethod
+    def repr_category(cls) -> ReprCategory:
+        return ReprCategory.block
+
 @prepare
 def routing_tests():
     @test
@@ -64,6 +78,141 @@ def routing_tests():
         e = mkPoints((200,420), (570,420), (570,100), (350,100), (350,80))
         r = routeSquare(mkPoints((100,400), (100,40)), mkPoints((300,40),(100,40)), mkPoints((570, inf), (inf,100)))
         assert e==r, f"Asser error: {r} is not as expected {e}"
+    @test
+    def testObstacleRouter():
+        def mkPoints(*args):
+            return [Point(x=x, y=y) for x, y in args]
+
+        a, b, c = (0, 0, 100, 40), (400, 0, 100, 40), (200, -50, 60, 200)
+        graph = ObstacleGraph(margin=10)
+        graph.update([('a', a), ('b', b)])
+
+        # Without obstacles, the line is straight.
+        e = mkPoints((100, 20), (400, 20))
+        r = graph.route(1, a, b)
+        assert e == r, f"Asser error: {r} is not as expected {e}"
+
+        # Adding an obstacle in between causes a detour over it.
+        graph.update([('a', a), ('b', b), ('c', c)])
+        e = mkPoints((100, 20), (190, 20), (190, -60), (390, -60), (390, 20), (400, 20))
+        r = graph.route(1, a, b)
+        assert e == r, f"Asser error: {r} is not as expected {e}"
+        assert graph.stats['misses'] == 2
+
+        # Moving a block outside the corridor keeps the cached route.
+        graph.update([('a', a), ('b', b), ('c', c), ('d', (1000, 1000, 50, 50))])
+        r = graph.route(1, a, b)
+        assert e == r, f"Asser error: {r} is not as expected {e}"
+        assert graph.stats['hits'] == 1
+
+        # Moving the obstacle out of the way causes the route to be recalculated.
+        graph.update([('a', a), ('b', b), ('c', (200, 300, 60, 40))])
+        e = mkPoints((100, 20), (400, 20))
+        r = graph.route(1, a, b)
+        assert e == r, f"Asser error: {r} is not as expected {e}"
+        assert graph.stats['misses'] == 3
+
+        # When the blocks are enclosed, the normal square route is used.
+        walls = [('n', (-100, -100, 700, 40)), ('s', (-100, 100, 700, 40)),
+                 ('w', (-100, -100, 40, 240)), ('e', (560, -100, 40, 240)), ('c', c)]
+        graph.update([('a', a), ('b', b)] + walls)
+        r = graph.route(1, a, b)
+        e = routeSquare(mkPoints((0, 0), (100, 40)), mkPoints((400, 0), (100, 40)), [])
+        assert e == r, f"Asser error: {r} is not as expected {e}"
+
+    @test
+    def testBatchRouter():
+        blocks = [(0, 0, 100, 40), (300, 0, 100, 40), (0, 200, 100, 40), (400, 150, 100, 40), (200, -50, 60, 200)]
+        connections = [(0, 1), (0, 2), (0, 3)]
+
+        # Straight lines between the outlines of the blocks.
+        e = [[(100, 20), (300, 20)], [(50, 40), (50, 200)], [(100, 38.75), (400, 151.25)]]
+        r = routeAll(blocks, connections, 'center2center')
+        assert e == r, f"Asser error: {r} is not as expected {e}"
+        # The results are the same without numpy, and the same as when routing connections one by one.
+        numpy, batch_routing.np = batch_routing.np, None
+        try:
+            r = routeAll(blocks, connections, 'center2center')
+        finally:
+            batch_routing.np = numpy
+        assert e == r, f"Asser error: {r} is not as expected {e}"
+        if numpy is not None:
+            r = routeAll(numpy.array(blocks), numpy.array(connections), 'center2center')
+            assert e == r, f"Asser error: {r} is not as expected {e}"
+
+        # Square routing, with a waypoint for the second connection.
+        e = [[(100, 20), (300, 20)], [(100, 20), (150, 20), (150, 220), (100, 220)],
+             [(100, 20), (250, 20), (250, 170), (400, 170)]]
+        r = routeAll(blocks, connections, 'square', [[], [Point(150, inf)], []])
+        assert e == r, f"Asser error: {r} is not as expected {e}"
+
+        # Routing around the blocks.
+        e = [[(100, 20), (190, 20), (190, -60), (290, -60), (290, 20), (300, 20)], [(50, 40), (50, 200)]]
+        r = routeAll(blocks, connections[:2], 'orthogonal')
+        assert e == r, f"Asser error: {r} is not as expected {e}"
+
+    @test
+    def route_cache():
+        diagram = Diagram(DiagramConfiguration({}, {}), [])
+        diagram.canvas = svg.svg()
+        a, b, c = [RoutedBlock(x=100 + 200*i, y=100, width=64, height=40) for i in range(3)]
+        ab, bc = Relationship(start=a, finish=b), Relationship(start=b, finish=c)
+        diagram.viewport.load([a, b, c], [ab, bc])
+        diagram.viewport.update()
+        path = ab.path['d']
+        route_cache_stats.reset()
+
+        # Re-routing without a change in geometry re-uses the route.
+        diagram.rerouteConnections(b)
+        assert route_cache_stats.reset() == (2, 0)
+        # Moving a block only re-routes the connection to it.
+        c.setPos(Point(500, 150))
+        diagram.rerouteConnections(b)
+        assert route_cache_stats.reset() == (1, 1)
+        assert ab.path['d'] == path
+        # Changing a waypoint or the routing method also changes the route.
+        ab.waypoints.append(Point(250, 300))
+        ab.styling['routing_method'] = 'center2center'
+        diagram.rerouteConnections(ab)
+        assert route_cache_stats.reset() == (0, 1)
+        assert ab.path['d'] != path
+        # Routes that avoid other blocks are always re-calculated.
+        ab.styling['routing_method'] = 'orthogonal'
+        ab.waypoints.clear()
+        diagram.rerouteConnections(ab)
+        diagram.rerouteConnections(ab)
+        assert route_cache_stats.reset() == (0, 2)
+
+    @test
+    def obstacle_graph_follows_diagram():
+        diagram = Diagram(DiagramConfiguration({}, {}), [])
+        diagram.canvas = svg.svg()
+        a, b, c = [RoutedBlock(x=100 + 200*i, y=100, width=64, height=40) for i in range(3)]
+        ab = Relationship(start=a, finish=c, styling={'routing_method': 'orthogonal'})
+        diagram.viewport.load([a, b, c], [ab])
+        diagram.viewport.update()
+        graph = diagram.obstacle_graph
+        assert set(graph.obstacles) == {id(a), id(b), id(c)}
+        # Routing does not synchronise the graph with all blocks, the diagram keeps it up to date.
+        synchronise, graph.update = graph.update, None
+        try:
+            diagram.rerouteConnections(ab)
+            assert graph.stats['hits'] == 1
+            # Moving the block in between invalidates the route.
+            b.setPos(Point(300, 300))
+            assert graph.obstacles[id(b)].rect == (300, 300, 64, 40)
+            diagram.rerouteConnections(ab)
+            assert graph.stats['misses'] == 2
+            assert len(ab.points) == 2
+            # New and removed blocks are added to and removed from the graph.
+            d = RoutedBlock(x=300, y=100, width=64, height=40)
+            diagram.addBlock(d)
+            assert id(d) in graph.obstacles
+            diagram.deleteBlock(d)
+            assert id(d) not in graph.obstacles
+        finally:
+            graph.update = synchronise
+
 
 if __name__ == '__main__':
     run_tests()
\ No newline at end of file
@@ -0,0 +1,87 @@
+from test_frame import prepare, test, run_tests, cleanup
+
+from dataclasses import dataclass
+from browser import window
+from point import Point
+from frame_scheduler import FrameScheduler
+
+
+@dataclass
+class Block:
+    x: float = 0
+    y: float = 0
+    moves: int = 0
+
+    def setPos(self, pos):
+        self.x, self.y = pos.astuple()
+        self.moves += 1
+
+
+@dataclass
+class Connection:
+    start: Block
+    finish: Block
+    reroutes: int = 0
+
+
+class CountingDiagram:
+    def __init__(self, connections):
+        self.connections = connections
+
+    def getConnectionsToShape(self, widget):
+        return [c for c in self.connections if widget is c.start or widget is c.finish]
+
+    def rerouteConnections(self, connection):
+        connection.reroutes += 1
+
+
+@prepare
+def frame_scheduler_tests():
+    frames = []
+    window.requestAnimationFrame = frames.append
+
+    @cleanup
+    def remove_animation_frames():
+        del window.requestAnimationFrame
+
+    @test
+    def coalesce_moves():
+        frames.clear()
+        a, b, c = Block(), Block(), Block()
+        ab, bc = Connection(a, b), Connection(b, c)
+        scheduler = FrameScheduler(CountingDiagram([ab, bc]))
+        # Drag a and b together for a number of mouse-move events.
+        for i in range(10):
+            scheduler.moveBlock(a, Point(i, i))
+            scheduler.moveBlock(b, Point(100+i, i))
+        # Nothing is done until the frame is drawn.
+        assert len(frames) == 1
+        assert a.moves == 0 and ab.reroutes == 0
+        frames.pop()()
+        assert (a.x, a.y, a.moves) == (9, 9, 1)
+        assert (b.x, b.y, b.moves) == (109, 9, 1)
+        # The connection between a and b is re-routed only once.
+        assert ab.reroutes == 1
+        assert bc.reroutes == 1
+        assert not frames
+
+    @test
+    def explicit_flush():
+        frames.clear()
+        a, b = Block(), Block()
+        ab = Connection(a, b)
+        scheduler = FrameScheduler(CountingDiagram([ab]))
+        scheduler.rerouteConnection(ab)
+        scheduler.rerouteShape(a)
+        scheduler.flush()
+        assert ab.reroutes == 1
+        # The frame that was requested has nothing left to do.
+        frames.pop()()
+        assert ab.reroutes == 1
+        # A new change requests a new frame.
+        scheduler.moveBlock(b, Point(5, 5))
+        assert len(frames) == 1
+
+
+if __name__ == '__main__':
+    run_tests()
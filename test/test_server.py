@@ -200,6 +200,37 @@ def test_server():
         record = json.loads(r.content)
         assert record['styling'] == {'color':'aabbcc', 'text_offset': 12}
 
+    @test
+    def test_bulk_update():
+        """ Several representations are updated with a single request. """
+        headers = {'Content-Type': 'application/json'}
+        r = requests.post(f'{base_url}/data/Note', data=json.dumps(dict(__classname__='Note', description='Lane')),
+                          headers=headers)
+        nid = json.loads(r.content)['Id']
+        r = requests.post(f'{base_url}/data/BlockDefinitionDiagram',
+                          data=json.dumps(dict(__classname__='BlockDefinitionDiagram', name='lanes')), headers=headers)
+        did = json.loads(r.content)['Id']
+        rurl = f'{base_url}/data/_BlockRepresentation'
+        rids = []
+        for x in [100, 200, 300]:
+            r = requests.post(rurl, data=json.dumps(dict(__classname__='_BlockRepresentation', diagram=did, block=nid,
+                                                         x=x, order=x // 100)), headers=headers)
+            rids.append(json.loads(r.content)['Id'])
+
+        # Swap the first two lanes.
+        r = requests.post(rurl + '/bulk', data=json.dumps([dict(Id=rids[0], x=200, order=2),
+                                                           dict(Id=rids[1], x=100, order=1)]), headers=headers)
+        assert r.status_code == 202
+        assert [(d['Id'], d['x']) for d in json.loads(r.content)] == [(rids[0], 200), (rids[1], 100)]
+        positions = [json.loads(requests.get(f'{rurl}/{rid}').content)['x'] for rid in rids]
+        assert positions == [200, 100, 300]
+
+        # Nothing is changed when one of the records does not exist.
+        r = requests.post(rurl + '/bulk', data=json.dumps([dict(Id=rids[2], x=500), dict(Id=123456, x=0)]),
+                          headers=headers)
+        assert r.status_code == 404
+        assert json.loads(requests.get(f'{rurl}/{rids[2]}').content)['x'] == 300
+
     @test
     def test_diagram_contents():
         from data_store import DataStore, Collection
@@ -2,8 +2,13 @@
 
 from test_frame import prepare, test, run_tests, expect_exception
 
+import math
 import shapes
-from svg_shapes import wrapText, getTextWidth, pyphen
+from point import Point
+from svg_shapes import (wrapText, getTextWidth, pyphen, text_layout_cache, clearTextCache, BasicShape, Bar, Cloud,
+                        Circle, PathTemplate, shape_registry, symbol_cache, getSymbolDefinitions, path_origin,
+                        path_ending)
+from path_geometry import CompiledPath
 
 @prepare
 def test_text_rendering():
@@ -22,6 +27,20 @@ def test_text_rendering():
             result = wrapText(txts[0], w)
             assert '\n'.join(result) == e, f"Not the same for width {w}: {repr(chr(10).join(result))}, {e}"
 
+    @test
+    def layout_cache():
+        clearTextCache()
+        lines = wrapText("Dit is een testtekst", 50)
+        assert (text_layout_cache.hits, text_layout_cache.misses) == (0, 1)
+        # Changing the result does not change the cached layout.
+        lines.append('extra')
+        assert wrapText("Dit is een testtekst", 50) == lines[:-1]
+        assert (text_layout_cache.hits, text_layout_cache.misses) == (1, 1)
+        # A different width or font size is laid out again.
+        wrapText("Dit is een testtekst", 84)
+        wrapText("Dit is een testtekst", 50, fontsize='12')
+        assert (text_layout_cache.hits, text_layout_cache.misses) == (1, 3)
+
 @prepare
 def test_styling():
 
@@ -48,5 +67,101 @@ def test_styling():
         assert item.getStyle('color') == 'yellow'
         assert item.getStyle('stroke') == 'black'
 
+    @test
+    def shape_types():
+        assert BasicShape.getDescriptor('Cloud') is Cloud
+        assert Bar in BasicShape.getShapeTypes()
+        with expect_exception(RuntimeError):
+            BasicShape.getDescriptor('no_such_shape')
+        # The defaults of a shape include those of its bases, and can be overridden.
+        assert Bar.getDefaultStyle() == {'bordercolor': '#000000', 'bordersize': '2', 'blockcolor': 'black',
+                                         'cornerradius': '0'}
+        item = TestShape()
+        item.styling['blockcolor'] = 'red'
+        assert [Bar.getStyle(k, item) for k in ['blockcolor', 'cornerradius']] == ['red', '0']
+
+        # Paths are scaled to the size of a shape.
+        path = PathTemplate('M 10,10 l 10,0 v 20 Z')
+        assert path.path.template == 'M {},{} L {},{} L {},{} Z'
+        assert path.render(100, 50, 20, 10) == 'M 100.0,50.0 L 120.0,50.0 L 120.0,60.0 Z'
+
+        # The text widget is defined once for each attribute it shows, so the registry does not grow.
+        assert shapes.Text('name').text_attr == 'name'
+        types = dict(shape_registry.types)
+        assert shapes.Text('name') is shapes.Text('name')
+        assert shapes.Text('text') is shapes.TextWidget
+        assert shape_registry.types == types
+
+    @test
+    def path_geometry():
+        # Relative, horizontal, vertical and smooth commands are compiled to absolute co-ordinates.
+        path = CompiledPath('m 10,10 20,0 h 10 V 30 s 10,10 20,0 z M 5 5 L 6 6')
+        assert path.commands == 'MLLLCZML'
+        assert path.values == [10, 10, 30, 10, 40, 10, 40, 30, 40, 30, 50, 40, 60, 30, 5, 5, 6, 6]
+        assert path.bounds() == (5, 5, 60, 30)
+        assert path.origin() == (Point(10, 10), 0.0)
+        assert path.ending() == (Point(6, 6), math.atan2(-1, -1))
+        # Drawing the path re-uses its buffer.
+        buffer = path.transform(2, 1, 0, 5)
+        assert buffer is path.buffer and buffer[:4] == [20, 15, 60, 15]
+        assert path.render(1, 1, 1, 1).startswith('M 11.0,11.0 L 31.0,11.0 ')
+        with expect_exception(ValueError):
+            CompiledPath('M 0,0 A 5 5 0 0 1 10 10')
+
+        # Messages are placed at the start or the end of a connection.
+        assert path_origin('M 0 0 L 0 10') == (Point(0, 0), math.pi/2)
+        assert path_ending('M 0 0 l 0 10 h 10') == (Point(10, 10), math.pi)
+        # A closed path ends where it started, coming from its last explicit point.
+        assert CompiledPath('M 0 0 L 10 0 L 10 10 Z').ending() == (Point(0, 0), math.atan2(10, 10))
+        assert CompiledPath('M 0 0 L 10 0 Z').origin() == (Point(0, 0), 0.0)
+        # A path with a single point has no direction.
+        assert CompiledPath('M 5 5').origin() == (Point(5, 5), 0.0)
+        assert CompiledPath('M 5 5').ending() == (Point(5, 5), 0.0)
+        assert path_ending('M 5 5 Z') == (Point(5, 5), 0.0)
+
+    @test
+    def circle_resize():
+        from render_state import RenderState
+        # A circle is created with a radius that differs from the one it is updated with.
+        item = TestShape()
+        state = RenderState()
+        outline = Circle.getShape(item)
+        Circle.updateShape(state.prime('outline', outline), item)
+        assert outline['r'] == str((120 + 64) // 4)
+        # Resizing without changing the radius leaves it as it is, other changes update it.
+        item.width, item.height = 64, 120
+        Circle.updateShape(state.element('outline', outline), item)
+        assert outline['r'] == str((120 + 64) // 4)
+        item.width = 100
+        Circle.updateShape(state.element('outline', outline), item)
+        assert outline['r'] == str((100 + 120) // 4)
+
+    @test
+    def symbol_rendering():
+        item = TestShape()
+        item.styling['blockcolor'] = 'red'
+        shape_registry.use_symbols = True
+        try:
+            # Scalable shapes are drawn as a reference to their symbol, other shapes are drawn as before.
+            cloud = BasicShape.getDescriptor('cloud')
+            assert issubclass(cloud, Cloud) and cloud.getType() == 'cloud'
+            shape = cloud.getShape(item)
+            assert type(shape).__name__ == 'use'
+            assert shape['href'] == '#shape-cloud' and shape['fill'] == 'red'
+            assert (shape['x'], shape['width']) == ('100', '120')
+            assert type(BasicShape.getDescriptor('rect').getShape(item)).__name__ == 'rect'
+        finally:
+            shape_registry.use_symbols = False
+        assert BasicShape.getDescriptor('cloud') is Cloud
+
+        defs = getSymbolDefinitions()
+        ids = [s.attrs.get('id') for s in defs.children]
+        assert 'shape-cloud' in ids and 'shape-rect' not in ids
+        # The symbols shared by blocks are added when they are used.
+        assert defs.children[-1] is symbol_cache.defs
+        # The colours are taken from the use element.
+        outline = defs.children[ids.index('shape-cloud')].children[0]
+        assert outline['fill'] == 'inherit'
+
 if __name__ == '__main__':
     run_tests('*.wrapping')
@@ -0,0 +1,59 @@
+from test_frame import prepare, test, run_tests
+
+from dataclasses import dataclass
+from point import Point
+from spatial_index import SpatialIndex
+
+
+@dataclass
+class Box:
+    x: float = 0
+    y: float = 0
+    width: float = 10
+    height: float = 10
+
+
+@prepare
+def spatial_index_tests():
+    @test
+    def query_area_and_point():
+        index = SpatialIndex(cell_size=50)
+        a, b, c = Box(0, 0), Box(100, 100, 200, 20), Box(1000, 1000)
+        for box in [a, b, c]:
+            index.add(box)
+        assert len(index) == 3
+        assert index.query(-5, -5, 150, 150) == [a, b]
+        assert index.queryPoint(Point(250, 110)) == [b]
+        assert index.queryPoint(Point(500, 500)) == []
+        # Equal boxes are different items
+        d = Box(0, 0)
+        index.add(d)
+        assert index.queryPoint(Point(5, 5)) == [a, d]
+
+    @test
+    def update_and_remove():
+        index = SpatialIndex(cell_size=50)
+        a, b = Box(0, 0), Box(20, 20)
+        index.add(a)
+        index.add(b)
+        a.x, a.y = 500, 500
+        assert index.queryPoint(Point(505, 505)) == []
+        index.update(a)
+        assert index.queryPoint(Point(505, 505)) == [a]
+        assert index.queryPoint(Point(5, 5)) == []
+        # Items keep their original order after moving
+        b.x, b.y = 505, 505
+        index.update(b)
+        assert index.queryPoint(Point(508, 508)) == [a, b]
+        index.remove(a)
+        assert a not in index
+        assert index.queryPoint(Point(508, 508)) == [b]
+        # Updating or removing an unknown item is ignored
+        index.update(a)
+        index.remove(a)
+        assert len(index) == 1
+        assert list(index.cells) == [(10, 10)]
+
+
+if __name__ == '__main__':
+    run_tests()
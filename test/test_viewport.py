@@ -0,0 +1,92 @@
+from test_frame import prepare, test, run_tests
+
+from browser import svg
+from diagrams import Diagram, DiagramConfiguration
+from point import Point
+from shapes import Shape, Relationship
+from data_store import ReprCategory
+
+
+class Block(Shape):
+    @classmethod
+    def repr_category(cls) -> ReprCategory:
+        return ReprCategory.block
+
+
+def mk_diagram(viewbox='0 0 1000 800', client_width=1000):
+    diagram = Diagram(DiagramConfiguration({}, {}), [])
+    diagram.canvas = svg.svg()
+    diagram.canvas.attrs['viewBox'] = viewbox
+    diagram.canvas.clientWidth = client_width
+    # A row of blocks, far beyond the visible area, each connected to the next.
+    blocks = [Block(x=100 + 500*i, y=100, width=64, height=40) for i in range(20)]
+    connections = [Relationship(start=a, finish=b) for a, b in zip(blocks[:-1], blocks[1:])]
+    diagram.viewport.load(blocks, connections)
+    diagram.viewport.update()
+    return diagram, blocks, connections
+
+
+@prepare
+def viewport_tests():
+    @test
+    def only_visible_elements_are_drawn():
+        diagram, blocks, connections = mk_diagram()
+        # All elements are part of the diagram.
+        assert len(diagram.children) == 20 and len(diagram.connections) == 19
+        # Blocks 0 to 2 are (partly) in view, block 3 is drawn for the connection from block 2.
+        assert [b.shape is not None for b in blocks[:5]] == [True, True, True, True, False]
+        assert [c.path is not None for c in connections[:4]] == [True, True, True, False]
+        # Each connection consists of a visible path and a wider one for selecting it.
+        assert len(diagram.canvas.select('path')) == 3 * 2
+
+        # Moving a hidden block does not fail, and it is drawn when it is scrolled into view.
+        blocks[10].setPos(blocks[10].getPos())
+        diagram.rerouteConnections(blocks[10])
+        diagram.canvas.attrs['viewBox'] = '4800 0 1000 800'
+        diagram.viewport.update()
+        assert [b.shape is not None for b in blocks[7:14]] == [False, True, True, True, True, True, False]
+        assert [c.path is not None for c in connections[7:13]] == [False, True, True, True, True, False]
+
+        # Hidden elements can be deleted.
+        diagram.deleteBlock(blocks[15])
+        assert not diagram.viewport.isDeferred(blocks[15])
+        assert len(diagram.connections) == 17
+
+    @test
+    def placeholders_when_zoomed_out():
+        # At 20 diagram units per pixel, the blocks are drawn as placeholders without text or ports.
+        diagram, blocks, connections = mk_diagram(viewbox='0 0 20000 16000')
+        assert len(diagram.canvas.select('.placeholder')) == 20
+        assert not any(b.shape for b in blocks) and not any(c.path for c in connections)
+        # Placeholders follow the block.
+        blocks[5].setPos(blocks[5].getPos() + Point(10, 20))
+        placeholder = diagram.viewport.placeholders[id(blocks[5])]
+        assert (placeholder.attrs['x'], placeholder.attrs['y']) == (2610, 120)
+
+        # Zooming in replaces the placeholders of blocks 0 to 8 by the actual blocks, and also draws block 9.
+        diagram.canvas.attrs['viewBox'] = '0 0 4000 3200'
+        diagram.viewport.update()
+        assert len(diagram.canvas.select('.placeholder')) == 10
+        assert [b.shape is not None for b in blocks[8:11]] == [True, True, False]
+
+        # Zooming out again swaps the blocks that are drawn for placeholders, their connections remain.
+        diagram.canvas.attrs['viewBox'] = '0 0 20000 16000'
+        diagram.viewport.update()
+        assert len(diagram.canvas.select('.placeholder')) == 20
+        assert all(b.shape.style['display'] == 'none' for b in blocks[:10])
+        assert [c.path is not None for c in connections[8:10]] == [True, False]
+        # Blocks that are shown while zoomed out, e.g. the ends of a connection, are also low-detail.
+        diagram.viewport.show(blocks[10])
+        diagram.viewport.update()
+        assert blocks[10].shape.style['display'] == 'none' and connections[9].path is not None
+        assert len(diagram.canvas.select('.placeholder')) == 20
+
+        # Zooming in restores the blocks.
+        diagram.canvas.attrs['viewBox'] = '0 0 4000 3200'
+        diagram.viewport.update()
+        assert len(diagram.canvas.select('.placeholder')) == 9
+        assert not any(b.shape.style['display'] for b in blocks[:11])
+
+
+if __name__ == '__main__':
+    run_tests()